@@ -0,0 +1,33 @@
+"""add hash_stats
+
+Revision ID: 5d8f3b6e21c7
+Revises: c4e1a7d2b9f0
+Create Date: 2026-10-19 00:12:40.581902
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5d8f3b6e21c7'
+down_revision: Union[str, None] = 'c4e1a7d2b9f0'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('hash_stats',
+    sa.Column('hash', sa.String(length=16), nullable=False),
+    sa.Column('track_count', sa.Integer(), nullable=False),
+    sa.Column('total_count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('hash')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('hash_stats')
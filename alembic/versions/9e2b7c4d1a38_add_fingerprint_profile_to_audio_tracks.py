@@ -0,0 +1,29 @@
+"""add fingerprint_profile to audio_tracks
+
+Revision ID: 9e2b7c4d1a38
+Revises: 5d8f3b6e21c7
+Create Date: 2026-10-19 09:41:17.203518
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9e2b7c4d1a38'
+down_revision: Union[str, None] = '5d8f3b6e21c7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Существующие дорожки проиндексированы историческими параметрами (профиль 1)
+    op.add_column('audio_tracks', sa.Column('fingerprint_profile', sa.Integer(), server_default='1', nullable=False))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('audio_tracks', 'fingerprint_profile')
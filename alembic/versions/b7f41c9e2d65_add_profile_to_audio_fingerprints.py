@@ -0,0 +1,40 @@
+"""add profile to audio_fingerprints
+
+Revision ID: b7f41c9e2d65
+Revises: 9e2b7c4d1a38
+Create Date: 2026-10-19 11:05:52.917340
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7f41c9e2d65'
+down_revision: Union[str, None] = '9e2b7c4d1a38'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('audio_fingerprints', sa.Column('profile', sa.Integer(), server_default='1', nullable=False))
+    # Отпечатки дорожек, проиндексированных после появления профилей, получают версию дорожки
+    op.execute(
+        "UPDATE audio_fingerprints SET profile = ("
+        "SELECT fingerprint_profile FROM audio_tracks WHERE audio_tracks.id = audio_fingerprints.audio_track_id"
+        ") WHERE audio_track_id IN (SELECT id FROM audio_tracks WHERE fingerprint_profile <> 1)"
+    )
+    # Новый индекс создаётся до удаления старого: внешнему ключу нужен индекс по audio_track_id
+    op.create_index('ix_audio_fingerprints_track_profile_hash', 'audio_fingerprints',
+                    ['audio_track_id', 'profile', 'hash'], unique=False)
+    op.drop_index('ix_audio_fingerprints_track_hash', table_name='audio_fingerprints')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.create_index('ix_audio_fingerprints_track_hash', 'audio_fingerprints', ['audio_track_id', 'hash'], unique=False)
+    op.drop_index('ix_audio_fingerprints_track_profile_hash', table_name='audio_fingerprints')
+    op.drop_column('audio_fingerprints', 'profile')
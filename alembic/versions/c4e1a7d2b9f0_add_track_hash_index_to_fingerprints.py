@@ -0,0 +1,28 @@
+"""add (audio_track_id, hash) index to audio_fingerprints
+
+Revision ID: c4e1a7d2b9f0
+Revises: 3753faa57581
+Create Date: 2026-10-18 23:55:12.104233
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c4e1a7d2b9f0'
+down_revision: Union[str, None] = '3753faa57581'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_audio_fingerprints_track_hash', 'audio_fingerprints', ['audio_track_id', 'hash'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_audio_fingerprints_track_hash', table_name='audio_fingerprints')
@@ -0,0 +1,29 @@
+"""add track offset index to audio_fingerprints
+
+Revision ID: d2a6c8e4f1b3
+Revises: b7f41c9e2d65
+Create Date: 2026-10-19 14:22:07.481126
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd2a6c8e4f1b3'
+down_revision: Union[str, None] = 'b7f41c9e2d65'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_audio_fingerprints_track_profile_offset', 'audio_fingerprints',
+                    ['audio_track_id', 'profile', 'offset'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_audio_fingerprints_track_profile_offset', table_name='audio_fingerprints')
@@ -0,0 +1,72 @@
+"""scope hash_stats by profile, add hash_stat_totals and pruned_hashes
+
+Revision ID: e8b3f5a1c2d7
+Revises: d2a6c8e4f1b3
+Create Date: 2026-10-19 18:41:26.903517
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e8b3f5a1c2d7'
+down_revision: Union[str, None] = 'd2a6c8e4f1b3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.drop_table('hash_stats')
+    op.create_table('hash_stats',
+    sa.Column('profile', sa.Integer(), nullable=False),
+    sa.Column('hash', sa.String(length=16), nullable=False),
+    sa.Column('track_count', sa.Integer(), nullable=False),
+    sa.Column('total_count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('profile', 'hash')
+    )
+    op.create_table('hash_stat_totals',
+    sa.Column('profile', sa.Integer(), nullable=False),
+    sa.Column('track_count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('profile')
+    )
+    op.create_table('pruned_hashes',
+    sa.Column('audio_track_id', sa.Integer(), nullable=False),
+    sa.Column('profile', sa.Integer(), nullable=False),
+    sa.Column('hash', sa.String(length=16), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['audio_track_id'], ['audio_tracks.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('audio_track_id', 'profile', 'hash')
+    )
+    # Отсечённые раньше хеши не сохранялись: статистика пересобирается по записанным отпечаткам
+    op.execute(
+        "INSERT INTO hash_stats (profile, hash, track_count, total_count) "
+        "SELECT profile, hash, COUNT(DISTINCT audio_track_id), COUNT(*) "
+        "FROM audio_fingerprints GROUP BY profile, hash"
+    )
+    op.execute(
+        "INSERT INTO hash_stat_totals (profile, track_count) "
+        "SELECT profile, COUNT(DISTINCT audio_track_id) "
+        "FROM audio_fingerprints GROUP BY profile"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('pruned_hashes')
+    op.drop_table('hash_stat_totals')
+    op.drop_table('hash_stats')
+    op.create_table('hash_stats',
+    sa.Column('hash', sa.String(length=16), nullable=False),
+    sa.Column('track_count', sa.Integer(), nullable=False),
+    sa.Column('total_count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('hash')
+    )
+    op.execute(
+        "INSERT INTO hash_stats (hash, track_count, total_count) "
+        "SELECT hash, COUNT(DISTINCT audio_track_id), COUNT(*) "
+        "FROM audio_fingerprints GROUP BY hash"
+    )
@@ -0,0 +1,30 @@
+"""make movie title unique together with year
+
+Revision ID: f3c9d1e7a4b2
+Revises: e8b3f5a1c2d7
+Create Date: 2026-10-19 21:07:52.318406
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f3c9d1e7a4b2'
+down_revision: Union[str, None] = 'e8b3f5a1c2d7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_unique_constraint('uq_movies_title_year', 'movies', ['title', 'year'])
+    op.drop_constraint('title', 'movies', type_='unique')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.create_unique_constraint('title', 'movies', ['title'])
+    op.drop_constraint('uq_movies_title_year', 'movies', type_='unique')
@@ -1,30 +1,55 @@
+import math
+import logging
+
+from fastapi import HTTPException
 from sqladmin.authentication import AuthenticationBackend
+from sqlalchemy import select
+from starlette.concurrency import run_in_threadpool
 from starlette.requests import Request
 from starlette.responses import RedirectResponse
 from starlette.templating import Jinja2Templates
 from starlette.responses import HTMLResponse
 
-from app.database import SessionLocal
+from app.config import settings
+from app.database import AsyncSessionLocal
 from app.models import User
-from app.utils.security import verify_password
+from app.utils.rate_limit import SlidingWindowRateLimiter
+from app.utils.security import verify_password_async
 from app.utils.auth import create_access_token, verify_token
 
+logger = logging.getLogger("app.admin_auth")
 templates = Jinja2Templates(directory="app/templates")
 
+login_rate_limiter = SlidingWindowRateLimiter(
+    max_attempts=settings.LOGIN_RATE_LIMIT_ATTEMPTS,
+    window=settings.LOGIN_RATE_LIMIT_WINDOW_SECONDS,
+)
+
 
 class AdminAuth(AuthenticationBackend):
     async def login(self, request: Request) -> bool:
         form = await request.form()
         email = form.get("username")
         password = form.get("password")
+        client_ip = request.client.host if request.client else "unknown"
 
-        db = SessionLocal()
-        user = db.query(User).filter(User.email == email).first()
-        db.close()
+        # Лимит проверяется до обращения к БД и bcrypt
+        email_key, ip_key = f"email:{email}", f"ip:{client_ip}"
+        if not login_rate_limiter.hit(email_key) or not login_rate_limiter.hit(ip_key):
+            logger.warning("Превышен лимит попыток входа: email=%s, ip=%s", email, client_ip)
+            retry_after = max(login_rate_limiter.retry_after(email_key), login_rate_limiter.retry_after(ip_key))
+            return await _rate_limited_response(request, retry_after)
 
-        if not user or not verify_password(password, user.hashed_password):
+        async with AsyncSessionLocal() as db:
+            user = (await db.execute(select(User).where(User.email == email))).scalars().first()
+
+        if not user or not user.hashed_password or not password:
+            return False
+        if not await verify_password_async(password, user.hashed_password):
             return False
 
+        login_rate_limiter.reset(email_key)
+        login_rate_limiter.reset(ip_key)
         token = create_access_token({"sub": user.email})
         request.session.update({"token": token})
         return True
@@ -34,12 +59,45 @@ class AdminAuth(AuthenticationBackend):
         return True
 
     async def authenticate(self, request: Request) -> bool:
-        token = request.session.get("token")
-        if not token:
-            return False
+        return await _session_authenticated(request)
 
-        try:
-            verify_token(token)
-            return True
-        except Exception:
-            return False
+
+async def _rate_limited_response(request: Request, retry_after: float):
+    """
+    Форма входа с ошибкой 429: через сколько секунд можно повторить попытку.
+    """
+    from app.admin import admin_instance  # app.admin импортирует этот модуль
+
+    seconds = max(1, math.ceil(retry_after))
+    response = await admin_instance.templates.TemplateResponse(
+        request,
+        "sqladmin/login.html",
+        {"error": f"Слишком много попыток входа, повторите через {seconds} с"},
+        status_code=429,
+    )
+    response.headers["Retry-After"] = str(seconds)
+    return response
+
+
+async def _session_authenticated(request: Request) -> bool:
+    token = request.session.get("token")
+    if not token:
+        return False
+
+    try:
+        # при промахе кэша verify_token ходит в БД синхронно
+        return await run_in_threadpool(verify_token, token) is not None
+    except Exception:
+        return False
+
+
+async def require_admin_session(request: Request) -> None:
+    """
+    Зависимость FastAPI для служебных эндпоинтов админки: пропускает только запросы
+    с действующей сессией, выданной входом в админку.
+
+    Raises:
+        HTTPException: 401 — сессии нет или токен недействителен.
+    """
+    if not await _session_authenticated(request):
+        raise HTTPException(status_code=401, detail="Требуется вход в админку")
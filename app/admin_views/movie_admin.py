@@ -1,11 +1,12 @@
 from sqladmin import ModelView
 from starlette.requests import Request
 from starlette.responses import RedirectResponse, HTMLResponse
-from fastapi import status
+from fastapi import HTTPException, status
 from starlette.templating import Jinja2Templates
 from sqladmin import Admin
+from app.database import AsyncSessionLocal
 from app.models import Movie
-import httpx
+from app.services.movies import create_movie
 import os
 import sqladmin
 
@@ -60,32 +61,24 @@ class MovieAdmin(ModelView, model=Movie):
     async def create(self, request: Request) -> RedirectResponse:
         form = await request.form()
 
-        data = {
-            "title": form.get("title"),
-            "description": form.get("description"),
-            "age_rating": form.get("age_rating"),
-            "genre_ids": form.getlist("genre_ids"),
-            "country_ids": form.getlist("country_ids"),
-            "actor_ids": form.getlist("actor_ids"),
-            "director_ids": form.getlist("director_ids"),
-        }
-
-        files = []
-        if form.get("poster"):
-            poster = form.get("poster")
-            files.append(
-                ("poster", (poster.filename, await poster.read(), poster.content_type))
-            )
-
-        # передаём данные как multipart/form-data
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                "http://127.0.0.1:8000/admin/movies/new",
-                data=data,
-                files=files
-            )
+        def ids(name):
+            return [int(v) for v in form.getlist(name) if str(v).strip()]
 
-        if response.status_code != 302:
-            return HTMLResponse(f"<h3>Ошибка загрузки: {response.text}</h3>", status_code=400)
+        # создаём фильм в том же процессе, без HTTP-запроса к самому себе
+        try:
+            async with AsyncSessionLocal() as db:
+                await create_movie(
+                    db,
+                    title=form.get("title"),
+                    description=form.get("description"),
+                    age_rating=form.get("age_rating"),
+                    genre_ids=ids("genre_ids"),
+                    country_ids=ids("country_ids"),
+                    actor_ids=ids("actor_ids"),
+                    director_ids=ids("director_ids"),
+                    poster=form.get("poster") or None,
+                )
+        except HTTPException as e:
+            return HTMLResponse(f"<h3>Ошибка загрузки: {e.detail}</h3>", status_code=400)
 
         return RedirectResponse("/admin/movie/list", status_code=status.HTTP_302_FOUND)
@@ -0,0 +1,106 @@
+import logging
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+logger = logging.getLogger("app.cli")
+
+# Логгеры, которые пишут строку на каждую дорожку/фрагмент
+NOISY_LOGGERS = ("app.utils.peaks", "app.utils.fingerprinting", "app.services.fingerprints")
+
+
+def setup_logging() -> None:
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    for name in NOISY_LOGGERS:
+        logging.getLogger(name).setLevel(logging.WARNING)
+
+
+def format_duration(seconds: float) -> str:
+    seconds = int(seconds)
+    hours, rest = divmod(seconds, 3600)
+    return f"{hours} ч {rest // 60:02d} мин" if hours else f"{rest // 60} мин {rest % 60:02d} с"
+
+
+def pool_results(fn, jobs, workers: int, in_flight_per_worker: int = 2):
+    """
+    Выполняет fn(*args) для заданий в пуле процессов и отдаёт результаты по мере готовности.
+
+    В работе одновременно не больше workers * in_flight_per_worker заданий: результат
+    (хеши длинного фильма) занимает сотни МБ, а задания берутся из итератора лениво.
+    При прерывании (KeyboardInterrupt) невыполненные задания отменяются.
+
+    Args:
+        fn: Функция верхнего уровня (передаётся в рабочий процесс).
+        jobs: Итерируемое пар (ключ задания, кортеж аргументов fn).
+
+    Yields:
+        tuple[object, concurrent.futures.Future]: Ключ задания и завершённый future.
+    """
+    queue = iter(jobs)
+    pending = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        def submit_next() -> bool:
+            job = next(queue, None)
+            if job is None:
+                return False
+            key, args = job
+            pending[pool.submit(fn, *args)] = key
+            return True
+
+        for _ in range(workers * in_flight_per_worker):
+            if not submit_next():
+                break
+        try:
+            while pending:
+                completed, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in completed:
+                    key = pending.pop(future)
+                    submit_next()
+                    yield key, future
+        except BaseException:
+            for future in pending:
+                future.cancel()
+            raise
+
+
+class Progress:
+    """
+    Прогресс пакетной обработки дорожек: скорость, кратность реальному времени и оценка остатка.
+    """
+
+    def __init__(self, total: int):
+        self.total = total
+        self.ok = 0
+        self.failed = 0
+        self.audio_seconds = 0.0
+        self.started = time.perf_counter()
+
+    @property
+    def finished(self) -> int:
+        return self.ok + self.failed
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def success(self, audio_seconds: float) -> str:
+        self.ok += 1
+        self.audio_seconds += audio_seconds
+        return self.status()
+
+    def failure(self) -> str:
+        self.failed += 1
+        return self.status()
+
+    def status(self) -> str:
+        elapsed = max(self.elapsed, 1e-9)
+        eta = elapsed / self.finished * (self.total - self.finished) if self.finished else 0.0
+        return (
+            f"[{self.finished}/{self.total}] {self.finished / elapsed * 60:.1f} дорожек/мин, "
+            f"x{self.audio_seconds / elapsed:.0f} к реальному времени, осталось ~{format_duration(eta)}"
+        )
+
+    def summary(self) -> str:
+        return (
+            f"готово за {format_duration(self.elapsed)}: успешно {self.ok}, ошибок {self.failed}, "
+            f"{self.audio_seconds / 3600:.1f} ч аудио"
+        )
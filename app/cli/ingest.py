@@ -0,0 +1,365 @@
+"""
+Пакетная загрузка фильмотеки: фильмы, связи и аудиодорожки с отпечатками.
+
+Источник — каталог или манифест (CSV/JSON). Фильмы создаются или находятся по названию
+и году, справочники (жанры, страны, актёры, режиссёры) — по названию, дорожки декодируются
+и хешируются в пуле процессов, отпечатки пишутся пакетными INSERT из главного процесса.
+Повторный запуск пропускает уже проиндексированные дорожки.
+
+Каталог: подкаталог на фильм («Название (2001)/»), внутри файлы дорожек
+с языком перед расширением («audio.ru.mp3», «en.wav») и необязательный movie.json
+с метаданными. Файл в корне каталога — отдельный фильм («Название.ru.mkv»).
+
+CSV: строка на дорожку, колонки title, file, language и необязательные year,
+description, age_rating, duration, poster, genres, countries, actors, directors
+(несколько значений через «;»). JSON: список фильмов с теми же полями и списком
+tracks: [{"file": ..., "language": ...}]. Относительные пути — от файла манифеста.
+
+Запуск из корня репозитория:
+
+    python -m app.cli.ingest /mnt/library --workers 16
+    python -m app.cli.ingest library.csv --dry-run
+"""
+import argparse
+import csv
+import json
+import logging
+import os
+import re
+import shutil
+import sys
+import uuid
+from collections import Counter
+from dataclasses import dataclass, field
+
+from sqlalchemy import exists, select
+
+from app.cli.common import Progress, pool_results, setup_logging
+from app.config import settings
+from app.database import SessionLocal
+from app.models import Actor, AudioFingerprint, AudioTrack, Country, Director, Genre, Movie
+from app.services.fingerprints import fingerprint_audio_file, store_fingerprints
+from app.services.movies import POSTERS_DIR
+from app.utils.pcm_cache import track_pcm_cache
+from app.utils.profiles import PROFILES
+
+logger = logging.getLogger("app.cli.ingest")
+
+MEDIA_EXTENSIONS = {
+    ".wav", ".flac", ".mp3", ".ogg", ".opus", ".m4a", ".aac", ".ac3", ".eac3", ".dts",
+    ".mka", ".mkv", ".mp4", ".m4v", ".mov", ".avi", ".webm", ".ts",
+}
+METADATA_FILE = "movie.json"
+LIST_SEPARATOR = ";"
+RELATIONS = {"genres": Genre, "countries": Country, "actors": Actor, "directors": Director}
+
+_LANGUAGE_RE = re.compile(r"^[A-Za-z]{2,3}$")
+_YEAR_RE = re.compile(r"^(?P<title>.+?)\s*\((?P<year>\d{4})\)$")
+
+
+@dataclass
+class MovieSpec:
+    """
+    Фильм из манифеста: метаданные, названия связанных сущностей и файлы дорожек.
+    """
+    title: str
+    year: int | None = None
+    description: str | None = None
+    age_rating: str | None = None
+    duration: int | None = None
+    poster: str | None = None
+    relations: dict[str, list[str]] = field(default_factory=dict)
+    tracks: list[tuple[str, str]] = field(default_factory=list)  # (путь, язык)
+
+
+def _as_list(value) -> list[str]:
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = value.split(LIST_SEPARATOR)
+    return [str(v).strip() for v in value if str(v).strip()]
+
+
+def _as_int(value) -> int | None:
+    return int(value) if value not in (None, "") else None
+
+
+def _resolve(path: str, base_dir: str) -> str:
+    return os.path.abspath(os.path.join(base_dir, os.path.expanduser(path)))
+
+
+def _apply_metadata(spec: MovieSpec, data: dict, base_dir: str) -> None:
+    """
+    Заполняет пустые поля спецификации из словаря манифеста (первое непустое значение побеждает).
+    """
+    spec.year = spec.year or _as_int(data.get("year"))
+    spec.description = spec.description or data.get("description") or None
+    spec.age_rating = spec.age_rating or data.get("age_rating") or None
+    spec.duration = spec.duration or _as_int(data.get("duration"))
+    if not spec.poster and data.get("poster"):
+        spec.poster = _resolve(data["poster"], base_dir)
+    for name in RELATIONS:
+        for value in _as_list(data.get(name)):
+            if value not in spec.relations.setdefault(name, []):
+                spec.relations[name].append(value)
+
+
+def language_from_filename(path: str, default: str) -> str:
+    """
+    Язык дорожки из имени файла: «audio.ru.mp3» и «ru.mp3» -> «ru», иначе default.
+    """
+    stem = os.path.splitext(os.path.basename(path))[0]
+    candidate = stem.rsplit(".", 1)[-1]
+    return candidate.lower() if _LANGUAGE_RE.match(candidate) else default
+
+
+def _title_and_year(name: str) -> tuple[str, int | None]:
+    match = _YEAR_RE.match(name)
+    if match:
+        return match.group("title"), int(match.group("year"))
+    return name, None
+
+
+def scan_directory(root: str, default_language: str) -> list[MovieSpec]:
+    specs = []
+    for entry in sorted(os.scandir(root), key=lambda e: e.name):
+        if entry.name.startswith("."):
+            continue
+        if entry.is_dir():
+            title, year = _title_and_year(entry.name)
+            spec = MovieSpec(title=title, year=year)
+            metadata_path = os.path.join(entry.path, METADATA_FILE)
+            if os.path.exists(metadata_path):
+                with open(metadata_path, encoding="utf-8") as f:
+                    data = json.load(f)
+                spec.title = data.get("title") or spec.title
+                _apply_metadata(spec, data, entry.path)
+            for name in sorted(os.listdir(entry.path)):
+                path = os.path.join(entry.path, name)
+                if os.path.splitext(name)[1].lower() in MEDIA_EXTENSIONS and os.path.isfile(path):
+                    spec.tracks.append((os.path.abspath(path), language_from_filename(name, default_language)))
+            if spec.tracks:
+                specs.append(spec)
+        elif os.path.splitext(entry.name)[1].lower() in MEDIA_EXTENSIONS:
+            stem = os.path.splitext(entry.name)[0]
+            language = language_from_filename(entry.name, default_language)
+            if stem.rsplit(".", 1)[-1].lower() == language and "." in stem:
+                stem = stem.rsplit(".", 1)[0]
+            title, year = _title_and_year(stem)
+            specs.append(MovieSpec(title=title, year=year, tracks=[(os.path.abspath(entry.path), language)]))
+    return specs
+
+
+def read_manifest(path: str, default_language: str) -> list[MovieSpec]:
+    """
+    Читает CSV (строка на дорожку) или JSON (список фильмов) и объединяет дорожки
+    по названию и году: одноимённые фильмы разных лет остаются разными фильмами.
+    """
+    base_dir = os.path.dirname(os.path.abspath(path))
+    if path.lower().endswith(".json"):
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        rows = []
+        for movie in data.get("movies", []) if isinstance(data, dict) else data:
+            tracks = movie.get("tracks") or [{"file": f} for f in _as_list(movie.get("files"))]
+            rows.extend({**movie, **track} for track in tracks)
+    else:
+        with open(path, encoding="utf-8-sig", newline="") as f:
+            rows = list(csv.DictReader(f))
+
+    specs: dict[tuple[str, int | None], MovieSpec] = {}
+    for row in rows:
+        title = (row.get("title") or "").strip()
+        if not title or not row.get("file"):
+            logger.warning("Пропущена строка манифеста без title/file: %s", row)
+            continue
+        year = _as_int(row.get("year"))
+        spec = specs.setdefault((title, year), MovieSpec(title=title, year=year))
+        _apply_metadata(spec, row, base_dir)
+        file_path = _resolve(row["file"], base_dir)
+        spec.tracks.append((file_path, (row.get("language") or "").strip()
+                            or language_from_filename(file_path, default_language)))
+    return list(specs.values())
+
+
+class CatalogWriter:
+    """
+    Создаёт или находит фильмы по названию и году, справочники — по названию. Справочники читаются
+    один раз и дальше живут в памяти, поэтому на фильм уходит один commit.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self._relations = {
+            name: {obj.name: obj for obj in db.execute(select(model)).scalars()}
+            for name, model in RELATIONS.items()
+        }
+
+    def _get_or_create(self, relation: str, name: str):
+        cache = self._relations[relation]
+        if name not in cache:
+            obj = RELATIONS[relation](name=name)
+            self.db.add(obj)
+            cache[name] = obj
+        return cache[name]
+
+    def movie(self, spec: MovieSpec) -> Movie:
+        movie = self.db.execute(
+            select(Movie).where(Movie.title == spec.title).where(Movie.year == spec.year)
+        ).scalars().first()
+        if movie is not None:
+            return movie
+        movie = Movie(
+            title=spec.title,
+            year=spec.year,
+            description=spec.description,
+            age_rating=spec.age_rating,
+            duration=spec.duration,
+            poster_url=self._copy_poster(spec.poster),
+        )
+        for name, values in spec.relations.items():
+            setattr(movie, name, [self._get_or_create(name, value) for value in values])
+        self.db.add(movie)
+        self.db.flush()
+        logger.info("Создан фильм id=%d, title=%s", movie.id, movie.title)
+        return movie
+
+    @staticmethod
+    def _copy_poster(path: str | None) -> str | None:
+        if not path:
+            return None
+        if not os.path.exists(path):
+            logger.warning("Постер не найден: %s", path)
+            return None
+        os.makedirs(POSTERS_DIR, exist_ok=True)
+        poster_path = os.path.join(POSTERS_DIR, f"{uuid.uuid4().hex}{os.path.splitext(path)[1]}")
+        shutil.copyfile(path, poster_path)
+        return poster_path
+
+    def track(self, movie: Movie, path: str, language: str, profile: int) -> AudioTrack | None:
+        """
+        Дорожка для индексации или None, если дорожка на этом языке уже проиндексирована.
+        Дорожка без отпечатков (прерванный запуск) переиспользуется.
+        """
+        track = self.db.execute(
+            select(AudioTrack).where(AudioTrack.movie_id == movie.id).where(AudioTrack.language == language)
+        ).scalars().first()
+        if track is not None:
+            has_fingerprints = self.db.execute(
+                select(exists().where(AudioFingerprint.audio_track_id == track.id))
+            ).scalar()
+            if has_fingerprints:
+                return None
+            track.track_path = path
+            track.fingerprint_profile = profile
+        else:
+            track = AudioTrack(movie_id=movie.id, language=language, track_path=path, fingerprint_profile=profile)
+            self.db.add(track)
+        self.db.flush()
+        return track
+
+
+def plan(db, specs: list[MovieSpec], profile: int, dry_run: bool) -> list[tuple[int, str]]:
+    """
+    Создаёт фильмы и строки дорожек. Returns: (track_id, путь) дорожек для индексации.
+    """
+    writer = CatalogWriter(db)
+    jobs, skipped = [], 0
+    for spec in specs:
+        missing = [path for path, _ in spec.tracks if not os.path.isfile(path)]
+        if missing:
+            logger.error("Фильм «%s» пропущен: нет файлов %s", spec.title, ", ".join(missing))
+            continue
+        # Дорожка определяется фильмом и языком: второй файл на тот же язык заменил бы первый
+        languages = Counter(language for _, language in spec.tracks)
+        duplicates = sorted(language for language, n in languages.items() if n > 1)
+        if duplicates:
+            logger.error("Фильм «%s» пропущен: несколько файлов на язык %s (%s); укажите язык каждого файла",
+                         spec.title, ", ".join(duplicates),
+                         ", ".join(path for path, language in spec.tracks if language in duplicates))
+            continue
+        if dry_run:
+            logger.info("«%s»: %s", spec.title, ", ".join(f"{lang}={path}" for path, lang in spec.tracks))
+            jobs.extend((0, path) for path, _ in spec.tracks)
+            continue
+        try:
+            movie = writer.movie(spec)
+            for path, language in spec.tracks:
+                track = writer.track(movie, path, language, profile)
+                if track is None:
+                    skipped += 1
+                else:
+                    jobs.append((track.id, path))
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            writer = CatalogWriter(db)
+            logger.error("Фильм «%s» не создан: %s", spec.title, e)
+    if skipped:
+        logger.info("Уже проиндексировано дорожек: %d", skipped)
+    return jobs
+
+
+def run(args) -> int:
+    if os.path.isdir(args.source):
+        specs = scan_directory(args.source, args.default_language)
+    else:
+        specs = read_manifest(args.source, args.default_language)
+    logger.info("Фильмов в источнике: %d, дорожек: %d", len(specs), sum(len(s.tracks) for s in specs))
+
+    db = SessionLocal()
+    try:
+        jobs = plan(db, specs, args.profile, args.dry_run)
+        if args.dry_run or not jobs:
+            return 0
+
+        progress = Progress(len(jobs))
+        work = ((track_id, (path, args.profile, track_id)) for track_id, path in jobs)
+        try:
+            for track_id, future in pool_results(fingerprint_audio_file, work, args.workers):
+                try:
+                    result = future.result()
+                    saved = store_fingerprints(db, track_id, result.hashes, args.profile)
+                    db.get(AudioTrack, track_id).duration = result.duration
+                    db.commit()
+                except Exception as e:
+                    db.rollback()
+                    # Строка без отпечатков не мешает повторному запуску, но и искать по ней нечего
+                    track = db.get(AudioTrack, track_id)
+                    if track is not None:
+                        db.delete(track)
+                        db.commit()
+                    track_pcm_cache.remove(track_id)
+                    logger.error("Дорожка %d: ошибка индексации: %s; %s", track_id, e, progress.failure())
+                    continue
+                logger.info("Дорожка %d: %d хешей, %.0f с аудио; %s",
+                            track_id, saved, result.duration, progress.success(result.duration))
+        except KeyboardInterrupt:
+            logger.warning("Прервано: повторный запуск продолжит с непроиндексированных дорожек")
+            return 130
+
+        logger.info("Загрузка: %s", progress.summary())
+        return 1 if progress.failed else 0
+    finally:
+        db.close()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Пакетная загрузка фильмов и аудиодорожек")
+    parser.add_argument("source", help="каталог фильмотеки или манифест .csv/.json")
+    parser.add_argument("--default-language", default="und",
+                        help="язык дорожки, если он не указан в манифесте и имени файла")
+    parser.add_argument("--profile", type=int, choices=sorted(PROFILES), default=settings.FINGERPRINT_PROFILE_VERSION,
+                        help="версия профиля отпечатков")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="число рабочих процессов")
+    parser.add_argument("--dry-run", action="store_true", help="только показать, что будет загружено")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    setup_logging()
+    sys.exit(run(parse_args(argv)))
+
+
+if __name__ == "__main__":
+    main()
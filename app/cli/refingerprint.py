@@ -0,0 +1,158 @@
+"""
+Переиндексация отпечатков существующих дорожек новой версией профиля.
+
+Дорожки декодируются и хешируются в пуле процессов; запись в БД идёт из главного
+процесса. Новые отпечатки пишутся рядом со старыми (audio_fingerprints.profile),
+поиск продолжает использовать старые, пока дорожка не переключена одним UPDATE
+audio_tracks.fingerprint_profile; затем старые строки удаляются. Прогресс сохраняется
+в файл контрольной точки, а уже переключённые дорожки при повторном запуске не
+выбираются, поэтому прерванный запуск можно просто повторить.
+
+Запуск из корня репозитория:
+
+    python -m app.cli.refingerprint --profile 2 --workers 8
+    python -m app.cli.refingerprint --movie-id 12 --language ru --dry-run
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+
+from sqlalchemy import select
+
+from app.cli.common import Progress, pool_results, setup_logging
+from app.config import settings
+from app.database import SessionLocal
+from app.models import AudioTrack
+from app.services.fingerprints import activate_profile, fingerprint_audio_file, store_fingerprints
+from app.utils.profiles import PROFILES
+
+logger = logging.getLogger("app.cli.refingerprint")
+
+
+class Checkpoint:
+    """
+    Файл контрольной точки: переиндексированные и упавшие дорожки одного целевого профиля.
+    Пишется атомарно после каждой дорожки.
+    """
+
+    def __init__(self, path: str, profile: int):
+        self.path = path
+        self.profile = profile
+        self.done: list[int] = []
+        self.failed: dict[str, str] = {}
+        if path and os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("profile") == profile:
+                self.done = data.get("done", [])
+                self.failed = data.get("failed", {})
+            else:
+                logger.warning("Контрольная точка %s относится к профилю %s, начинаем заново", path, data.get("profile"))
+
+    def mark_done(self, track_id: int) -> None:
+        self.done.append(track_id)
+        self.failed.pop(str(track_id), None)
+        self.save()
+
+    def mark_failed(self, track_id: int, error: str) -> None:
+        self.failed[str(track_id)] = error
+        self.save()
+
+    def save(self) -> None:
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"profile": self.profile, "done": self.done, "failed": self.failed}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+
+def select_tracks(db, args, checkpoint: Checkpoint):
+    """
+    Дорожки, ещё не переключённые на целевой профиль (с учётом фильтров и упавших ранее).
+    """
+    query = (
+        select(AudioTrack.id, AudioTrack.track_path, AudioTrack.fingerprint_profile)
+          .where(AudioTrack.fingerprint_profile != args.profile)
+          .order_by(AudioTrack.id)
+    )
+    if args.track_id:
+        query = query.where(AudioTrack.id.in_(args.track_id))
+    if args.movie_id:
+        query = query.where(AudioTrack.movie_id.in_(args.movie_id))
+    if args.language:
+        query = query.where(AudioTrack.language.ilike(args.language))
+    if args.from_profile is not None:
+        query = query.where(AudioTrack.fingerprint_profile == args.from_profile)
+    tracks = db.execute(query).all()
+    if not args.retry_failed:
+        tracks = [t for t in tracks if str(t.id) not in checkpoint.failed]
+    return tracks[:args.limit] if args.limit else tracks
+
+
+def run(args) -> int:
+    checkpoint = Checkpoint(args.checkpoint, args.profile)
+    db = SessionLocal()
+    try:
+        tracks = select_tracks(db, args, checkpoint)
+        logger.info("Дорожек к переиндексации профилем %d: %d (уже готово по контрольной точке: %d, упало ранее: %d)",
+                    args.profile, len(tracks), len(checkpoint.done), len(checkpoint.failed))
+        if args.dry_run or not tracks:
+            for track in tracks:
+                logger.info("  дорожка %d (профиль %d): %s", track.id, track.fingerprint_profile, track.track_path)
+            return 0
+
+        progress = Progress(len(tracks))
+        jobs = ((track.id, (track.track_path, args.profile, track.id)) for track in tracks)
+        try:
+            for track_id, future in pool_results(fingerprint_audio_file, jobs, args.workers):
+                try:
+                    result = future.result()
+                    saved = store_fingerprints(db, track_id, result.hashes, args.profile)
+                    db.commit()
+                    removed = activate_profile(db, track_id, args.profile)
+                except Exception as e:
+                    db.rollback()
+                    checkpoint.mark_failed(track_id, str(e))
+                    logger.error("Дорожка %d: ошибка переиндексации: %s; %s", track_id, e, progress.failure())
+                    continue
+                checkpoint.mark_done(track_id)
+                logger.info("Дорожка %d: %d хешей (удалено старых строк: %d), %.0f с аудио; %s",
+                            track_id, saved, removed, result.duration, progress.success(result.duration))
+        except KeyboardInterrupt:
+            logger.warning("Прервано: контрольная точка сохранена, повторный запуск продолжит с того же места")
+            return 130
+
+        logger.info("Переиндексация: %s", progress.summary())
+        return 1 if progress.failed else 0
+    finally:
+        db.close()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Переиндексация отпечатков аудиодорожек")
+    parser.add_argument("--profile", type=int, choices=sorted(PROFILES), default=settings.FINGERPRINT_PROFILE_VERSION,
+                        help="целевая версия профиля отпечатков")
+    parser.add_argument("--track-id", type=int, action="append", help="только эти дорожки (можно несколько раз)")
+    parser.add_argument("--movie-id", type=int, action="append", help="только дорожки этих фильмов")
+    parser.add_argument("--language", help="только дорожки на этом языке")
+    parser.add_argument("--from-profile", type=int, help="только дорожки с этой текущей версией профиля")
+    parser.add_argument("--limit", type=int, help="не больше N дорожек за запуск")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="число рабочих процессов")
+    parser.add_argument("--checkpoint", default="media/refingerprint.checkpoint.json",
+                        help="файл контрольной точки (пустая строка — без файла)")
+    parser.add_argument("--retry-failed", action="store_true", help="повторить дорожки, упавшие в прошлых запусках")
+    parser.add_argument("--dry-run", action="store_true", help="только показать, какие дорожки будут обработаны")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    setup_logging()
+    sys.exit(run(parse_args(argv)))
+
+
+if __name__ == "__main__":
+    main()
@@ -10,6 +10,106 @@ class Settings(BaseSettings):
     DB_NAME: str
     BACKEND_URL: str
 
+    # Пул соединений SQLAlchemy
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 20
+    DB_POOL_TIMEOUT: float = 10.0          # ожидание свободного соединения (сек)
+    DB_POOL_RECYCLE: int = 1800            # пересоздание соединения раньше wait_timeout MySQL (сек)
+    DB_POOL_PRE_PING: bool = True
+    DB_CONNECT_TIMEOUT: int = 10           # таймаут установки соединения с MySQL (сек)
+    DB_POOL_CHECKOUT_WARN_MS: float = 200.0
+
+    # Кэш проверенных JWT (токен -> снимок пользователя)
+    AUTH_CACHE_TTL_SECONDS: float = 60.0
+    AUTH_CACHE_MAX_SIZE: int = 4096
+
+    # bcrypt и защита входа в админку
+    PASSWORD_HASH_WORKERS: int = 2
+    LOGIN_RATE_LIMIT_ATTEMPTS: int = 5
+    LOGIN_RATE_LIMIT_WINDOW_SECONDS: float = 300.0
+
+    # Выборочное профилирование запросов (выключено, пока rate и порог равны 0)
+    PROFILE_PATHS: list[str] = ["/match/"]
+    PROFILE_SAMPLE_RATE: float = 0.0
+    PROFILE_SLOW_MS: float = 0.0
+    PROFILE_DIR: str = "media/profiles"
+    PROFILE_MAX_FILES: int = 50
+    PROFILE_SAMPLER_INTERVAL_MS: float = 5.0
+
+    # Версия профиля отпечатков для новых дорожек (app/utils/profiles.py)
+    FINGERPRINT_PROFILE_VERSION: int = 2
+
+    # Отсечение частых («стоп») хешей
+    FINGERPRINT_MAX_HASH_OCCURRENCES: int = 30   # повторов хеша внутри дорожки при индексации
+    FINGERPRINT_MAX_DOC_FREQ: float = 0.3        # доля дорожек каталога, содержащих хеш
+    FINGERPRINT_DOC_FREQ_MIN_TRACKS: int = 20    # документная частота учитывается с этого размера каталога
+    STOP_HASHES_CACHE_TTL_SECONDS: float = 300.0
+    MATCH_MAX_OFFSETS_PER_HASH: int = 30         # хеш с большим числом смещений в дорожке не голосует
+
+    # Голосование раундами с ранней остановкой (/match/audio)
+    MATCH_PROGRESSIVE: bool = True
+    MATCH_FIRST_ROUND_HASHES: int = 200
+    MATCH_ROUND_GROWTH: float = 2.0
+    MATCH_EARLY_STOP_MIN_VOTES: int = 8
+    MATCH_EARLY_STOP_RATIO: float = 3.0     # лучшее смещение / лучшее из остальных
+
+    # Подсказка смещения (offset_hint): окно поиска по умолчанию и предел уточнения вокруг найденного смещения
+    MATCH_HINT_WINDOW_SECONDS: float = 30.0
+    MATCH_HINT_MAX_WINDOW_SECONDS: float = 600.0
+    MATCH_HINT_REFINE_MAX_LAG_SECONDS: float = 0.25
+
+    # Кэш результатов /match/audio по отпечатку декодированного PCM (0 — выключен)
+    MATCH_RESULT_CACHE_SIZE: int = 1024
+    MATCH_RESULT_CACHE_TTL_SECONDS: float = 300.0
+
+    # Допуск запросов сопоставления (app/utils/admission.py; 0 в MAX_CONCURRENCY — выключен)
+    MATCH_ADMISSION_PATHS: list[str] = ["/match/audio", "/match/batch", "/match/hashes"]
+    MATCH_ADMISSION_MAX_CONCURRENCY: int = 8
+    MATCH_ADMISSION_MAX_QUEUE: int = 32
+    MATCH_ADMISSION_QUEUE_TIMEOUT_SECONDS: float = 10.0
+    MATCH_ADMISSION_MEMORY_BUDGET_BYTES: int = 1024 * 1024 * 1024
+    MATCH_ADMISSION_MEMORY_FACTOR: float = 4.0                # байт памяти на байт тела запроса
+    MATCH_ADMISSION_MIN_REQUEST_BYTES: int = 8 * 1024 * 1024
+    MATCH_ADMISSION_RETRY_AFTER_SECONDS: int = 2
+
+    # Загрузка файлов (app/utils/uploads.py): пределы размера по эндпоинтам и блок записи
+    UPLOAD_CHUNK_SIZE: int = 1024 * 1024
+    UPLOAD_MAX_FRAGMENT_BYTES: int = 100 * 1024 * 1024         # /match/audio
+    UPLOAD_MAX_BATCH_BYTES: int = 500 * 1024 * 1024            # /match/batch, всё тело запроса
+    UPLOAD_MAX_TRACK_BYTES: int = 20 * 1024 * 1024 * 1024      # дорожки и фильмы, в т.ч. по частям
+    UPLOAD_MAX_POSTER_BYTES: int = 20 * 1024 * 1024
+    UPLOAD_FORM_OVERHEAD_BYTES: int = 1024 * 1024              # запас Content-Length на поля формы
+    UPLOAD_RESUMABLE_TTL_HOURS: float = 24.0
+    UPLOAD_RESUMABLE_MAX_RESERVED_BYTES: int = 60 * 1024 * 1024 * 1024  # все незабранные загрузки вместе
+
+    # Пул декодеров ffmpeg
+    DECODER_MAX_CONCURRENCY: int = 4
+    DECODER_TIMEOUT_SECONDS: float = 600.0
+    DECODER_QUEUE_TIMEOUT_SECONDS: float = 30.0
+
+    # PCM-копии дорожек для уточнения смещения
+    PCM_CACHE_DIR: str = "media/pcm"
+    PCM_CACHE_MAX_OPEN: int = 64
+
+    # Пакетное сопоставление (/match/batch)
+    MATCH_BATCH_MAX_CLIPS: int = 50
+    MATCH_BATCH_DECODE_CONCURRENCY: int = 4
+    MATCH_BATCH_MAX_ARCHIVE_BYTES: int = 200 * 1024 * 1024   # суммарный распакованный размер zip
+    MATCH_BATCH_LOOKUP_CHUNK: int = 5000                      # хешей в одном IN (...)
+
+    # Сопоставление по хешам, построенным на клиенте (/match/hashes)
+    MATCH_HASHES_MAX: int = 50000
+
+    # Потоковое сопоставление (/match/live)
+    LIVE_STEP_SECONDS: float = 0.5
+    LIVE_WINDOW_SECONDS: float = 12.0
+    LIVE_MIN_VOTES: int = 5
+    LIVE_MIN_MARGIN: int = 3
+    LIVE_UPDATE_INTERVAL_SECONDS: float = 5.0
+    LIVE_MAX_FRAME_BYTES: int = 64 * 1024
+    LIVE_LOOKUP_CACHE_SIZE: int = 200000
+    LIVE_LOOKUP_CACHE_TTL_SECONDS: float = 600.0
+
     class Config:
         env_file = ".env"
         env_file_encoding = "utf-8"
@@ -1,26 +1,119 @@
-import os
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-from dotenv import load_dotenv
+import time
+import logging
 
-load_dotenv()
+from fastapi import Request
+from fastapi.responses import JSONResponse
+from sqlalchemy import create_engine, event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 
-DB_HOST = os.getenv("DB_HOST")
-DB_PORT = os.getenv("DB_PORT")
-DB_USER = os.getenv("DB_USER")
-DB_PASSWORD = os.getenv("DB_PASSWORD")
-DB_NAME = os.getenv("DB_NAME")
+from app.config import settings
+from app.utils.metrics import DB_POOL_CHECKOUT, add_server_timing
 
-SQLALCHEMY_DATABASE_URL = (
-    f"mysql+pymysql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+logger = logging.getLogger("app.database")
+
+_DB_CREDENTIALS = (
+    f"{settings.DB_USER}:{settings.DB_PASSWORD}"
+    f"@{settings.DB_HOST}:{settings.DB_PORT}/{settings.DB_NAME}"
+)
+SQLALCHEMY_DATABASE_URL = f"mysql+pymysql://{_DB_CREDENTIALS}"
+ASYNC_SQLALCHEMY_DATABASE_URL = f"mysql+aiomysql://{_DB_CREDENTIALS}"
+
+
+class _TimedCheckout:
+    """
+    Примесь к пулу: запоминает в info соединения, сколько длилось ожидание выдачи из пула.
+    """
+
+    def _do_get(self):
+        started = time.perf_counter()
+        record = super()._do_get()
+        record.info["checkout_wait"] = time.perf_counter() - started
+        return record
+
+
+class TimedQueuePool(_TimedCheckout, QueuePool):
+    pass
+
+
+class TimedAsyncQueuePool(_TimedCheckout, AsyncAdaptedQueuePool):
+    pass
+
+
+_POOL_OPTIONS = dict(
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    pool_timeout=settings.DB_POOL_TIMEOUT,
+    pool_recycle=settings.DB_POOL_RECYCLE,
+    pool_pre_ping=settings.DB_POOL_PRE_PING,
+    connect_args={"connect_timeout": settings.DB_CONNECT_TIMEOUT},
 )
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
+engine = create_engine(SQLALCHEMY_DATABASE_URL, poolclass=TimedQueuePool, **_POOL_OPTIONS)
 SessionLocal = sessionmaker(bind=engine)
 
-def get_db():
-    db = SessionLocal()
+# Асинхронный путь для горячих async-эндпоинтов: запросы к БД не блокируют event loop
+async_engine = create_async_engine(ASYNC_SQLALCHEMY_DATABASE_URL, poolclass=TimedAsyncQueuePool, **_POOL_OPTIONS)
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, class_=AsyncSession, expire_on_commit=False)
+
+
+def _route_name(request: Request) -> str:
+    route = request.scope.get("route")
+    return getattr(route, "path", request.url.path)
+
+
+async def pool_exhausted_handler(request: Request, exc: PoolTimeoutError) -> JSONResponse:
+    """
+    Обработчик исчерпания пула: соединение берётся лениво, при первом запросе к БД,
+    поэтому таймаут пула всплывает из эндпоинта и превращается здесь в 503.
+    """
+    logger.error("Пул соединений исчерпан: route=%s", _route_name(request))
+    return JSONResponse({"detail": "База данных перегружена, повторите запрос позже"}, status_code=503)
+
+
+def _record_checkout(request: Request, elapsed: float) -> None:
+    DB_POOL_CHECKOUT.labels(_route_name(request)).observe(elapsed)
+    add_server_timing("db_checkout", elapsed)
+    checkout_ms = elapsed * 1000
+    request.state.db_checkout_ms = getattr(request.state, "db_checkout_ms", 0.0) + checkout_ms
+    if checkout_ms >= settings.DB_POOL_CHECKOUT_WARN_MS:
+        logger.warning("Долгое ожидание соединения из пула: route=%s, %.1f мс", _route_name(request), checkout_ms)
+    else:
+        logger.debug("Соединение из пула: route=%s, %.1f мс", _route_name(request), checkout_ms)
+
+
+@event.listens_for(Session, "after_begin")
+def _on_session_begin(session, transaction, connection):
+    # Ожидание пула учитывается, когда сессия действительно взяла соединение
+    waited = connection.info.pop("checkout_wait", None)
+    request = session.info.get("request")
+    if waited is not None and request is not None:
+        _record_checkout(request, waited)
+
+
+def get_db(request: Request):
+    """
+    Единственная зависимость FastAPI для получения синхронной сессии БД.
+
+    Соединение берётся из пула лениво, первым запросом к БД, и возвращается в пул
+    после commit/rollback; время ожидания пула при каждой выдаче пишется
+    в метрику и Server-Timing для конкретного маршрута.
+    """
+    db = SessionLocal(info={"request": request})
     try:
         yield db
     finally:
         db.close()
+
+
+async def get_async_db(request: Request):
+    """
+    Асинхронный аналог get_db для `async def` эндпоинтов.
+    """
+    db = AsyncSessionLocal(info={"request": request})
+    try:
+        yield db
+    finally:
+        await db.close()
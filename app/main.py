@@ -1,19 +1,65 @@
 from fastapi import FastAPI
 from starlette.middleware.sessions import SessionMiddleware
 
-from app.database import engine
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+
+from app.database import engine, pool_exhausted_handler
+from app.config import settings
+from app.utils.admission import AdmissionController, AdmissionMiddleware
+from app.utils.metrics import ServerTimingMiddleware
+from app.utils.uploads import UploadLimitMiddleware
+from app.utils.profiling import ProfilingMiddleware
 from app.admin import setup_admin
 from app.routes import admin as admin_routes
 from app.routes import auth, match  # если есть match
 from app.routes import custom_admin
 from app.routes import movies
 from app.routes import filters
+from app.routes import metrics
+from app.routes import uploads
 
 from fastapi.staticfiles import StaticFiles
 
 app = FastAPI(title="Voice Over API")
+app.add_exception_handler(PoolTimeoutError, pool_exhausted_handler)
 
 app.add_middleware(SessionMiddleware, secret_key="abc-qwerty-key")
+# Допуск подключается до ServerTimingMiddleware, чтобы ожидание в очереди попало в Server-Timing
+if settings.MATCH_ADMISSION_MAX_CONCURRENCY > 0:
+    app.add_middleware(
+        AdmissionMiddleware,
+        controller=AdmissionController(
+            max_concurrency=settings.MATCH_ADMISSION_MAX_CONCURRENCY,
+            max_queue=settings.MATCH_ADMISSION_MAX_QUEUE,
+            queue_timeout=settings.MATCH_ADMISSION_QUEUE_TIMEOUT_SECONDS,
+            memory_budget=settings.MATCH_ADMISSION_MEMORY_BUDGET_BYTES,
+            memory_factor=settings.MATCH_ADMISSION_MEMORY_FACTOR,
+            min_request_bytes=settings.MATCH_ADMISSION_MIN_REQUEST_BYTES,
+        ),
+        paths=settings.MATCH_ADMISSION_PATHS,
+        retry_after=settings.MATCH_ADMISSION_RETRY_AFTER_SECONDS,
+    )
+# Пределы размера проверяются раньше допуска: слишком большой запрос не занимает очередь
+app.add_middleware(UploadLimitMiddleware, limits={
+    "/match/audio": settings.UPLOAD_MAX_FRAGMENT_BYTES + settings.UPLOAD_FORM_OVERHEAD_BYTES,
+    "/match/batch": settings.UPLOAD_MAX_BATCH_BYTES,
+    "/admin/audio-track/new": settings.UPLOAD_MAX_TRACK_BYTES + settings.UPLOAD_FORM_OVERHEAD_BYTES,
+    "/admin/upload_video": (settings.UPLOAD_MAX_TRACK_BYTES + settings.UPLOAD_MAX_POSTER_BYTES
+                            + settings.UPLOAD_FORM_OVERHEAD_BYTES),
+    "/admin/movies/new": settings.UPLOAD_MAX_POSTER_BYTES + settings.UPLOAD_FORM_OVERHEAD_BYTES,
+})
+app.add_middleware(ServerTimingMiddleware)
+
+if settings.PROFILE_SAMPLE_RATE > 0 or settings.PROFILE_SLOW_MS > 0:
+    app.add_middleware(
+        ProfilingMiddleware,
+        paths=settings.PROFILE_PATHS,
+        directory=settings.PROFILE_DIR,
+        sample_rate=settings.PROFILE_SAMPLE_RATE,
+        slow_ms=settings.PROFILE_SLOW_MS,
+        max_files=settings.PROFILE_MAX_FILES,
+        interval_ms=settings.PROFILE_SAMPLER_INTERVAL_MS,
+    )
 
 app.mount("/media", StaticFiles(directory="media"), name="media")
 
@@ -24,6 +70,8 @@ app.include_router(match.router)
 app.include_router(custom_admin.router)
 app.include_router(movies.router)
 app.include_router(filters.router)
+app.include_router(metrics.router)
+app.include_router(uploads.router)
 
 # Админка
 setup_admin(app, engine)
@@ -1,5 +1,5 @@
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, ForeignKey, TIMESTAMP, DateTime, func, Boolean, Table, Float
+from sqlalchemy import Column, Integer, String, ForeignKey, TIMESTAMP, DateTime, func, Boolean, Table, Float, Index, UniqueConstraint
 from sqlalchemy.dialects.mysql import BINARY
 from sqlalchemy.orm import relationship
 from sqlalchemy.ext.declarative import declarative_base
@@ -76,9 +76,13 @@ class Director(Base):
 
 class Movie(Base):
     __tablename__ = "movies"
+    # Одноимённые фильмы разных лет — разные фильмы (пакетная загрузка ищет по названию и году)
+    __table_args__ = (
+        UniqueConstraint("title", "year", name="uq_movies_title_year"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
-    title = Column(String(255), nullable=False, unique=True)
+    title = Column(String(255), nullable=False)
     duration = Column(Integer, nullable=True)
     poster_url = Column(String(255), nullable=True)       # ➕ путь к постеру
     description = Column(String(1000), nullable=True)
@@ -109,6 +113,8 @@ class AudioTrack(Base):
     language = Column(String(50), nullable=True)  # например, "en", "ru", "es"
     track_path = Column(String(255), nullable=True)  # путь к аудиофайлу
     duration = Column(Float, nullable=True)
+    # версия профиля отпечатков (app/utils/profiles.py); старые дорожки — 1 (legacy)
+    fingerprint_profile = Column(Integer, nullable=False, server_default="1")
     created_at = Column(TIMESTAMP, server_default=func.now())
 
     # связь с фингерпринтами
@@ -128,7 +134,54 @@ class AudioFingerprint(Base):
     audio_track_id = Column(Integer, ForeignKey("audio_tracks.id", ondelete="CASCADE"), nullable=False)
     hash = Column(String(16), nullable=False)  # хэш в виде hex (можно и BIGINT если хочешь int)
     offset = Column(Float, nullable=False)     # смещение (в секундах)
+    # версия профиля, которой посчитан отпечаток; поиск берёт только строки активного
+    # профиля дорожки, поэтому новая версия пишется рядом со старой и включается одним UPDATE
+    profile = Column(Integer, nullable=False, server_default="1")
+
+    # Поиск всегда идёт по дорожке, профилю и набору хешей; с подсказкой смещения
+    # (offset_hint) — по диапазону смещений внутри дорожки
+    __table_args__ = (
+        Index("ix_audio_fingerprints_track_profile_hash", "audio_track_id", "profile", "hash"),
+        Index("ix_audio_fingerprints_track_profile_offset", "audio_track_id", "profile", "offset"),
+    )
+
+
+class HashStat(Base):
+    """
+    Статистика хеша по каталогу в рамках версии профиля: в скольких дорожках он
+    встречается (документная частота) и сколько раз всего. Пополняется при индексации,
+    уменьшается при удалении отпечатков дорожки (app/utils/hash_stats.py).
+    """
+    __tablename__ = "hash_stats"
+
+    profile = Column(Integer, primary_key=True)
+    hash = Column(String(16), primary_key=True)
+    track_count = Column(Integer, nullable=False, default=0)
+    total_count = Column(Integer, nullable=False, default=0)
+
+
+class HashStatTotal(Base):
+    """
+    Число дорожек, учтённых в hash_stats для версии профиля (знаменатель документной частоты).
+    """
+    __tablename__ = "hash_stat_totals"
+
+    profile = Column(Integer, primary_key=True)
+    track_count = Column(Integer, nullable=False, default=0)
+
+
+class PrunedHash(Base):
+    """
+    Хеши дорожки, учтённые в hash_stats, но не записанные в audio_fingerprints
+    (отсечены как частые). Вместе с отпечатками дают точный вклад дорожки
+    в статистику, который вычитается при её удалении или переиндексации.
+    """
+    __tablename__ = "pruned_hashes"
 
+    audio_track_id = Column(Integer, ForeignKey("audio_tracks.id", ondelete="CASCADE"), primary_key=True)
+    profile = Column(Integer, primary_key=True)
+    hash = Column(String(16), primary_key=True)
+    count = Column(Integer, nullable=False)
 
 
 class User(Base):
@@ -1,17 +1,16 @@
 import os
-import shutil
-import hashlib
+import uuid
 from pathlib import Path
-from decimal import Decimal, ROUND_HALF_UP
 
-import librosa
 from fastapi import APIRouter, UploadFile, File, Form, Depends, HTTPException
 from sqlalchemy.orm import Session
 
-from app.database import SessionLocal
+from app.config import settings
+from app.database import get_db
 from app import models, schemas
-from app.utils.audio import extract_audio_from_video
-from app.utils.peaks import extract_peaks
+from app.services.fingerprints import ingest_audio_streams, FingerprintingError
+from app.utils.audio import DecoderBusy, DecodeError
+from app.utils.uploads import resumable_uploads, write_upload
 
 from typing import List
 
@@ -21,28 +20,14 @@ MEDIA_DIR = "media/uploads"
 os.makedirs(MEDIA_DIR, exist_ok=True)
 
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-def round_time(t: float) -> float:
-    return float(Decimal(str(t)).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP))
-
-def compute_peak_hash(peaks: list[float]) -> str:
-    joined = ",".join(f"{round(p, 2)}" for p in peaks)
-    return hashlib.sha256(joined.encode("utf-8")).hexdigest()
-
-
 @router.post("/upload_video", response_model=schemas.MovieResponse)
 def upload_video(
     title: str = Form(...),
     description: str = Form(None),
     language: str = Form("unknown"),
-    video: UploadFile = File(...),
+    video: UploadFile = File(None),
     poster: UploadFile = File(None),
+    video_upload_id: str | None = Form(None),
     genre_ids: List[int] = Form([]),
     country_ids: List[int] = Form([]),
     actor_ids: List[int] = Form([]),
@@ -55,67 +40,68 @@ def upload_video(
     if existing_movie:
         raise HTTPException(status_code=400, detail="Фильм с таким названием уже существует")
 
-    # Сохраняем видеофайл
-    video_path = os.path.join(MEDIA_DIR, video.filename)
-    with open(video_path, "wb") as buffer:
-        shutil.copyfileobj(video.file, buffer)
+    if (video is None) == (video_upload_id is None):
+        raise HTTPException(status_code=400, detail="Нужно передать либо video, либо video_upload_id")
+
+    # Сохраняем видеофайл (большие фильмы загружаются по частям через /admin/uploads)
+    if video_upload_id is not None:
+        video_path = resumable_uploads.take(video_upload_id).path
+    else:
+        # Имя от uuid: файлы с одинаковым именем от клиента не перезаписывают друг друга
+        video_path = os.path.join(MEDIA_DIR, f"{uuid.uuid4().hex}{Path(video.filename or '').suffix}")
+        write_upload(video, video_path, settings.UPLOAD_MAX_TRACK_BYTES)
 
     # Сохраняем постер
     poster_url = None
     if poster:
-        poster_filename = f"{Path(video.filename).stem}_poster{Path(poster.filename).suffix}"
+        poster_filename = f"{Path(video_path).stem}_poster{Path(poster.filename).suffix}"
         poster_path = os.path.join(MEDIA_DIR, poster_filename)
-        with open(poster_path, "wb") as buffer:
-            shutil.copyfileobj(poster.file, buffer)
+        try:
+            write_upload(poster, poster_path, settings.UPLOAD_MAX_POSTER_BYTES)
+        except HTTPException:
+            os.remove(video_path)
+            raise
         poster_url = poster_path
 
-    # Извлечение аудио
-    try:
-        audio_path = extract_audio_from_video(video_path, MEDIA_DIR)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Ошибка извлечения аудио: {e}")
-
-    try:
-        y, sr = librosa.load(audio_path, sr=None)
-        peak_times = extract_peaks(y, sr)
-        duration = round(librosa.get_duration(y=y, sr=sr), 2)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Ошибка извлечения пиков: {e}")
-
-    if not peak_times:
-        raise HTTPException(status_code=400, detail="Пики не найдены в аудиодорожке")
-
     # Сохраняем фильм
     movie = models.Movie(
         title=title,
-        duration=duration,
         description=description,
         poster_url=poster_url
     )
-    db.add(movie)
-    db.commit()
-    db.refresh(movie)
-
     movie.genres = db.query(models.Genre).filter(models.Genre.id.in_(genre_ids)).all()
     movie.countries = db.query(models.Country).filter(models.Country.id.in_(country_ids)).all()
     movie.actors = db.query(models.Actor).filter(models.Actor.id.in_(actor_ids)).all()
     movie.directors = db.query(models.Director).filter(models.Director.id.in_(director_ids)).all()
+    db.add(movie)
     db.commit()
+    db.refresh(movie)
 
-    # Аудиодорожка
-    track = models.AudioTrack(
-        movie_id=movie.id,
-        language=language,
-        track_path=audio_path
-    )
-    db.add(track)
-    db.commit()
-    db.refresh(track)
-
-    # Сохраняем пики
-    unique_peaks = sorted(set(round_time(t) for t in peak_times))
-    for t in unique_peaks:
-        db.add(models.AudioFingerprint(audio_track_id=track.id, timestamp=t))
+    # Аудиодорожки: по одной на каждый аудиопоток видео, язык — из тега потока
+    error = None
+    try:
+        results = ingest_audio_streams(db, movie.id, video_path, MEDIA_DIR, language,
+                                       settings.FINGERPRINT_PROFILE_VERSION)
+    except DecoderBusy:
+        error = HTTPException(status_code=503, detail="Сервер перегружен, повторите позже",
+                              headers={"Retry-After": "30"})
+    except (DecodeError, FingerprintingError) as e:
+        error = HTTPException(status_code=400, detail=f"Ошибка извлечения аудио: {e}")
+    else:
+        if not any(result.error is None for result in results):
+            errors = "; ".join(f"поток {r.stream_index}: {r.error}" for r in results)
+            error = HTTPException(status_code=400, detail=f"Ни одна аудиодорожка не проиндексирована: {errors}")
+    if error is not None:
+        db.delete(movie)
+        db.commit()
+        # Видео (в том числе забранная возобновляемая загрузка) и постер без фильма не нужны
+        for path in (video_path, poster_url):
+            if path and os.path.exists(path):
+                os.remove(path)
+        raise error
+
+    movie.duration = round(max(result.duration for result in results if result.error is None))
     db.commit()
+    db.refresh(movie)
 
     return movie
@@ -2,9 +2,9 @@ from fastapi import APIRouter, HTTPException, Depends
 from sqlalchemy.orm import Session
 
 from app import models, schemas
-from app.database import SessionLocal
+from app.database import get_db
 from fastapi.security import OAuth2PasswordRequestForm
-from app.utils.auth import create_access_token, get_current_user
+from app.utils.auth import UserSnapshot, create_access_token, get_current_user
 from app.utils.email import send_verification_email
 
 import random
@@ -13,13 +13,6 @@ from datetime import datetime, timedelta
 
 router = APIRouter(prefix="/auth", tags=["auth"])
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 @router.post("/register", response_model=schemas.UserResponse)
 def send_code(user: schemas.UserEmail, db: Session = Depends(get_db)):
     code = f"{random.randint(0, 999999):06}"  # генерируем 6-значный код
@@ -68,5 +61,5 @@ def login_with_code(form_data: OAuth2PasswordRequestForm = Depends(), db: Sessio
 
 
 @router.get("/me", response_model=schemas.UserResponse)
-def read_current_user(current_user: models.User = Depends(get_current_user)):
-    return current_user
+def read_current_user(current_user: UserSnapshot = Depends(get_current_user)):
+    return schemas.UserResponse.from_orm_with_status(current_user)
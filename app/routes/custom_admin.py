@@ -6,30 +6,31 @@ from app.admin import admin_instance
 import os
 import sqladmin
 from app.config import settings
-from app.database import get_db, SessionLocal
+from app.database import get_db, get_async_db
+from sqlalchemy import select
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from app import models
-import shutil
 import uuid
 from app.models import Genre, Country, Actor, Director, AudioTrack, AudioFingerprint, Movie
 import hashlib
 from typing import List
 import logging
-import mimetypes
-import librosa
-import numpy as np
-from app.utils.audio import extract_audio_from_video
-from app.utils.peaks import extract_peaks
-from app.utils.fingerprinting import generate_hashes_from_peaks
+from app.services.movies import create_movie
+from app.services.fingerprints import (
+    fingerprint_audio_file, store_fingerprints, ingest_audio_streams, FingerprintingError,
+)
+from app.utils.audio import decoder_pool, probe_pcm, probe_audio_streams, DecoderBusy, DecodeError
+from app.utils.profiles import get_profile
+from app.utils.metrics import timed
+from app.utils.uploads import resumable_uploads, write_upload
 import tempfile
+from dataclasses import asdict
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 MEDIA_DIR = "media"
 
-def _as_float(x):
-    return round(float(x), 2)
-
 templates = Jinja2Templates(
     directory=[
         "app/templates",
@@ -40,11 +41,11 @@ templates = Jinja2Templates(
 router = APIRouter()
 
 @router.get("/admin/movies/new", response_class=HTMLResponse)
-async def show_form(request: Request, db: Session = Depends(get_db)):
-    genres = db.query(Genre).order_by(Genre.name).all()
-    countries = db.query(Country).order_by(Country.name).all()
-    actors = db.query(Actor).order_by(Actor.name).all()
-    directors = db.query(Director).order_by(Director.name).all()
+async def show_form(request: Request, db: AsyncSession = Depends(get_async_db)):
+    genres = (await db.execute(select(Genre).order_by(Genre.name))).scalars().all()
+    countries = (await db.execute(select(Country).order_by(Country.name))).scalars().all()
+    actors = (await db.execute(select(Actor).order_by(Actor.name))).scalars().all()
+    directors = (await db.execute(select(Director).order_by(Director.name))).scalars().all()
     return templates.TemplateResponse("admin/movie_upload_form.html", {
         "request": request,
         "admin": admin_instance,
@@ -64,53 +65,27 @@ async def handle_upload(
     actor_ids: list[int] = Form([]),
     director_ids: list[int] = Form([]),
     poster: UploadFile = File(None),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    existing_movie = db.query(models.Movie).filter_by(title=title).first()
-    if existing_movie:
-        raise HTTPException(status_code=400, detail="Фильм с таким названием уже существует")
-
-    poster_url = None
-    if poster:
-        os.makedirs("media/posters", exist_ok=True)
-        ext = os.path.splitext(poster.filename)[1]
-        generated_name = f"{uuid.uuid4().hex}{ext}"
-        poster_path = os.path.join("media/posters", generated_name)
-        with open(poster_path, "wb") as f:
-            shutil.copyfileobj(poster.file, f)
-        poster_url = poster_path
-
-    genres = db.query(Genre).filter(Genre.id.in_(genre_ids)).all()
-    countries = db.query(Country).filter(Country.id.in_(country_ids)).all()
-    actors = db.query(Actor).filter(Actor.id.in_(actor_ids)).all()
-    directors = db.query(Director).filter(Director.id.in_(director_ids)).all()
-        
-    movie = models.Movie(
+    await create_movie(
+        db,
         title=title,
         description=description,
         age_rating=age_rating,
-        poster_url=poster_url,
-        genres=genres,
-        countries=countries,
-        actors=actors,
-        directors=directors
+        genre_ids=genre_ids,
+        country_ids=country_ids,
+        actor_ids=actor_ids,
+        director_ids=director_ids,
+        poster=poster,
     )
 
-    db.add(movie)
-    db.commit()
-    db.refresh(movie)
-
     return RedirectResponse("/admin/movie/list", status_code=status.HTTP_302_FOUND)
 
 @router.get("/admin/audio-track/new", response_class=HTMLResponse)
-async def show_audio_track_form(request: Request):
-    from app.models import Movie
-    from app.database import SessionLocal
+async def show_audio_track_form(request: Request, db: AsyncSession = Depends(get_async_db)):
     from app.admin import admin_instance
 
-    db = SessionLocal()
-    movies = db.query(Movie).order_by(Movie.title).all()
-    db.close()
+    movies = (await db.execute(select(Movie).order_by(Movie.title))).scalars().all()
 
     return templates.TemplateResponse("admin/upload_track.html", {
         "request": request,
@@ -119,49 +94,83 @@ async def show_audio_track_form(request: Request):
     })
 
 @router.post("/admin/audio-track/new")
-async def handle_audio_track_upload(
-    file: UploadFile = File(...),
+def handle_audio_track_upload(
+    file: UploadFile = File(None),
     movie_id: int = Form(...),
     language: str = Form(...),
+    upload_id: str | None = Form(None),
     db: Session = Depends(get_db)
 ):
     """
     Обрабатывает загрузку аудиодорожки, извлекает отпечатки и сохраняет их в базе данных.
 
+    Если в файле несколько аудиопотоков (видео с дубляжами), создаётся по дорожке
+    на поток с языком из тега потока; language тогда используется для потоков без тега.
+
+    Большие файлы загружаются по частям (/admin/uploads) и передаются через upload_id
+    вместо file.
+
     Args:
         file (UploadFile): Загруженный аудио- или видеофайл.
         movie_id (int): ID фильма.
         language (str): Язык аудиодорожки.
+        upload_id (str | None): Завершённая возобновляемая загрузка (см. app.routes.uploads).
         db (Session): Сессия базы данных.
 
     Returns:
-        dict: Информация о сохранённой аудиодорожке.
+        dict: Информация о сохранённой аудиодорожке (или {"movie_id", "tracks"} для нескольких потоков).
     """
     logger.debug("Логирование DEBUG включено для handle_audio_track_upload")
 
-    try:
-        os.makedirs(MEDIA_DIR, exist_ok=True)
-        file_extension = os.path.splitext(file.filename)[1] or ".tmp"
-        with tempfile.NamedTemporaryFile(suffix=file_extension, dir=MEDIA_DIR, delete=False) as temp_file:
-            track_path = temp_file.name
-            shutil.copyfileobj(file.file, temp_file)
-    except Exception as e:
-        logger.error("Ошибка сохранения файла: %s", e)
-        raise HTTPException(500, f"Ошибка сохранения файла: {e}")
+    if (file is None) == (upload_id is None):
+        raise HTTPException(400, "Нужно передать либо file, либо upload_id")
+
+    if upload_id is not None:
+        stored = resumable_uploads.take(upload_id)
+    else:
+        try:
+            os.makedirs(MEDIA_DIR, exist_ok=True)
+            file_extension = os.path.splitext(file.filename or "")[1] or ".tmp"
+            fd, temp_path = tempfile.mkstemp(suffix=file_extension, dir=MEDIA_DIR)
+            os.close(fd)
+            with timed("save", pipeline="ingest"):
+                stored = write_upload(file, temp_path, settings.UPLOAD_MAX_TRACK_BYTES)
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.error("Ошибка сохранения файла: %s", e)
+            raise HTTPException(500, f"Ошибка сохранения файла: {e}")
+    track_path = stored.path
+    logger.info("Файл сохранён: %s, %d байт, sha256=%s", track_path, stored.size, stored.sha256)
 
-    mime_type, _ = mimetypes.guess_type(track_path)
-    is_wav = mime_type == "audio/wav" or track_path.endswith(".wav")
+    # Моно WAV 16 кГц сохраняется как есть, остальное перекодируется один раз
+    is_wav = probe_pcm(track_path)
     audio_path = track_path
 
+    profile = get_profile(settings.FINGERPRINT_PROFILE_VERSION)
+
     if not is_wav:
         try:
-            audio_path = extract_audio_from_video(track_path, MEDIA_DIR)
+            streams = probe_audio_streams(track_path)
+        except DecodeError as e:
+            os.remove(track_path)
+            raise HTTPException(400, f"Не удалось прочитать файл: {e}")
+        if len(streams) > 1:
+            return _upload_audio_streams(db, movie_id, track_path, language, profile.version)
+
+        try:
+            with timed("decode", pipeline="ingest"):
+                audio_path = decoder_pool.to_wav(track_path, MEDIA_DIR)
+        except DecoderBusy as e:
+            logger.warning("Пул декодеров занят: %s", e)
+            raise HTTPException(503, "Сервер перегружен, повторите позже", headers={"Retry-After": "30"})
         except Exception as e:
             logger.error("Ошибка извлечения аудио: %s", e)
             raise HTTPException(500, f"Ошибка извлечения аудио: {e}")
 
     try:
-        track = AudioTrack(movie_id=movie_id, language=language, track_path=audio_path)
+        track = AudioTrack(movie_id=movie_id, language=language, track_path=audio_path,
+                           fingerprint_profile=profile.version)
         db.add(track)
         db.commit()
         db.refresh(track)
@@ -170,67 +179,33 @@ async def handle_audio_track_upload(
         raise HTTPException(500, f"Ошибка сохранения AudioTrack: {e}")
 
     try:
-        y, sr = librosa.load(audio_path, sr=16000, mono=True)
-        track_duration = len(y) / sr
-        if track_duration < 0.5:
-            logger.warning("Аудиодорожка слишком короткая: %.2f сек", track_duration)
-            raise HTTPException(400, "Аудиодорожка слишком короткая (<0.5 сек)")
-        if y is None or len(y) == 0:
-            logger.error("Ошибка чтения аудиофайла: пустой сигнал")
-            raise HTTPException(400, "Ошибка чтения аудиофайла: пустой сигнал")
-
-        peaks, freqs, amplitudes = extract_peaks(
-            y, sr,
-            normalize=True,
-            return_freqs=True,
-            return_amplitudes=True,
-            frame_size=1024,
-            hop_size=256,
-            min_freq=100.0,
-            max_freq=4000.0,
-            threshold=0.6
-        )
-        if not isinstance(peaks, np.ndarray) or not isinstance(freqs, np.ndarray) or not isinstance(amplitudes, np.ndarray):
-            logger.error("peaks, freqs или amplitudes не являются numpy-массивами: peaks=%s, freqs=%s, amplitudes=%s", type(peaks), type(freqs), type(amplitudes))
-            raise HTTPException(400, detail="Некорректный формат пиков, частот или амплитуд")
-        if peaks.size == 0 or freqs.size == 0 or amplitudes.size == 0:
-            logger.error("peaks, freqs или amplitudes пусты: peaks_size=%d, freqs_size=%d, amplitudes_size=%d", peaks.size, freqs.size, amplitudes.size)
-            raise HTTPException(400, detail="Пустые пики, частоты или амплитуды")
-        if peaks.size != freqs.size or peaks.size != amplitudes.size:
-            logger.error("Несоответствие размеров: peaks (%d), freqs (%d), amplitudes (%d)", peaks.size, freqs.size, amplitudes.size)
-            raise HTTPException(400, detail="Несоответствие размеров пиков, частот или амплитуд")
-        logger.debug("Пики (первые 5): %s, Частоты (первые 5): %s, Амплитуды (первые 5): %s", peaks[:5], freqs[:5], amplitudes[:5])
-        hashes = [(h, _as_float(t1)) for h, t1 in generate_hashes_from_peaks(
-            peaks, freqs=freqs, amplitudes=None, fan_value=15, min_delta=0.5, max_delta=8.0, time_precision=0.05
-        )]
-        logger.info("Длительность аудиодорожки: %.2f сек", track_duration)
-        logger.info("Количество пиков: %d", len(peaks))
-        logger.info("Количество хешей: %d", len(hashes))
-        logger.info("Пример хеша: %s", hashes[0] if hashes else "none")
-        if len(hashes) < 5:
-            logger.warning("Слишком мало хешей для анализа: %d", len(hashes))
-            raise HTTPException(400, "Слишком мало хешей для анализа (<5)")
+        result = fingerprint_audio_file(audio_path, profile.version, track.id)
+        logger.info("Длительность аудиодорожки: %.2f сек", result.duration)
+        logger.info("Количество пиков: %d", result.peak_count)
+        logger.info("Количество хешей: %d", len(result.hashes))
+    except FingerprintingError as e:
+        logger.warning("Аудиодорожка не проиндексирована: %s", e)
+        raise HTTPException(400, str(e))
+    except DecoderBusy as e:
+        logger.warning("Пул декодеров занят: %s", e)
+        raise HTTPException(503, "Сервер перегружен, повторите позже", headers={"Retry-After": "30"})
     except Exception as e:
         logger.error("Ошибка обработки аудио: %s", e)
         raise HTTPException(500, f"Ошибка обработки аудио: {e}")
 
     try:
-        fingerprints = [
-            AudioFingerprint(audio_track_id=track.id, hash=h, offset=t1)
-            for h, t1 in hashes
-        ]
-        db.bulk_save_objects(fingerprints)
+        saved = store_fingerprints(db, track.id, result.hashes, profile.version)
+        track.duration = result.duration
         db.commit()
-        logger.info("Сохранено %d хешей для аудиодорожки ID=%d", len(fingerprints), track.id)
+        logger.info("Сохранено %d хешей для аудиодорожки ID=%d", saved, track.id)
     except Exception as e:
         logger.error("Ошибка сохранения отпечатков: %s", e)
         raise HTTPException(500, f"Ошибка сохранения отпечатков: {e}")
     finally:
+        # Перекодированный WAV остаётся: на него ссылается track_path (переиндексация)
         try:
             if os.path.exists(track_path) and track_path != audio_path:
                 os.remove(track_path)
-            if not is_wav and os.path.exists(audio_path):
-                os.remove(audio_path)
         except Exception as e:
             logger.warning("Ошибка удаления временных файлов: %s", e)
 
@@ -239,5 +214,38 @@ async def handle_audio_track_upload(
         "movie_id": track.movie_id,
         "language": track.language,
         "track_path": track.track_path,
-        "hashes_saved": len(fingerprints)
-    }
\ No newline at end of file
+        "fingerprint_profile": track.fingerprint_profile,
+        "hashes_saved": saved,
+        "hashes_dropped": len(result.hashes) - saved
+    }
+
+def _upload_audio_streams(db: Session, movie_id: int, media_path: str, default_language: str,
+                          profile_version: int) -> dict:
+    """
+    Индексирует все аудиопотоки загруженного контейнера; исходный файл затем удаляется.
+    """
+    try:
+        results = ingest_audio_streams(db, movie_id, media_path, MEDIA_DIR, default_language, profile_version)
+    except FingerprintingError as e:
+        raise HTTPException(400, str(e))
+    except DecoderBusy as e:
+        logger.warning("Пул декодеров занят: %s", e)
+        raise HTTPException(503, "Сервер перегружен, повторите позже", headers={"Retry-After": "30"})
+    except DecodeError as e:
+        logger.error("Ошибка извлечения аудио: %s", e)
+        raise HTTPException(500, f"Ошибка извлечения аудио: {e}")
+    finally:
+        try:
+            os.remove(media_path)
+        except Exception as e:
+            logger.warning("Ошибка удаления временных файлов: %s", e)
+
+    for result in results:
+        if result.error is None:
+            logger.info("Поток %d: дорожка ID=%d (%s), сохранено %d хешей",
+                        result.stream_index, result.track_id, result.language, result.hashes_saved)
+    return {
+        "movie_id": movie_id,
+        "fingerprint_profile": profile_version,
+        "tracks": [asdict(result) for result in results],
+    }
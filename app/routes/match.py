@@ -1,195 +1,732 @@
-from fastapi import APIRouter, UploadFile, File, Form, Depends, HTTPException
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, UploadFile, File, Form, Depends, HTTPException, Request, WebSocket, WebSocketDisconnect
+from sqlalchemy import select, or_
+from sqlalchemy.ext.asyncio import AsyncSession
 import os
 import uuid
+import asyncio
+import zipfile
 import tempfile
 import shutil
-import mimetypes
 import logging
 import numpy as np
-import librosa
-import soundfile as sf
-from collections import Counter, defaultdict
-from app.database import get_db
-from app.models import AudioTrack, AudioFingerprint
-from app.utils.audio import extract_audio_from_video
-from app.utils.peaks import extract_peaks
-from app.utils.fingerprinting import generate_hashes_from_peaks
-from scipy.signal import butter, lfilter
+from app.config import settings
+from app.database import get_async_db, AsyncSessionLocal
+from app.models import AudioTrack
+from app.utils.audio import DecodeError, DecoderBusy
+from app.utils.cache import SingleFlight, TTLCache
+from app.utils.hash_payload import HEADER, RECORD, PayloadError, decode_hashes
+from app.utils.hash_stats import get_stop_hashes_async
+from app.utils.pcm_cache import track_pcm_cache
+from app.utils.streaming import LiveMatcher
+from app.utils.uploads import save_upload, write_upload
+from app.utils.metrics import timed, LOOKUP_HASHES, MATCH_RESULT_CACHE
+from app.utils.profiles import get_profile
+from app.utils.profiling import annotate_profile, run_in_threadpool
+from app.utils.matching import (
+    FRAGMENT_SAMPLE_RATE,
+    MIN_FRAGMENT_HASHES,
+    load_fragment,
+    pcm_digest,
+    fingerprint_fragment,
+    fingerprint_query,
+    hint_range,
+    batch_fingerprint_query,
+    group_fingerprints,
+    group_fingerprints_by_track,
+    vote_offsets,
+    ProgressiveVoter,
+    pick_best_offset,
+    refine_offset,
+)
 
 logger = logging.getLogger("app.routes.match")
 MEDIA_DIR = "media"
 
 router = APIRouter()
 
-def _as_float(x):
-    return round(float(x), 2)
+# (audio_track_id, profile, hash) -> смещения в дорожке; общий для всех живых сессий
+_live_lookup_cache = TTLCache(settings.LIVE_LOOKUP_CACHE_SIZE, settings.LIVE_LOOKUP_CACHE_TTL_SECONDS)
 
+# (pcm_digest, movie_id, language, audio_track_id, profile, offset_hint, window) -> ответ /match/audio
+_match_result_cache = TTLCache(settings.MATCH_RESULT_CACHE_SIZE, settings.MATCH_RESULT_CACHE_TTL_SECONDS)
+_match_flight = SingleFlight()
 
-def butter_bandpass(lowcut, highcut, fs, order=5):
-    nyq = 0.5 * fs
-    low = lowcut / nyq
-    high = highcut / nyq
-    b, a = butter(order, [low, high], btype='band')
-    return b, a
 
+def _decode_fragment(audio_path, profile):
+    """
+    Загружает фрагмент сразу с частотой профиля дорожки и считает отпечаток PCM
+    (ключ кэша результатов, см. pcm_digest).
+    """
+    y, sr = load_fragment(audio_path, profile.sample_rate)
+    return y, sr, pcm_digest(y)
+
+
+def _fingerprint_fragment_profiles(audio_path, profiles):
+    """
+    Загружает фрагмент один раз (с наибольшей частотой среди профилей) и строит хеши
+    для каждого из профилей.
+
+    Returns:
+        tuple: Сигнал, частота, длительность и {версия профиля: хеши}.
+    """
+    y, sr = load_fragment(audio_path, max(profile.sample_rate for profile in profiles))
+    hashes = {profile.version: fingerprint_fragment(y, sr, profile)[1] for profile in profiles}
+    return y, sr, len(y) / sr, hashes
+
+def _refine(y, sr, track_id, track_path, offset, max_lag=None):
+    """
+    Уточнение смещения по PCM-кэшу дорожки (кэш строится из track_path при первом обращении).
+    """
+    return refine_offset(y, sr, track_pcm_cache.get(track_id, track_path), offset, max_lag)
+
+
+def _check_hint(offset_hint: float | None, window: float | None) -> float | None:
+    """
+    Проверяет подсказку смещения.
+
+    Returns:
+        float | None: Окно поиска (сек) или None, если подсказки нет.
+
+    Raises:
+        HTTPException: 400 — отрицательная подсказка или окно вне (0, MATCH_HINT_MAX_WINDOW_SECONDS].
+    """
+    if offset_hint is None:
+        return None
+    if window is None:
+        window = settings.MATCH_HINT_WINDOW_SECONDS
+    if offset_hint < 0:
+        raise HTTPException(status_code=400, detail="offset_hint не может быть отрицательным")
+    if not 0 < window <= settings.MATCH_HINT_MAX_WINDOW_SECONDS:
+        raise HTTPException(status_code=400,
+                            detail=f"window должно быть в (0, {settings.MATCH_HINT_MAX_WINDOW_SECONDS}] сек")
+    return window
+
+
+async def _find_track(db: AsyncSession, movie_id: int, language: str) -> AudioTrack:
+    """
+    Аудиодорожка фильма на языке language.
+
+    Raises:
+        HTTPException: 404, если дорожки нет.
+    """
+    with timed("db_track"):
+        result = await db.execute(
+            select(AudioTrack)
+              .where(AudioTrack.movie_id == movie_id)
+              .where(AudioTrack.language.ilike(language))
+              .limit(1)
+        )
+        track = result.scalars().first()
+    if not track:
+        raise HTTPException(status_code=404, detail=f"Аудиодорожка не найдена для фильма {movie_id}, язык '{language}'")
+    return track
+
+
+async def _vote_hashes(db: AsyncSession, track: AudioTrack, profile, hashes, hint=None):
+    """
+    Отсекает стоп-хеши и голосует хешами фрагмента раундами: от сильных якорей к слабым,
+    пока лучшее смещение не станет решающим.
+
+    С подсказкой сначала читаются только отпечатки участка дорожки вокруг неё. Если там
+    решающего смещения нет (зритель перемотал, подсказка устарела), голосование
+    повторяется по всей дорожке; у итогового voter тогда offset_range равен None.
+
+    Args:
+        hint (tuple|None): Диапазоны поиска (см. app.utils.matching.hint_range).
+
+    Returns:
+        tuple[ProgressiveVoter, list[tuple[str, float]]]: Итог голосования и хеши после отсечения.
+
+    Raises:
+        HTTPException: 400 — мало хешей, 404 — нет отпечатков или совпадений.
+    """
+    # Частые по каталогу хеши не ищутся
+    stop_hashes = await get_stop_hashes_async(
+        db, track.fingerprint_profile, settings.FINGERPRINT_MAX_DOC_FREQ, settings.FINGERPRINT_DOC_FREQ_MIN_TRACKS
+    )
+    if stop_hashes:
+        hashes = [(h, t1) for h, t1 in hashes if h not in stop_hashes]
+    if len(hashes) < MIN_FRAGMENT_HASHES:
+        raise HTTPException(status_code=400, detail="Недостаточно хешей для анализа (<5)")
+
+    if hint is not None:
+        voter = await _run_voter(db, track, profile, hashes, *hint)
+        if voter.decided:
+            return voter, hashes
+        logger.info(f"[match] track_id={track.id}: no decisive offset near hint {hint[0]}, searching whole track")
+    voter = await _run_voter(db, track, profile, hashes)
+    if not voter.fps_dict:
+        raise HTTPException(status_code=404, detail="Отпечатки для аудиодорожки отсутствуют")
+    if not voter.counts:
+        raise HTTPException(status_code=404, detail="Совпадений не найдено")
+    return voter, hashes
+
+
+async def _run_voter(db: AsyncSession, track: AudioTrack, profile, hashes, match_range=None, rows_range=None):
+    """
+    Раунды голосования с поиском отпечатков в БД (весь трек или участок rows_range).
+    """
+    voter = ProgressiveVoter(
+        hashes,
+        first_round=settings.MATCH_FIRST_ROUND_HASHES if settings.MATCH_PROGRESSIVE else len(hashes),
+        growth=settings.MATCH_ROUND_GROWTH,
+        min_votes=settings.MATCH_EARLY_STOP_MIN_VOTES,
+        ratio=settings.MATCH_EARLY_STOP_RATIO,
+        max_offsets=settings.MATCH_MAX_OFFSETS_PER_HASH,
+        offset_range=match_range,
+    )
+    while (missing := voter.next_round()) is not None:
+        rows = []
+        if missing:
+            with timed("db_fingerprints"):
+                result = await db.execute(
+                    fingerprint_query(track.id, missing, track.fingerprint_profile, rows_range)
+                )
+                rows = result.all()
+            found = len({h for h, _ in rows})
+            LOOKUP_HASHES.labels(profile.name, "found").inc(found)
+            LOOKUP_HASHES.labels(profile.name, "missing").inc(len(missing) - found)
+        voter.add(rows)
+    return voter
+
+
+async def _match_fragment(db: AsyncSession, track: AudioTrack, profile, y, sr, hint=None):
+    """
+    Хеши, голосование и уточнение смещения для декодированного фрагмента.
+
+    Returns:
+        dict: Ответ /match/audio.
+    """
+    fragment_duration = len(y) / sr
+    # Фильтрация, извлечение пиков и генерация хешей вне event loop
+    y, hashes = await run_in_threadpool(fingerprint_fragment, y, sr, profile)
+    annotate_profile(hash_count=len(hashes))
+
+    voter, hashes = await _vote_hashes(db, track, profile, hashes, hint)
+    counts = voter.counts
+    hint_used = voter.offset_range is not None
+
+    # Выбор лучшего смещения
+    total_checked = voter.used
+    best_offset, match_score, raw_confidence = pick_best_offset(counts, total_checked)
+
+    # Уточнение смещения через кросс-корреляцию
+    refined_offset = best_offset
+    corr_confidence = None
+    try:
+        refined_offset, corr_confidence = await run_in_threadpool(
+            _refine, y, sr, track.id, track.track_path, best_offset,
+            settings.MATCH_HINT_REFINE_MAX_LAG_SECONDS if hint_used else None
+        )
+    except Exception as e:
+        logger.warning(f"Refinement failed: {e}")
+
+    # Лог и возврат
+    logger.info(
+        f"[match] movie_id={track.movie_id}, raw_offset={best_offset}s, score={match_score}, "
+        f"raw_confidence={raw_confidence}%, rounds={voter.rounds}, hashes_used={voter.used}/{len(hashes)}, "
+        f"hint_used={hint_used}, refined_offset={refined_offset}s, "
+        f"corr_confidence={corr_confidence}%"
+    )
+
+    # Проверка валидности
+    track_duration = getattr(track, 'duration', None)
+    if track_duration is not None:
+        valid_offset = bool(0 <= refined_offset <= (track_duration - fragment_duration))
+    else:
+        valid_offset = True
+
+    return {
+        "audio_track": {"id": track.id, "language": track.language},
+        "match": {
+            "raw_offset": float(best_offset),
+            "raw_confidence": raw_confidence,
+            "refined_offset": float(refined_offset),
+            "corr_confidence": corr_confidence,
+            "score": int(match_score),
+            "total_checked": total_checked,
+            "total_hashes": len(hashes),
+            "valid_offset": valid_offset,
+            "hint_used": hint_used
+        }
+    }
 
-def bandpass_filter(data, lowcut=100.0, highcut=4000.0, fs=16000, order=5):
-    b, a = butter_bandpass(lowcut, highcut, fs, order=order)
-    return lfilter(b, a, data)
 
 @router.post("/match/audio")
 async def match_audio(
     file: UploadFile = File(...),
     movie_id: int = Form(...),
     language: str = Form(...),
-    db: Session = Depends(get_db)
+    offset_hint: float | None = Form(None),
+    window: float | None = Form(None),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Принимает аудиофрагмент и возвращает приблизительное и уточнённое смещение внутри аудиодорожки фильма.
+
+    offset_hint — ожидаемое смещение (позиция воспроизведения, прошлый результат): поиск
+    идёт по отпечаткам участка ±window вокруг него, а уточнение — в пределах
+    MATCH_HINT_REFINE_MAX_LAG_SECONDS от найденного смещения.
+
+    Результат кэшируется по SHA-256 декодированного PCM, дорожке и подсказке: повторы того же
+    фрагмента (популярный трейлер, повтор запроса клиентом) не считают хеши и не ходят в БД,
+    а одновременные одинаковые запросы ждут одного вычисления.
     """
+    window = _check_hint(offset_hint, window)
     fragment_path = None
-    audio_path = None
     try:
-        # Сохранение фрагмента
+        # Сохранение фрагмента (с исходным расширением: по нему ffmpeg определяет формат)
         os.makedirs(MEDIA_DIR, exist_ok=True)
-        fragment_path = os.path.join(MEDIA_DIR, f"frag_{movie_id}_{uuid.uuid4().hex}.tmp")
-        with open(fragment_path, "wb") as out_f:
-            shutil.copyfileobj(file.file, out_f)
-
-        # Конвертация в WAV при необходимости
-        mime_type, _ = mimetypes.guess_type(fragment_path)
-        audio_path = fragment_path
-        if mime_type != "audio/wav" and not fragment_path.endswith(".wav"):
-            audio_path = extract_audio_from_video(fragment_path, MEDIA_DIR)
-
-        # Загрузка метаданных дорожки
-        track = (
-            db.query(AudioTrack)
-              .filter(AudioTrack.movie_id == movie_id)
-              .filter(AudioTrack.language.ilike(language))
-              .first()
-        )
-        if not track:
-            raise HTTPException(status_code=404, detail=f"Аудиодорожка не найдена для фильма {movie_id}, язык '{language}'")
+        ext = os.path.splitext(file.filename or "")[1].lower() or ".tmp"
+        fragment_path = os.path.join(MEDIA_DIR, f"frag_{movie_id}_{uuid.uuid4().hex}{ext}")
+        with timed("save"):
+            await save_upload(file, fragment_path, settings.UPLOAD_MAX_FRAGMENT_BYTES)
 
-        # Загрузка и фильтрация фрагмента
-        y, sr = librosa.load(audio_path, sr=16000, mono=True)
+        track = await _find_track(db, movie_id, language)
+
+        # Декодирование (пул ffmpeg) сразу с частотой профиля, которым проиндексирована дорожка
+        profile = get_profile(track.fingerprint_profile)
+        try:
+            y, sr, digest = await run_in_threadpool(_decode_fragment, fragment_path, profile)
+        except DecoderBusy:
+            raise HTTPException(status_code=503, detail="Сервер перегружен, повторите позже",
+                                headers={"Retry-After": "5"})
+        except DecodeError as e:
+            logger.warning(f"Decode failed: {e}")
+            raise HTTPException(status_code=400, detail="Не удалось декодировать фрагмент")
         fragment_duration = len(y) / sr
-        y = bandpass_filter(y, lowcut=100.0, highcut=4000.0, fs=sr)
-
-        # Извлечение пиков и генерация хешей
-        peaks, freqs, _ = extract_peaks(
-            y, sr,
-            normalize=True,
-            return_freqs=True,
-            return_amplitudes=False,
-            frame_size=2048,
-            hop_size=256,
-            min_freq=100.0,
-            max_freq=4000.0,
-            threshold=0.8,
-            absolute_threshold=0.2,
-            max_peaks=800
-        )
-        hashes = [
-            (h, _as_float(t1))
-            for h, t1 in generate_hashes_from_peaks(
-                peaks,
-                freqs=freqs,
-                amplitudes=None,
-                fan_value=10,
-                min_delta=0.5,
-                max_delta=6.0,
-                time_precision=0.01,
-                target_density=80.0,
-                max_hashes=200000
-            )
-        ]
-        if len(hashes) < 5:
-            raise HTTPException(status_code=400, detail="Недостаточно хешей для анализа (<5)")
-
-        # Загрузка отпечатков из БД
-        db_fps = (
-            db.query(AudioFingerprint.hash, AudioFingerprint.offset)
-              .filter(AudioFingerprint.audio_track_id == track.id)
-              .filter(AudioFingerprint.hash.in_([h for h, _ in hashes]))
-              .all()
-        )
-        if not db_fps:
-            raise HTTPException(status_code=404, detail="Отпечатки для аудиодорожки отсутствуют")
-
-        # Группировка по хешу
-        fps_dict = defaultdict(list)
-        for h_db, off in db_fps:
-            fps_dict[h_db].append(off)
-
-        # Подсчёт дельт
-        DELTA_TOLERANCE = 0.02
-        counts = Counter()
-        for h, t1 in hashes:
-            for t2 in fps_dict.get(h, []):
-                delta = t2 - t1
-                bin_delta = round(delta / DELTA_TOLERANCE) * DELTA_TOLERANCE
-                counts[round(bin_delta, 3)] += 1
-        if not counts:
-            raise HTTPException(status_code=404, detail="Совпадений не найдено")
-
-        # Выбор лучшего смещения
-        best_offset = max(counts, key=counts.get)
-        match_score = counts[best_offset]
-        total_checked = len(hashes)
-        raw_confidence = round(min(match_score / total_checked, 1.0) * 100, 2)
-
-        # Уточнение смещения через кросс-корреляцию
-        refined_offset = best_offset
-        corr_confidence = None
+        annotate_profile(movie_id=movie_id, language=language, track_id=track.id, fingerprint_profile=profile.name,
+                         fragment_duration=round(fragment_duration, 2))
+
+        key = (digest, movie_id, language.lower(), track.id, track.fingerprint_profile, offset_hint, window)
+        result = _match_result_cache.get(key)
+        if result is not None:
+            MATCH_RESULT_CACHE.labels("hit").inc()
+            annotate_profile(result_cache="hit")
+            return result
+
+        hint = hint_range(offset_hint, window, fragment_duration) if window is not None else None
+
+        async def compute():
+            result = await _match_fragment(db, track, profile, y, sr, hint)
+            _match_result_cache.set(key, result)
+            return result
+
+        result, shared = await _match_flight.do(key, compute)
+        MATCH_RESULT_CACHE.labels("coalesced" if shared else "miss").inc()
+        annotate_profile(result_cache="coalesced" if shared else "miss")
+        return result
+    finally:
+        # Удаление временного файла
         try:
-            start_sample = max(0, int(best_offset * sr))
-            n_samples = len(y)
-            segment, _ = sf.read(track.track_path, start=start_sample, frames=n_samples, dtype='float32')
-            if len(segment) < n_samples:
-                segment = np.pad(segment, (0, n_samples - len(segment)), mode='constant')
-            corr = np.correlate(y, segment, mode='full')
-            lag = np.argmax(corr) - (n_samples - 1)
-            delta_sec = lag / sr
-            refined_offset = best_offset + delta_sec
-            norm_corr = corr.max() / np.sqrt(np.dot(y, y) * np.dot(segment, segment))
-            corr_confidence = round(norm_corr * 100, 2)
-        except Exception as e:
-            logger.warning(f"Refinement failed: {e}")
-
-        # Лог и возврат
-        logger.info(
-            f"[match] movie_id={movie_id}, raw_offset={best_offset}s, score={match_score}, "
-            f"raw_confidence={raw_confidence}%, refined_offset={refined_offset}s, "
-            f"corr_confidence={corr_confidence}%"
-        )
+            if fragment_path and os.path.exists(fragment_path) and fragment_path.startswith(MEDIA_DIR):
+                os.remove(fragment_path)
+        except Exception:
+            logger.warning(f"Cannot delete temp file {fragment_path}")
 
-        # Проверка валидности
-        track_duration = getattr(track, 'duration', None)
-        if track_duration is not None:
-            valid_offset = 0 <= refined_offset <= (track_duration - fragment_duration)
-        else:
-            valid_offset = True
-
-        return {
-            "audio_track": {"id": track.id, "language": track.language},
-            "match": {
-                "raw_offset": float(best_offset),
-                "raw_confidence": raw_confidence,
-                "refined_offset": float(refined_offset),
-                "corr_confidence": corr_confidence,
-                "score": int(match_score),
-                "total_checked": total_checked,
-                "valid_offset": valid_offset
-            }
+
+@router.get("/match/profile")
+async def match_profile(movie_id: int, language: str, db: AsyncSession = Depends(get_async_db)):
+    """
+    Версия и параметры профиля дорожки: по ним клиент строит хеши для /match/hashes.
+    """
+    track = await _find_track(db, movie_id, language)
+    profile = get_profile(track.fingerprint_profile)
+    return {
+        "audio_track": {"id": track.id, "language": track.language},
+        "fingerprint_profile": profile.version,
+        "name": profile.name,
+        "sample_rate": profile.sample_rate,
+    }
+
+
+@router.post("/match/hashes")
+async def match_hashes(
+    request: Request,
+    movie_id: int,
+    language: str,
+    offset_hint: float | None = None,
+    window: float | None = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Сопоставление по хешам, построенным на клиенте (клиентский пакет в client/).
+
+    Тело — бинарный пакет пар (hash, t1) (см. app.utils.hash_payload): килобайты вместо
+    мегабайт аудио, без сохранения файла, ffmpeg и построения хешей на сервере. Хеши
+    должны быть посчитаны профилем дорожки (GET /match/profile), иначе 409. Сигнала
+    нет, поэтому уточнения кросс-корреляцией нет: refined_offset равен raw_offset.
+    offset_hint и window — как у /match/audio.
+    """
+    window = _check_hint(offset_hint, window)
+    max_bytes = HEADER.size + settings.MATCH_HASHES_MAX * RECORD.itemsize
+    try:
+        content_length = int(request.headers.get("content-length") or 0)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Некорректный Content-Length")
+    if content_length > max_bytes:
+        raise HTTPException(status_code=413, detail=f"Слишком много хешей (максимум {settings.MATCH_HASHES_MAX})")
+    body = bytearray()
+    with timed("receive"):
+        async for chunk in request.stream():
+            body += chunk
+            if len(body) > max_bytes:
+                raise HTTPException(status_code=413, detail=f"Слишком много хешей (максимум {settings.MATCH_HASHES_MAX})")
+    try:
+        profile_version, fragment_duration, hashes = decode_hashes(bytes(body), settings.MATCH_HASHES_MAX)
+    except PayloadError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    track = await _find_track(db, movie_id, language)
+    if profile_version != track.fingerprint_profile:
+        raise HTTPException(status_code=409, detail={
+            "message": "Хеши посчитаны другим профилем отпечатков",
+            "fingerprint_profile": track.fingerprint_profile,
+        })
+    profile = get_profile(track.fingerprint_profile)
+    annotate_profile(movie_id=movie_id, language=language, track_id=track.id, fingerprint_profile=profile.name,
+                     fragment_duration=round(fragment_duration, 2), hash_count=len(hashes))
+
+    hint = hint_range(offset_hint, window, fragment_duration) if window is not None else None
+    voter, hashes = await _vote_hashes(db, track, profile, hashes, hint)
+    hint_used = voter.offset_range is not None
+    best_offset, match_score, raw_confidence = pick_best_offset(voter.counts, voter.used)
+    logger.info(
+        f"[match/hashes] movie_id={movie_id}, raw_offset={best_offset}s, score={match_score}, "
+        f"raw_confidence={raw_confidence}%, rounds={voter.rounds}, hashes_used={voter.used}/{len(hashes)}, "
+        f"hint_used={hint_used}"
+    )
+
+    track_duration = getattr(track, 'duration', None)
+    if track_duration is not None:
+        valid_offset = bool(0 <= best_offset <= (track_duration - fragment_duration))
+    else:
+        valid_offset = True
+
+    return {
+        "audio_track": {"id": track.id, "language": track.language},
+        "match": {
+            "raw_offset": float(best_offset),
+            "raw_confidence": raw_confidence,
+            "refined_offset": float(best_offset),
+            "corr_confidence": None,
+            "score": int(match_score),
+            "total_checked": voter.used,
+            "total_hashes": len(hashes),
+            "valid_offset": valid_offset,
+            "hint_used": hint_used
         }
+    }
+
+
+def _save_batch_upload(upload: UploadFile) -> str:
+    """
+    Сохраняет загруженный файл пакета, сохраняя расширение (WAV не нужно перекодировать).
+    """
+    ext = os.path.splitext(upload.filename or "")[1].lower()
+    path = os.path.join(MEDIA_DIR, f"frag_batch_{uuid.uuid4().hex}{ext}")
+    return write_upload(upload, path, settings.UPLOAD_MAX_BATCH_BYTES).path
+
+
+def _extract_batch_archive(archive_path: str, max_clips: int, max_bytes: int):
+    """
+    Распаковывает фрагменты из zip-архива в MEDIA_DIR (без вложенных путей).
+
+    Returns:
+        list[tuple[str, str]]: Пары (имя в архиве, путь к файлу).
+    """
+    try:
+        with zipfile.ZipFile(archive_path) as zf:
+            members = [
+                m for m in zf.infolist()
+                if not m.is_dir() and not os.path.basename(m.filename).startswith(".")
+            ]
+            if len(members) > max_clips:
+                raise HTTPException(status_code=400, detail=f"Слишком много фрагментов в архиве (максимум {max_clips})")
+            if sum(m.file_size for m in members) > max_bytes:
+                raise HTTPException(status_code=413, detail="Архив слишком большой")
+
+            clips = []
+            try:
+                for member in members:
+                    ext = os.path.splitext(member.filename)[1].lower()
+                    path = os.path.join(MEDIA_DIR, f"frag_batch_{uuid.uuid4().hex}{ext}")
+                    clips.append((member.filename, path))
+                    with zf.open(member) as src, open(path, "wb") as dst:
+                        shutil.copyfileobj(src, dst)
+            except Exception:
+                for _, path in clips:
+                    if os.path.exists(path):
+                        os.remove(path)
+                raise
+            return clips
+    except zipfile.BadZipFile:
+        raise HTTPException(status_code=400, detail="Некорректный zip-архив")
+
+
+@router.post("/match/batch")
+async def match_batch(
+    files: list[UploadFile] = File(default=[]),
+    archive: UploadFile | None = File(None),
+    movie_id: int = Form(...),
+    languages: str | None = Form(None),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Сопоставляет пакет фрагментов (несколько файлов и/или zip-архив) с аудиодорожками фильма.
+
+    Фрагменты декодируются и хешируются параллельно, отпечатки всех дорожек загружаются
+    одним сгруппированным запросом по объединению хешей, голосование идёт для каждого
+    фрагмента отдельно. Если дорожки проиндексированы разными профилями отпечатков,
+    фрагмент хешируется для каждого профиля, а запрос идёт отдельно по дорожкам каждого
+    профиля. Если languages (через запятую) не задан, используются все дорожки фильма.
+    Ошибка одного фрагмента не прерывает пакет и возвращается в его результате.
+    """
+    clips = []
+    archive_path = None
+    try:
+        os.makedirs(MEDIA_DIR, exist_ok=True)
+        with timed("save"):
+            for upload in files:
+                clips.append({"clip": upload.filename, "path": await run_in_threadpool(_save_batch_upload, upload)})
+            if archive is not None:
+                archive_path = await run_in_threadpool(_save_batch_upload, archive)
+                extracted = await run_in_threadpool(
+                    _extract_batch_archive, archive_path,
+                    settings.MATCH_BATCH_MAX_CLIPS, settings.MATCH_BATCH_MAX_ARCHIVE_BYTES,
+                )
+                clips.extend({"clip": name, "path": path} for name, path in extracted)
+        if not clips:
+            raise HTTPException(status_code=400, detail="Не переданы фрагменты")
+        if len(clips) > settings.MATCH_BATCH_MAX_CLIPS:
+            raise HTTPException(status_code=400, detail=f"Слишком много фрагментов (максимум {settings.MATCH_BATCH_MAX_CLIPS})")
+
+        # Дорожки фильма
+        with timed("db_track"):
+            query = select(AudioTrack).where(AudioTrack.movie_id == movie_id)
+            language_list = [l.strip() for l in (languages or "").split(",") if l.strip()]
+            if language_list:
+                query = query.where(or_(*(AudioTrack.language.ilike(l) for l in language_list)))
+            tracks = (await db.execute(query)).scalars().all()
+        if not tracks:
+            raise HTTPException(status_code=404, detail=f"Аудиодорожки не найдены для фильма {movie_id}")
+
+        # Профили отпечатков дорожек
+        profiles = {}
+        for track in tracks:
+            profiles.setdefault(track.fingerprint_profile, get_profile(track.fingerprint_profile))
+
+        # Параллельное декодирование и хеширование
+        semaphore = asyncio.Semaphore(settings.MATCH_BATCH_DECODE_CONCURRENCY)
+
+        async def prepare(clip):
+            async with semaphore:
+                try:
+                    y, sr, duration, hashes = await run_in_threadpool(
+                        _fingerprint_fragment_profiles, clip["path"], list(profiles.values())
+                    )
+                except DecoderBusy:
+                    clip["error"] = "Сервер перегружен, повторите позже"
+                    return
+                except Exception as e:
+                    logger.warning(f"Batch clip {clip['clip']} failed: {e}")
+                    clip["error"] = "Не удалось декодировать фрагмент"
+                    return
+                clip.update(y=y, sr=sr, duration=duration, hashes=hashes)
+
+        await asyncio.gather(*(prepare(clip) for clip in clips))
+        for version in profiles:
+            stop_hashes = await get_stop_hashes_async(
+                db, version, settings.FINGERPRINT_MAX_DOC_FREQ, settings.FINGERPRINT_DOC_FREQ_MIN_TRACKS
+            )
+            if stop_hashes:
+                for clip in clips:
+                    if version in clip.get("hashes", {}):
+                        clip["hashes"][version] = [(h, t1) for h, t1 in clip["hashes"][version] if h not in stop_hashes]
+        # Порог проверяется после отсечения стоп-хешей, как в /match/audio
+        for clip in clips:
+            if "hashes" in clip and max(len(h) for h in clip["hashes"].values()) < MIN_FRAGMENT_HASHES:
+                clip["error"] = "Недостаточно хешей для анализа (<5)"
+        ready = [clip for clip in clips if "error" not in clip]
+        annotate_profile(movie_id=movie_id, clip_count=len(clips), track_count=len(tracks),
+                         hash_count=sum(len(h) for c in ready for h in c["hashes"].values()))
+
+        # Один сгруппированный запрос отпечатков на профиль (IN-список режется на куски)
+        rows = []
+        if ready:
+            chunk = settings.MATCH_BATCH_LOOKUP_CHUNK
+            for version, profile in profiles.items():
+                unique_hashes = sorted({h for clip in ready for h, _ in clip["hashes"][version]})
+                track_ids = [track.id for track in tracks if track.fingerprint_profile == version]
+                with timed("db_fingerprints"):
+                    for i in range(0, len(unique_hashes), chunk):
+                        result = await db.execute(
+                            batch_fingerprint_query(track_ids, unique_hashes[i:i + chunk], version)
+                        )
+                        rows.extend(result.all())
+        by_track = group_fingerprints_by_track(rows)
+
+        # Голосование по каждому фрагменту, лучшая дорожка — по числу голосов
+        for clip in ready:
+            best = None
+            for track in tracks:
+                fps_dict = by_track.get(track.id)
+                if not fps_dict:
+                    continue
+                hashes = clip["hashes"][track.fingerprint_profile]
+                counts = vote_offsets(hashes, fps_dict, max_offsets=settings.MATCH_MAX_OFFSETS_PER_HASH)
+                if not counts:
+                    continue
+                candidate = pick_best_offset(counts, len(hashes))
+                if best is None or candidate[1] > best[1][1]:
+                    best = (track, candidate)
+            if best is None:
+                clip["error"] = "Совпадений не найдено"
+            else:
+                clip["track"], (clip["raw_offset"], clip["score"], clip["raw_confidence"]) = best
+
+        # Уточнение смещений параллельно
+        async def refine(clip):
+            clip["refined_offset"], clip["corr_confidence"] = clip["raw_offset"], None
+            async with semaphore:
+                try:
+                    clip["refined_offset"], clip["corr_confidence"] = await run_in_threadpool(
+                        _refine, clip["y"], clip["sr"], clip["track"].id, clip["track"].track_path,
+                        clip["raw_offset"]
+                    )
+                except Exception as e:
+                    logger.warning(f"Refinement failed for batch clip {clip['clip']}: {e}")
+
+        await asyncio.gather(*(refine(clip) for clip in ready if "error" not in clip))
+
+        results = []
+        for clip in clips:
+            if "error" in clip:
+                results.append({"clip": clip["clip"], "error": clip["error"]})
+                continue
+            track = clip["track"]
+            track_duration = getattr(track, 'duration', None)
+            if track_duration is not None:
+                valid_offset = bool(0 <= clip["refined_offset"] <= (track_duration - clip["duration"]))
+            else:
+                valid_offset = True
+            results.append({
+                "clip": clip["clip"],
+                "audio_track": {"id": track.id, "language": track.language},
+                "match": {
+                    "raw_offset": float(clip["raw_offset"]),
+                    "raw_confidence": clip["raw_confidence"],
+                    "refined_offset": float(clip["refined_offset"]),
+                    "corr_confidence": clip["corr_confidence"],
+                    "score": int(clip["score"]),
+                    "total_checked": len(clip["hashes"][track.fingerprint_profile]),
+                    "valid_offset": valid_offset
+                }
+            })
+
+        logger.info(
+            f"[match-batch] movie_id={movie_id}, clips={len(clips)}, tracks={len(tracks)}, "
+            f"matched={sum('match' in r for r in results)}"
+        )
+        return {"movie_id": movie_id, "results": results}
     finally:
         # Удаление временных файлов
-        for path in (fragment_path, audio_path):
+        paths = [archive_path] + [clip.get("path") for clip in clips]
+        for path in paths:
             try:
                 if path and os.path.exists(path) and path.startswith(MEDIA_DIR):
                     os.remove(path)
             except Exception:
-                logger.warning(f"Cannot delete temp file {path}")
\ No newline at end of file
+                logger.warning(f"Cannot delete temp file {path}")
+
+
+async def _live_lookup(track_id, profile, hashes):
+    """
+    Отпечатки дорожки для хешей живого потока: сначала общий кэш, затем один запрос на недостающие.
+    """
+    fps_dict, missing = {}, set()
+    for h, _ in hashes:
+        offsets = _live_lookup_cache.get((track_id, profile, h))
+        if offsets is None:
+            missing.add(h)
+        else:
+            fps_dict[h] = offsets
+    if missing:
+        with timed("db_fingerprints", pipeline="live"):
+            async with AsyncSessionLocal() as db:
+                result = await db.execute(batch_fingerprint_query([track_id], list(missing), profile))
+                found = group_fingerprints((h, off) for _, h, off in result.all())
+        for h in missing:
+            fps_dict[h] = found.get(h, [])
+            _live_lookup_cache.set((track_id, profile, h), fps_dict[h])
+    return fps_dict
+
+
+@router.websocket("/match/live")
+async def match_live(websocket: WebSocket, movie_id: int, language: str, sample_rate: int = FRAGMENT_SAMPLE_RATE):
+    """
+    Потоковое сопоставление: клиент шлёт бинарные кадры PCM s16le моно, сервер отвечает
+    JSON-событиями "match" (смещение начала потока в дорожке и текущая позиция)
+    и "lost" (захват потерян). Соединение с БД берётся только на время запроса отпечатков.
+    """
+    await websocket.accept()
+    if sample_rate != FRAGMENT_SAMPLE_RATE:
+        await websocket.close(code=1003, reason=f"Поддерживается только PCM s16le {FRAGMENT_SAMPLE_RATE} Гц")
+        return
+
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            select(AudioTrack)
+              .where(AudioTrack.movie_id == movie_id)
+              .where(AudioTrack.language.ilike(language))
+              .limit(1)
+        )
+        track = result.scalars().first()
+    if not track:
+        await websocket.close(code=1008, reason="Аудиодорожка не найдена")
+        return
+    await websocket.send_json({"type": "ready", "audio_track": {"id": track.id, "language": track.language}})
+
+    matcher = LiveMatcher(
+        sample_rate,
+        step_seconds=settings.LIVE_STEP_SECONDS,
+        window_seconds=settings.LIVE_WINDOW_SECONDS,
+        min_votes=settings.LIVE_MIN_VOTES,
+        min_margin=settings.LIVE_MIN_MARGIN,
+        update_interval=settings.LIVE_UPDATE_INTERVAL_SECONDS,
+        max_offsets=settings.MATCH_MAX_OFFSETS_PER_HASH,
+        profile=get_profile(track.fingerprint_profile),
+    )
+    pending = b""
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            data = message.get("bytes")
+            if not data:
+                continue
+            if len(data) > settings.LIVE_MAX_FRAME_BYTES:
+                await websocket.close(code=1009, reason="Слишком большой кадр")
+                break
+
+            # Кадр может оборваться посреди отсчёта: хвост переносится в следующий
+            data = pending + data
+            usable = len(data) // 2 * 2
+            pending = data[usable:]
+            samples = np.frombuffer(data[:usable], dtype="<i2").astype(np.float32) / 32768.0
+
+            hashes = await run_in_threadpool(matcher.process, samples)
+            if not hashes:
+                continue
+            fps_dict = await _live_lookup(track.id, track.fingerprint_profile, hashes)
+            with timed("voting", pipeline="live"):
+                event = matcher.vote(hashes, fps_dict)
+            if event:
+                await websocket.send_json(event)
+    except WebSocketDisconnect:
+        pass
+    logger.info(
+        f"[match-live] movie_id={movie_id}, track_id={track.id}, "
+        f"stream_time={matcher.extractor.stream_time:.1f}s, locked_offset={matcher.locked_offset}"
+    )
@@ -0,0 +1,15 @@
+from fastapi import APIRouter
+from fastapi.responses import Response
+
+from app.utils.metrics import render_metrics
+
+router = APIRouter(tags=["metrics"])
+
+
+@router.get("/metrics", include_in_schema=False)
+def metrics():
+    """
+    Метрики в текстовом формате Prometheus.
+    """
+    payload, content_type = render_metrics()
+    return Response(content=payload, media_type=content_type)
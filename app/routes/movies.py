@@ -1,17 +1,10 @@
 from fastapi import APIRouter, Depends
 from sqlalchemy.orm import Session
-from app.database import SessionLocal
+from app.database import get_db
 from app import models
 
 router = APIRouter(prefix="/movies", tags=["movies"])
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 @router.get("/")
 def list_movies(db: Session = Depends(get_db)):
     movies = db.query(models.Movie).all()
@@ -0,0 +1,52 @@
+from fastapi import APIRouter, Request, Form, Depends, status
+
+from app.admin_auth import require_admin_session
+from app.utils.admission import request_content_length
+from app.utils.uploads import resumable_uploads
+
+router = APIRouter(prefix="/admin/uploads", tags=["admin"], dependencies=[Depends(require_admin_session)])
+
+
+@router.post("", status_code=status.HTTP_201_CREATED)
+def create_upload(
+    filename: str = Form(...),
+    size: int = Form(...),
+    sha256: str | None = Form(None),
+):
+    """
+    Объявляет возобновляемую загрузку большого файла (дорожки или фильма).
+
+    Части отправляются PUT /admin/uploads/{upload_id}?offset=N сырым телом запроса;
+    готовый файл передаётся в /admin/audio-track/new (upload_id) или
+    /admin/upload_video (video_upload_id).
+
+    Args:
+        filename (str): Имя файла (по расширению ffmpeg определяет формат).
+        size (int): Размер файла (байт).
+        sha256 (str | None): Ожидаемый SHA-256, сверяется после получения файла.
+    """
+    return resumable_uploads.create(filename, size, sha256)
+
+
+@router.get("/{upload_id}")
+def upload_status(upload_id: str):
+    """
+    Состояние загрузки: offset — с какого байта продолжать.
+    """
+    return resumable_uploads.status(upload_id)
+
+
+@router.put("/{upload_id}")
+async def upload_chunk(upload_id: str, offset: int, request: Request):
+    """
+    Дописывает часть файла с позиции offset; тело пишется в файл по мере получения.
+    """
+    return await resumable_uploads.append(upload_id, offset, request.stream(), request_content_length(request.scope))
+
+
+@router.delete("/{upload_id}", status_code=status.HTTP_204_NO_CONTENT)
+def abort_upload(upload_id: str):
+    """
+    Отменяет загрузку и удаляет полученные данные.
+    """
+    resumable_uploads.abort(upload_id)
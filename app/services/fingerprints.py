@@ -0,0 +1,236 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+
+from sqlalchemy import delete, insert, update
+
+from app.config import settings
+from app.models import AudioTrack, AudioFingerprint
+from app.utils.audio import decoder_pool, probe_audio_streams
+from app.utils.hash_stats import (
+    count_track_hashes,
+    update_hash_stats,
+    get_stop_hashes,
+    prune_hashes,
+    record_pruned_hashes,
+    remove_hash_stats,
+    hash_stat_profiles,
+)
+from app.utils.matching import fingerprint_track
+from app.utils.metrics import timed
+from app.utils.pcm_cache import track_pcm_cache
+from app.utils.profiles import get_profile
+
+logger = logging.getLogger("app.services.fingerprints")
+
+INSERT_CHUNK = 10000
+MIN_TRACK_DURATION = 0.5
+MIN_TRACK_HASHES = 5
+
+
+class FingerprintingError(Exception):
+    """Дорожку нельзя проиндексировать: пустой сигнал, слишком короткая запись или мало хешей."""
+
+
+@dataclass
+class TrackFingerprints:
+    """
+    Результат CPU-части индексации одной дорожки (передаётся из рабочих процессов).
+    """
+    track_id: int | None
+    profile: int
+    duration: float
+    peak_count: int
+    hashes: list[tuple[str, float]]
+
+
+def fingerprint_signal(y, sr, profile_version: int, track_id: int | None = None) -> TrackFingerprints:
+    """
+    Строит отпечатки сигнала дорожки и, если известен track_id, её PCM-кэш для уточнения.
+
+    Raises:
+        FingerprintingError: Сигнал пустой, короче MIN_TRACK_DURATION или дал меньше MIN_TRACK_HASHES хешей.
+    """
+    if y is None or len(y) == 0:
+        raise FingerprintingError("Ошибка чтения аудиофайла: пустой сигнал")
+    duration = len(y) / sr
+    if duration < MIN_TRACK_DURATION:
+        raise FingerprintingError(f"Аудиодорожка слишком короткая (<{MIN_TRACK_DURATION} сек)")
+
+    if track_id is not None:
+        with timed("pcm_cache", pipeline="ingest"):
+            track_pcm_cache.build(track_id, y, sr)
+
+    peaks, hashes = fingerprint_track(y, sr, get_profile(profile_version))
+    if len(hashes) < MIN_TRACK_HASHES:
+        raise FingerprintingError(f"Слишком мало хешей для анализа (<{MIN_TRACK_HASHES})")
+    return TrackFingerprints(track_id, profile_version, duration, len(peaks), hashes)
+
+
+def fingerprint_audio_file(audio_path: str, profile_version: int, track_id: int | None = None) -> TrackFingerprints:
+    """
+    Декодирует файл дорожки и строит её отпечатки. Функция верхнего уровня без обращений
+    к БД, поэтому подходит для ProcessPoolExecutor.
+
+    Raises:
+        DecodeError: Файл не удалось декодировать.
+        FingerprintingError: См. fingerprint_signal.
+    """
+    profile = get_profile(profile_version)
+    with timed("load", pipeline="ingest"):
+        y = decoder_pool.load(audio_path, profile.sample_rate)
+    return fingerprint_signal(y, profile.sample_rate, profile_version, track_id)
+
+
+@dataclass
+class StreamIngestResult:
+    """
+    Итог индексации одного аудиопотока контейнера: дорожка или ошибка.
+    """
+    stream_index: int
+    language: str
+    track_id: int | None = None
+    track_path: str | None = None
+    duration: float | None = None
+    hashes_saved: int = 0
+    hashes_dropped: int = 0
+    error: str | None = None
+
+
+def ingest_audio_streams(db, movie_id: int, media_path: str, output_dir: str,
+                         default_language: str, profile_version: int) -> list[StreamIngestResult]:
+    """
+    Создаёт по дорожке на каждый аудиопоток файла (например, дубляжи в одном контейнере).
+
+    Все потоки извлекаются одним проходом ffmpeg в моно WAV, дорожки получают язык
+    из тега потока (потоки без тега — default_language) и хешируются параллельно
+    в потоках; отпечатки пишутся в БД последовательно из вызывающего потока.
+    Дорожка, которую не удалось проиндексировать, удаляется, остальные сохраняются.
+
+    Args:
+        db (Session): Синхронная сессия.
+        movie_id (int): ID фильма.
+        media_path (str): Загруженный видео- или аудиофайл.
+        output_dir (str): Каталог для извлечённых WAV.
+        default_language (str): Язык потоков без тега.
+        profile_version (int): Версия профиля отпечатков.
+
+    Returns:
+        list[StreamIngestResult]: Итоги в порядке потоков.
+
+    Raises:
+        DecodeError: Файл не удалось разобрать или декодировать.
+        FingerprintingError: В файле нет аудиопотоков.
+    """
+    streams = probe_audio_streams(media_path)
+    if not streams:
+        raise FingerprintingError("В файле нет аудиопотоков")
+    with timed("decode", pipeline="ingest"):
+        audio_paths = decoder_pool.extract_streams(media_path, streams, output_dir)
+
+    tracks = [
+        AudioTrack(movie_id=movie_id, language=stream.language or default_language, track_path=audio_path,
+                   fingerprint_profile=profile_version)
+        for stream, audio_path in zip(streams, audio_paths)
+    ]
+    db.add_all(tracks)
+    db.commit()
+
+    results = []
+    workers = min(len(tracks), os.cpu_count() or 1)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(fingerprint_audio_file, track.track_path, profile_version, track.id): (stream, track)
+            for stream, track in zip(streams, tracks)
+        }
+        for future in as_completed(futures):
+            stream, track = futures[future]
+            result = StreamIngestResult(stream.index, track.language, track.id, track.track_path)
+            try:
+                fingerprints = future.result()
+                result.hashes_saved = store_fingerprints(db, track.id, fingerprints.hashes, profile_version)
+                result.hashes_dropped = len(fingerprints.hashes) - result.hashes_saved
+                result.duration = track.duration = fingerprints.duration
+                db.commit()
+            except Exception as e:
+                db.rollback()
+                logger.warning("Поток %d (%s) не проиндексирован: %s", stream.index, track.language, e)
+                db.delete(track)
+                db.commit()
+                track_pcm_cache.remove(result.track_id)
+                if os.path.exists(track.track_path):
+                    os.remove(track.track_path)
+                result.track_id, result.track_path, result.error = None, None, str(e)
+            results.append(result)
+    return sorted(results, key=lambda r: r.stream_index)
+
+
+def store_fingerprints(db, track_id: int, hashes, profile_version: int) -> int:
+    """
+    Записывает отпечатки дорожки для версии профиля (без commit).
+
+    Строки этой же версии, оставшиеся от прерванного запуска, сначала удаляются
+    вместе с их вкладом в hash_stats.
+    Статистика hash_stats версии пополняется по всем хешам, затем частые хеши отсекаются
+    (и запоминаются в pruned_hashes, чтобы вклад дорожки можно было вычесть).
+
+    Args:
+        db (Session): Синхронная сессия.
+        track_id (int): ID аудиодорожки.
+        hashes (list[tuple[str, float]]): Хеши (hash, t1).
+        profile_version (int): Версия профиля, которой посчитаны хеши.
+
+    Returns:
+        int: Число сохранённых строк.
+    """
+    remove_hash_stats(db, track_id, [profile_version])
+    db.execute(
+        delete(AudioFingerprint)
+          .where(AudioFingerprint.audio_track_id == track_id)
+          .where(AudioFingerprint.profile == profile_version)
+    )
+
+    counts = count_track_hashes(hashes)
+    with timed("hash_stats", pipeline="ingest"):
+        update_hash_stats(db, profile_version, counts)
+        stop_hashes = get_stop_hashes(
+            db, profile_version, settings.FINGERPRINT_MAX_DOC_FREQ, settings.FINGERPRINT_DOC_FREQ_MIN_TRACKS
+        )
+    kept = prune_hashes(hashes, counts, settings.FINGERPRINT_MAX_HASH_OCCURRENCES, stop_hashes)
+    record_pruned_hashes(db, track_id, profile_version, counts, kept)
+    logger.info("Дорожка %d: отброшено частых хешей %d из %d", track_id, len(hashes) - len(kept), len(hashes))
+
+    with timed("db_insert", pipeline="ingest"):
+        for i in range(0, len(kept), INSERT_CHUNK):
+            db.execute(
+                insert(AudioFingerprint),
+                [
+                    {"audio_track_id": track_id, "hash": h, "offset": t1, "profile": profile_version}
+                    for h, t1 in kept[i:i + INSERT_CHUNK]
+                ],
+            )
+    return len(kept)
+
+
+def activate_profile(db, track_id: int, profile_version: int) -> int:
+    """
+    Переключает дорожку на отпечатки другой версии профиля и удаляет отпечатки прежних версий.
+
+    Переключение — один UPDATE в отдельной транзакции: до commit поиск видит старые
+    отпечатки, после — новые. Старые строки удаляются уже после переключения,
+    их вклад вычитается из hash_stats в той же транзакции.
+
+    Returns:
+        int: Число удалённых строк прежних версий.
+    """
+    db.execute(update(AudioTrack).where(AudioTrack.id == track_id).values(fingerprint_profile=profile_version))
+    db.commit()
+    remove_hash_stats(db, track_id, [p for p in hash_stat_profiles(db, track_id) if p != profile_version])
+    result = db.execute(
+        delete(AudioFingerprint)
+          .where(AudioFingerprint.audio_track_id == track_id)
+          .where(AudioFingerprint.profile != profile_version)
+    )
+    db.commit()
+    return result.rowcount
@@ -0,0 +1,89 @@
+import os
+import uuid
+import logging
+
+from fastapi import HTTPException
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.models import Movie, Genre, Country, Actor, Director
+from app.utils.uploads import save_upload
+
+logger = logging.getLogger("app.services.movies")
+
+POSTERS_DIR = "media/posters"
+
+
+async def save_poster(poster) -> str | None:
+    """
+    Потоково сохраняет загруженный постер на диск под случайным именем
+    (не больше UPLOAD_MAX_POSTER_BYTES, иначе HTTPException 413).
+
+    Args:
+        poster (UploadFile | None): Файл постера из формы.
+
+    Returns:
+        str | None: Путь к сохранённому постеру или None, если файл не передан.
+    """
+    if poster is None or not getattr(poster, "filename", None):
+        return None
+
+    os.makedirs(POSTERS_DIR, exist_ok=True)
+    ext = os.path.splitext(poster.filename)[1]
+    poster_path = os.path.join(POSTERS_DIR, f"{uuid.uuid4().hex}{ext}")
+    await save_upload(poster, poster_path, settings.UPLOAD_MAX_POSTER_BYTES)
+    return poster_path
+
+
+async def _load_by_ids(db: AsyncSession, model, ids) -> list:
+    if not ids:
+        return []
+    return list((await db.execute(select(model).where(model.id.in_(ids)))).scalars().all())
+
+
+async def create_movie(
+    db: AsyncSession,
+    *,
+    title: str,
+    description: str | None = None,
+    age_rating: str | None = None,
+    genre_ids=(),
+    country_ids=(),
+    actor_ids=(),
+    director_ids=(),
+    poster=None,
+) -> Movie:
+    """
+    Создаёт фильм со связями и постером. Общая логика для формы админки и sqladmin.
+
+    Raises:
+        HTTPException: 400, если фильм с таким названием уже существует.
+    """
+    existing_movie = (await db.execute(select(Movie).filter_by(title=title))).scalars().first()
+    if existing_movie:
+        raise HTTPException(status_code=400, detail="Фильм с таким названием уже существует")
+
+    poster_url = await save_poster(poster)
+
+    movie = Movie(
+        title=title,
+        description=description,
+        age_rating=age_rating,
+        poster_url=poster_url,
+        genres=await _load_by_ids(db, Genre, genre_ids),
+        countries=await _load_by_ids(db, Country, country_ids),
+        actors=await _load_by_ids(db, Actor, actor_ids),
+        directors=await _load_by_ids(db, Director, director_ids),
+    )
+    db.add(movie)
+    try:
+        await db.commit()
+    except Exception:
+        await db.rollback()
+        if poster_url and os.path.exists(poster_url):
+            os.remove(poster_url)
+        raise
+
+    logger.info("Создан фильм id=%s, title=%s", movie.id, title)
+    return movie
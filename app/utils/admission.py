@@ -0,0 +1,193 @@
+import time
+import asyncio
+from collections import deque
+
+from starlette.responses import JSONResponse
+
+from app.utils.metrics import (
+    add_server_timing,
+    ADMISSION_QUEUE_WAIT,
+    ADMISSION_IN_FLIGHT,
+    ADMISSION_QUEUED,
+    ADMISSION_RESERVED_BYTES,
+    ADMISSION_REJECTED,
+)
+
+
+class AdmissionRejected(Exception):
+    """
+    Запрос не допущен: очередь заполнена (queue_full) или ожидание истекло (timeout).
+    """
+
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class AdmissionController:
+    """
+    Допуск тяжёлых запросов: не больше max_concurrency одновременно и не больше
+    memory_budget байт оценённой памяти на всех.
+
+    Память запроса оценивается по размеру тела (Content-Length × memory_factor, но не меньше
+    min_request_bytes): фрагмент держит в памяти PCM, спектрограмму и списки хешей,
+    и всё это растёт с длиной загрузки. Запрос дороже всего бюджета допускается,
+    только когда больше ничего не выполняется.
+
+    Не поместившиеся запросы ждут в очереди FIFO длиной до max_queue не дольше
+    queue_timeout; сверх этого запрос сразу отклоняется (AdmissionRejected), чтобы
+    при всплеске нагрузки отвечать 503 быстро, а не копить задержку у всех.
+
+    Контроллер работает в одном event loop и не потокобезопасен.
+
+    Args:
+        max_concurrency (int): Предел одновременно выполняемых запросов.
+        max_queue (int): Предел ожидающих запросов.
+        queue_timeout (float): Предельное ожидание допуска (сек).
+        memory_budget (int): Бюджет оценённой памяти (байт).
+        memory_factor (float): Байт памяти на байт тела запроса.
+        min_request_bytes (int): Минимальная оценка памяти запроса (байт).
+    """
+
+    def __init__(self, max_concurrency: int, max_queue: int, queue_timeout: float,
+                 memory_budget: int, memory_factor: float = 4.0, min_request_bytes: int = 0):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.memory_budget = memory_budget
+        self.memory_factor = memory_factor
+        self.min_request_bytes = min_request_bytes
+        self.in_flight = 0
+        self.reserved = 0
+        self._waiters = deque()
+
+    def estimate(self, content_length: int | None) -> int:
+        """
+        Оценка памяти запроса (байт) по размеру тела.
+        """
+        return max(self.min_request_bytes, int((content_length or 0) * self.memory_factor))
+
+    def _fits(self, cost: int) -> bool:
+        if self.in_flight >= self.max_concurrency:
+            return False
+        return self.in_flight == 0 or self.reserved + cost <= self.memory_budget
+
+    def _admit(self, cost: int) -> None:
+        self.in_flight += 1
+        self.reserved += cost
+        ADMISSION_IN_FLIGHT.set(self.in_flight)
+        ADMISSION_RESERVED_BYTES.set(self.reserved)
+
+    def _wake(self) -> None:
+        # Строго по очереди: запрос за «тяжёлым» первым не обгоняет его
+        while self._waiters:
+            future, cost = self._waiters[0]
+            if future.done():
+                self._waiters.popleft()
+                continue
+            if not self._fits(cost):
+                break
+            self._waiters.popleft()
+            self._admit(cost)
+            future.set_result(None)
+        ADMISSION_QUEUED.set(len(self._waiters))
+
+    async def acquire(self, cost: int) -> float:
+        """
+        Ждёт допуска запроса стоимостью cost байт.
+
+        Returns:
+            float: Время ожидания в очереди (сек).
+
+        Raises:
+            AdmissionRejected: Очередь заполнена или ожидание истекло.
+        """
+        if not self._waiters and self._fits(cost):
+            self._admit(cost)
+            return 0.0
+        if len(self._waiters) >= self.max_queue:
+            raise AdmissionRejected("queue_full")
+
+        started = time.perf_counter()
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append((future, cost))
+        ADMISSION_QUEUED.set(len(self._waiters))
+        try:
+            await asyncio.wait_for(future, self.queue_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if future.done() and not future.cancelled():
+                # Допуск пришёл одновременно с таймаутом или отменой: слот возвращается
+                self.release(cost)
+            else:
+                self._wake()
+            if isinstance(e, asyncio.TimeoutError):
+                raise AdmissionRejected("timeout") from None
+            raise
+        return time.perf_counter() - started
+
+    def release(self, cost: int) -> None:
+        self.in_flight -= 1
+        self.reserved -= cost
+        ADMISSION_IN_FLIGHT.set(self.in_flight)
+        ADMISSION_RESERVED_BYTES.set(self.reserved)
+        self._wake()
+
+
+class AdmissionMiddleware:
+    """
+    ASGI-middleware допуска запросов (см. AdmissionController) для POST на пути paths.
+
+    Отклонённый запрос получает 503 с Retry-After, тело при этом не читается.
+    Ожидание в очереди пишется в метрику vmm_admission_queue_wait_seconds и
+    в Server-Timing (стадия admission).
+
+    Args:
+        controller (AdmissionController): Общий контроллер для всех путей.
+        paths (list[str]): Пути, к которым применяется допуск.
+        retry_after (int): Значение Retry-After при отказе (сек).
+    """
+
+    def __init__(self, app, controller: AdmissionController, paths, retry_after: int = 2):
+        self.app = app
+        self.controller = controller
+        self.paths = frozenset(paths)
+        self.retry_after = retry_after
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        route = scope["path"]
+        cost = self.controller.estimate(request_content_length(scope))
+        try:
+            waited = await self.controller.acquire(cost)
+        except AdmissionRejected as e:
+            ADMISSION_REJECTED.labels(route, e.reason).inc()
+            response = JSONResponse(
+                {"detail": "Сервер перегружен, повторите позже"},
+                status_code=503,
+                headers={"Retry-After": str(self.retry_after)},
+            )
+            await response(scope, receive, send)
+            return
+
+        ADMISSION_QUEUE_WAIT.labels(route).observe(waited)
+        add_server_timing("admission", waited)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release(cost)
+
+
+def request_content_length(scope) -> int | None:
+    """
+    Content-Length запроса из ASGI scope (None, если заголовка нет или он некорректен).
+    """
+    for name, value in scope["headers"]:
+        if name == b"content-length":
+            try:
+                return int(value)
+            except ValueError:
+                return None
+    return None
@@ -1,21 +1,331 @@
 import os
+import re
+import time
+import uuid
+import logging
+import threading
 import subprocess
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass
 from pathlib import Path
 
+import numpy as np
+import soundfile as sf
+from scipy.signal import resample_poly
+
+from app.config import settings
+from app.utils.metrics import (
+    DECODE_DURATION,
+    DECODER_QUEUE_WAIT,
+    DECODER_IN_FLIGHT,
+    DECODER_CONCURRENCY_LIMIT,
+    DECODED_AUDIO_SECONDS,
+    DECODE_FAILURES,
+)
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SAMPLE_RATE = 16000
+READ_CHUNK_SIZE = 64 * 1024
+INITIAL_PCM_SECONDS = 60
+STDERR_TAIL_LINES = 20
+PROBE_TIMEOUT_SECONDS = 30.0
+
+# ffmpeg помечает потоки кодами ISO 639-2, дорожки в БД — двухбуквенными (ru, en)
+LANGUAGE_CODES = {
+    "rus": "ru", "eng": "en", "ukr": "uk", "bel": "be", "kaz": "kk", "deu": "de", "ger": "de",
+    "fra": "fr", "fre": "fr", "spa": "es", "ita": "it", "por": "pt", "pol": "pl", "tur": "tr",
+    "jpn": "ja", "kor": "ko", "zho": "zh", "chi": "zh",
+}
+UNDEFINED_LANGUAGES = {"", "und", "unk", "mis", "mul", "zxx"}
+
+_STREAM_RE = re.compile(
+    r"^\s*Stream #\d+:(?P<index>\d+)(?:\[[^\]]*\])?(?:\((?P<language>[^)]*)\))?: Audio: (?P<codec>[^\s,]+)"
+)
+_TITLE_RE = re.compile(r"^\s+title\s*:\s*(?P<title>.*)$")
+
+
+class DecodeError(Exception):
+    """Файл не удалось декодировать."""
+
+
+class DecoderBusy(DecodeError):
+    """Все слоты пула декодеров заняты дольше допустимого."""
+
+
+def _mono_pcm_rate(path: str) -> int | None:
+    """
+    Частота файла, если это моно PCM, который soundfile читает без ffmpeg, иначе None.
+    """
+    try:
+        info = sf.info(path)
+    except Exception:
+        return None
+    if info.channels == 1 and info.subtype.startswith("PCM"):
+        return info.samplerate
+    return None
+
+
+def probe_pcm(path: str, sr: int = DEFAULT_SAMPLE_RATE) -> bool:
+    """
+    Проверяет, что файл уже моно PCM с нужной частотой и его можно читать без ffmpeg.
+    """
+    return _mono_pcm_rate(path) == sr
+
+
+class _PcmBuffer:
+    """
+    Собирает поток s16le от ffmpeg сразу в float32: каждый блок переводится по мере
+    чтения, буфер растёт удвоением на месте (resize), в конце обрезается до длины сигнала.
+    Сырые байты целиком не накапливаются, в памяти остаётся только итоговый массив.
+    """
+
+    def __init__(self, capacity: int):
+        self.data = np.empty(max(capacity, 1), dtype=np.float32)
+        self.size = 0
+        self._odd = b""
+
+    def __call__(self, chunk: bytes) -> None:
+        if self._odd:
+            chunk, self._odd = self._odd + chunk, b""
+        if len(chunk) % 2:
+            # Отсчёт разрезан границей чтения: последний байт ждёт следующего блока
+            chunk, self._odd = chunk[:-1], chunk[-1:]
+        samples = np.frombuffer(chunk, dtype="<i2")
+        end = self.size + len(samples)
+        if end > len(self.data):
+            self.data.resize(max(end, 2 * len(self.data)), refcheck=False)
+        np.multiply(samples, np.float32(1 / 32768.0), out=self.data[self.size:end], dtype=np.float32)
+        self.size = end
+
+    def result(self) -> np.ndarray:
+        self.data.resize(self.size, refcheck=False)
+        return self.data
+
+
+@dataclass
+class AudioStream:
+    """
+    Аудиопоток контейнера: абсолютный индекс потока, язык (ISO 639-1, если известен) и кодек.
+    """
+    index: int
+    language: str | None
+    codec: str
+    title: str | None = None
+
+
+def normalize_language(tag: str | None) -> str | None:
+    """
+    Переводит тег языка потока в код дорожки: «rus» -> «ru», «und» и пустой -> None.
+    """
+    tag = (tag or "").strip().lower()
+    if tag in UNDEFINED_LANGUAGES:
+        return None
+    return LANGUAGE_CODES.get(tag, tag)
+
+
+def probe_audio_streams(path: str) -> list[AudioStream]:
+    """
+    Перечисляет аудиопотоки файла по выводу «ffmpeg -i» (ffprobe не требуется).
+
+    Raises:
+        DecodeError: ffmpeg не смог открыть файл.
+    """
+    try:
+        proc = subprocess.run(
+            ["ffmpeg", "-hide_banner", "-nostdin", "-i", path],
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            timeout=PROBE_TIMEOUT_SECONDS,
+        )
+    except subprocess.TimeoutExpired:
+        raise DecodeError(f"ffmpeg не уложился в {PROBE_TIMEOUT_SECONDS:g} с при разборе {path}")
+    output = proc.stderr.decode(errors="replace").splitlines()
+    if not any(line.startswith("Input #") for line in output):
+        details = "; ".join(output[-STDERR_TAIL_LINES:]) or f"код {proc.returncode}"
+        raise DecodeError(f"ffmpeg не смог открыть {path}: {details}")
+
+    streams, current = [], None
+    for line in output:
+        match = _STREAM_RE.match(line)
+        if match:
+            current = AudioStream(int(match.group("index")), normalize_language(match.group("language")),
+                                  match.group("codec"))
+            streams.append(current)
+            continue
+        if line.lstrip().startswith("Stream #"):
+            current = None
+        title = _TITLE_RE.match(line)
+        if current is not None and title and current.title is None:
+            current.title = title.group("title").strip()
+    return streams
+
+
+class DecoderPool:
+    """
+    Ограниченный пул декодирования через ffmpeg.
+
+    Одновременно работает не больше max_concurrency процессов; ожидание слота
+    ограничено queue_timeout (затем DecoderBusy), сам процесс — timeout.
+    PCM читается из stdout ffmpeg блоками, stderr (только ошибки) — отдельным потоком
+    с ограниченным хвостом, поэтому ни один из каналов не копится в памяти целиком.
+    Файлы, которые уже являются моно PCM нужной или кратной ей частоты, читаются без ffmpeg
+    (кратная частота понижается прореживанием с антиалиасинговым фильтром).
+
+    Пул синхронный: асинхронный код вызывает его через run_in_threadpool.
+
+    Args:
+        max_concurrency (int): Предел одновременных декодирований.
+        timeout (float): Предельная длительность процесса ffmpeg (сек).
+        queue_timeout (float): Предельное ожидание свободного слота (сек).
+    """
+
+    def __init__(self, max_concurrency: int, timeout: float, queue_timeout: float):
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.queue_timeout = queue_timeout
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        DECODER_CONCURRENCY_LIMIT.set(max_concurrency)
+
+    @contextmanager
+    def _slot(self):
+        started = time.perf_counter()
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            DECODE_FAILURES.labels("busy").inc()
+            raise DecoderBusy("Пул декодеров перегружен")
+        DECODER_QUEUE_WAIT.observe(time.perf_counter() - started)
+        DECODER_IN_FLIGHT.inc()
+        try:
+            yield
+        finally:
+            DECODER_IN_FLIGHT.dec()
+            self._slots.release()
+
+    def load(self, path: str, sr: int = DEFAULT_SAMPLE_RATE) -> np.ndarray:
+        """
+        Декодирует файл в моно float32 с частотой sr.
+
+        Raises:
+            DecoderBusy: Нет свободного слота.
+            DecodeError: ffmpeg завершился с ошибкой или по таймауту.
+        """
+        rate = _mono_pcm_rate(path)
+        if rate is not None and rate % sr == 0:
+            started = time.perf_counter()
+            y, _ = sf.read(path, dtype="float32")
+            if rate != sr:
+                y = resample_poly(y, 1, rate // sr).astype(np.float32)
+            DECODE_DURATION.labels("passthrough").observe(time.perf_counter() - started)
+            DECODED_AUDIO_SECONDS.labels("passthrough").inc(len(y) / sr)
+            return y
+
+        buffer = _PcmBuffer(INITIAL_PCM_SECONDS * sr)
+        self._run(
+            ["-f", "s16le", "-acodec", "pcm_s16le", "-ar", str(sr), "-ac", "1", "pipe:1"],
+            path,
+            buffer,
+        )
+        y = buffer.result()
+        DECODED_AUDIO_SECONDS.labels("ffmpeg").inc(len(y) / sr)
+        return y
+
+    def to_wav(self, path: str, output_dir: str, sr: int = DEFAULT_SAMPLE_RATE) -> str:
+        """
+        Извлекает звук в моно WAV PCM s16le (ffmpeg пишет файл сам).
+
+        Returns:
+            str: Путь к WAV в output_dir.
+        """
+        audio_path = os.path.join(output_dir, f"{Path(path).stem}.wav")
+        if os.path.abspath(audio_path) == os.path.abspath(path):
+            audio_path = os.path.join(output_dir, f"{Path(path).stem}_pcm.wav")
+        self._run(["-vn", "-acodec", "pcm_s16le", "-ar", str(sr), "-ac", "1", audio_path], path)
+        try:
+            DECODED_AUDIO_SECONDS.labels("ffmpeg").inc(sf.info(audio_path).duration)
+        except Exception:
+            pass
+        return audio_path
+
+    def extract_streams(self, path: str, streams: list[AudioStream], output_dir: str,
+                        sr: int = DEFAULT_SAMPLE_RATE) -> list[str]:
+        """
+        Извлекает несколько аудиопотоков в отдельные моно WAV за один проход ffmpeg:
+        контейнер читается и демультиплексируется один раз, каждый поток — свой выход.
+
+        Имена WAV строятся от случайного uuid, а не от имени исходного файла: они хранятся
+        как track_path, и повторная загрузка файла с тем же именем не должна их перезаписать.
+
+        Returns:
+            list[str]: Пути к WAV в порядке streams.
+        """
+        stem = uuid.uuid4().hex
+        output_args, audio_paths = [], []
+        for stream in streams:
+            audio_path = os.path.join(output_dir, f"{stem}_a{stream.index}.wav")
+            output_args += ["-map", f"0:{stream.index}", "-acodec", "pcm_s16le", "-ar", str(sr), "-ac", "1", audio_path]
+            audio_paths.append(audio_path)
+        self._run(output_args, path)
+        for audio_path in audio_paths:
+            try:
+                DECODED_AUDIO_SECONDS.labels("ffmpeg").inc(sf.info(audio_path).duration)
+            except Exception:
+                pass
+        return audio_paths
+
+    def _run(self, output_args, path, on_chunk=None) -> None:
+        command = ["ffmpeg", "-y", "-nostdin", "-hide_banner", "-loglevel", "error", "-i", path, *output_args]
+        with self._slot():
+            started = time.perf_counter()
+            proc = subprocess.Popen(
+                command,
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.PIPE if on_chunk else subprocess.DEVNULL,
+                stderr=subprocess.PIPE,
+            )
+            stderr_tail = deque(maxlen=STDERR_TAIL_LINES)
+            stderr_reader = threading.Thread(
+                target=lambda: stderr_tail.extend(line.decode(errors="replace").rstrip() for line in proc.stderr),
+                daemon=True,
+            )
+            stderr_reader.start()
+            timed_out = threading.Event()
+
+            def kill():
+                timed_out.set()
+                proc.kill()
+
+            timer = threading.Timer(self.timeout, kill)
+            timer.start()
+            try:
+                if on_chunk:
+                    while chunk := proc.stdout.read(READ_CHUNK_SIZE):
+                        on_chunk(chunk)
+                returncode = proc.wait()
+            finally:
+                timer.cancel()
+                if proc.poll() is None:
+                    proc.kill()
+                    proc.wait()
+                stderr_reader.join(timeout=1.0)
+            DECODE_DURATION.labels("ffmpeg").observe(time.perf_counter() - started)
+
+        if timed_out.is_set():
+            DECODE_FAILURES.labels("timeout").inc()
+            raise DecodeError(f"ffmpeg не уложился в {self.timeout:g} с: {path}")
+        if returncode != 0:
+            DECODE_FAILURES.labels("error").inc()
+            details = "; ".join(stderr_tail) or f"код {returncode}"
+            raise DecodeError(f"ffmpeg не смог декодировать {path}: {details}")
+
+
+decoder_pool = DecoderPool(
+    settings.DECODER_MAX_CONCURRENCY,
+    settings.DECODER_TIMEOUT_SECONDS,
+    settings.DECODER_QUEUE_TIMEOUT_SECONDS,
+)
+
+
 def extract_audio_from_video(video_path: str, output_dir: str) -> str:
-    filename = Path(video_path).stem
-    audio_path = os.path.join(output_dir, f"{filename}.wav")
-
-    command = [
-        "ffmpeg",
-        "-y",  # overwrite if exists
-        "-i", video_path,
-        "-vn",  # no video
-        "-acodec", "pcm_s16le",
-        "-ar", "16000",  # 16 kHz
-        "-ac", "1",      # mono
-        audio_path
-    ]
-
-    subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
-    return audio_path
+    return decoder_pool.to_wav(video_path, output_dir)
@@ -1,11 +1,15 @@
+import time
+from dataclasses import dataclass
 from datetime import datetime, timedelta
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi import HTTPException, Depends
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
+from sqlalchemy import event
 
+from app.config import settings
 from app.database import SessionLocal
+from app.utils.cache import TTLCache
 from app import models
 
 SECRET_KEY = "abc-qwerty-key"  # желательно вынести в .env
@@ -15,6 +19,63 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 60
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
 
+
+@dataclass(frozen=True)
+class UserSnapshot:
+    """
+    Неизменяемый снимок пользователя, который безопасно держать в кэше между запросами.
+    """
+    id: int
+    email: str
+    is_admin: bool
+    has_subscription: bool
+    subscription_expires_at: datetime | None
+
+    is_subscription_active = models.User.is_subscription_active
+
+    @classmethod
+    def from_user(cls, user: models.User) -> "UserSnapshot":
+        return cls(
+            id=user.id,
+            email=user.email,
+            is_admin=user.is_admin,
+            has_subscription=user.has_subscription,
+            subscription_expires_at=user.subscription_expires_at,
+        )
+
+
+# токен -> UserSnapshot; запись живёт не дольше TTL и не дольше самого токена
+_token_cache = TTLCache(max_size=settings.AUTH_CACHE_MAX_SIZE, ttl=settings.AUTH_CACHE_TTL_SECONDS)
+
+
+def invalidate_user(email: str | None) -> None:
+    """
+    Сбрасывает все закэшированные токены пользователя.
+    """
+    if email:
+        _token_cache.invalidate_if(lambda snapshot: snapshot.email == email)
+
+
+def _on_user_changed(target, value, oldvalue, initiator):
+    invalidate_user(target.email)
+    if initiator.key == "email" and isinstance(oldvalue, str):
+        invalidate_user(oldvalue)
+
+
+for _attr in (
+    models.User.email,
+    models.User.is_admin,
+    models.User.has_subscription,
+    models.User.subscription_expires_at,
+):
+    event.listen(_attr, "set", _on_user_changed)
+
+
+@event.listens_for(models.User, "after_delete")
+def _on_user_deleted(mapper, connection, target):
+    invalidate_user(target.email)
+
+
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
 
@@ -27,41 +88,43 @@ def create_access_token(data: dict, expires_delta: timedelta | None = None):
     to_encode.update({"exp": expire})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+def _resolve_token(token: str) -> UserSnapshot | None:
+    """
+    Проверяет JWT и возвращает снимок пользователя, обращаясь к БД только при промахе кэша.
+    """
+    snapshot = _token_cache.get(token)
+    if snapshot is not None:
+        return snapshot
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    credentials_exception = HTTPException(
-        status_code=401,
-        detail="Не удалось проверить токен",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         email: str = payload.get("sub")
         if email is None:
-            raise credentials_exception
+            return None
     except JWTError:
-        raise credentials_exception
+        return None
+
+    with SessionLocal() as db:
+        user = db.query(models.User).filter(models.User.email == email).first()
+        if user is None:
+            return None
+        snapshot = UserSnapshot.from_user(user)
 
-    user = db.query(models.User).filter(models.User.email == email).first()
+    exp = payload.get("exp")
+    token_ttl = (exp - time.time()) if exp is not None else settings.AUTH_CACHE_TTL_SECONDS
+    _token_cache.set(token, snapshot, ttl=token_ttl)
+    return snapshot
+
+def get_current_user(token: str = Depends(oauth2_scheme)) -> UserSnapshot:
+    credentials_exception = HTTPException(
+        status_code=401,
+        detail="Не удалось проверить токен",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+    user = _resolve_token(token)
     if user is None:
         raise credentials_exception
     return user
 
-def verify_token(token: str) -> models.User | None:
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
-            return None
-    except JWTError:
-        return None
-
-    db = next(get_db())
-    user = db.query(models.User).filter(models.User.email == email).first()
-    return user
+def verify_token(token: str) -> UserSnapshot | None:
+    return _resolve_token(token)
@@ -0,0 +1,117 @@
+import time
+import asyncio
+import threading
+from collections import OrderedDict
+
+# Ведущий вызов отменён: ожидающие повторяют попытку и один из них становится ведущим
+_RETRY = object()
+
+
+class TTLCache:
+    """
+    Потокобезопасный LRU-кэш ограниченного размера с временем жизни записей.
+
+    Args:
+        max_size (int): Максимальное число записей (самые старые вытесняются).
+        ttl (float): Время жизни записи по умолчанию (сек).
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            expires_at, value = item
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl: float | None = None) -> None:
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if ttl <= 0 or self.max_size <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            item = self._data.pop(key, None)
+        return default if item is None else item[1]
+
+    def invalidate_if(self, predicate) -> int:
+        """
+        Удаляет все записи, для значений которых predicate(value) истинно.
+
+        Returns:
+            int: Число удалённых записей.
+        """
+        with self._lock:
+            keys = [k for k, (_, v) in self._data.items() if predicate(v)]
+            for k in keys:
+                del self._data[k]
+        return len(keys)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class SingleFlight:
+    """
+    Объединение одинаковых одновременных вычислений в event loop.
+
+    Первый вызов do с ключом выполняет вычисление, остальные с тем же ключом ждут
+    его и получают тот же результат или то же исключение. После завершения ключ
+    освобождается: результат не хранится (для этого есть TTLCache).
+    """
+
+    def __init__(self):
+        self._calls: dict = {}
+
+    async def do(self, key, fn):
+        """
+        Args:
+            key: Ключ вычисления (хешируемый).
+            fn: Корутинная функция без аргументов.
+
+        Returns:
+            tuple: Результат fn и признак того, что он получен из чужого вызова.
+        """
+        while (future := self._calls.get(key)) is not None:
+            result = await asyncio.shield(future)
+            if result is not _RETRY:
+                return result, True
+        future = asyncio.get_running_loop().create_future()
+        self._calls[key] = future
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            future.set_result(_RETRY)
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # Исключение уже передано вызывающему; ожидающих может и не быть
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result, False
+        finally:
+            del self._calls[key]
+
+    def __len__(self) -> int:
+        return len(self._calls)
@@ -14,7 +14,8 @@ def generate_hashes_from_peaks(
     max_delta=8.0,
     time_precision=0.05,
     target_density=100.0,
-    max_hashes=500000
+    max_hashes=500000,
+    return_anchors=False
 ):
     """
     Генерирует хеши из пиков аудиосигнала для создания аудиоотпечатков.
@@ -33,9 +34,11 @@ def generate_hashes_from_peaks(
         time_precision (float): Шаг округления времени (сек).
         target_density (float): Целевая плотность пиков (пиков/сек) для масштабирования fan_value.
         max_hashes (int): Макс. число генерируемых хешей.
+        return_anchors (bool): Добавлять в кортеж индекс опорного пика в peaks.
 
     Returns:
-        list[tuple[str, float]]: Список кортежей (hash, t1).
+        list[tuple[str, float]]: Список кортежей (hash, t1)
+            или (hash, t1, anchor_index) при return_anchors=True.
     """
     peaks_arr = np.asarray(peaks, dtype=np.float32)
     n_peaks = peaks_arr.size
@@ -94,7 +97,7 @@ def generate_hashes_from_peaks(
                 hash_input = f"{delta:.5f}"
 
             h = hashlib.sha1(hash_input.encode('utf-8')).hexdigest()[:12]
-            hashes.append((h, t1))
+            hashes.append((h, t1, i) if return_anchors else (h, t1))
             if len(hashes) >= max_hashes:
                 logger.warning("Достигнуто макс. число хешей: %d", max_hashes)
                 return hashes
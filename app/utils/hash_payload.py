@@ -0,0 +1,73 @@
+"""
+Бинарный формат хешей фрагмента для /match/hashes.
+
+Клиент строит хеши сам (тем же конвейером и профилем, что и сервер) и отправляет
+только пары (hash, t1): ~10 байт на хеш вместо мегабайт аудио.
+
+Формат (little-endian):
+    заголовок: magic b"VMH1", версия профиля (uint16), число хешей (uint32),
+               длительность фрагмента в секундах (float32);
+    записи:    hash — 6 байт (12 hex-символов), t1 — uint32 в сотых долях секунды.
+
+Порядок записей сохраняется: хеши фрагмента идут от сильных якорей к слабым,
+на этом построено голосование раундами.
+
+Модуль не зависит от app.* (входит в клиентский пакет, см. client/).
+"""
+import struct
+
+import numpy as np
+
+MAGIC = b"VMH1"
+HEADER = struct.Struct("<4sHIf")
+RECORD = np.dtype([("hash", "S6"), ("t1", "<u4")])
+TIME_SCALE = 100
+CONTENT_TYPE = "application/vnd.vmm.hashes"
+
+
+class PayloadError(ValueError):
+    """Некорректный бинарный пакет хешей."""
+
+
+def encode_hashes(hashes, profile_version: int, duration: float) -> bytes:
+    """
+    Упаковывает хеши фрагмента.
+
+    Args:
+        hashes (list[tuple[str, float]]): Пары (hash, t1) в порядке голосования.
+        profile_version (int): Версия профиля, которой посчитаны хеши.
+        duration (float): Длительность фрагмента (сек).
+
+    Returns:
+        bytes: Пакет для тела запроса.
+    """
+    records = np.empty(len(hashes), dtype=RECORD)
+    records["hash"] = [bytes.fromhex(h) for h, _ in hashes]
+    records["t1"] = np.round(np.fromiter((t1 for _, t1 in hashes), dtype=np.float64, count=len(hashes)) * TIME_SCALE)
+    return HEADER.pack(MAGIC, profile_version, len(hashes), duration) + records.tobytes()
+
+
+def decode_hashes(data: bytes, max_hashes: int | None = None):
+    """
+    Распаковывает пакет хешей.
+
+    Returns:
+        tuple[int, float, list[tuple[str, float]]]: Версия профиля, длительность фрагмента и пары (hash, t1).
+
+    Raises:
+        PayloadError: Неверный заголовок, размер или слишком много хешей.
+    """
+    if len(data) < HEADER.size:
+        raise PayloadError("Пакет короче заголовка")
+    magic, profile_version, count, duration = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise PayloadError("Неизвестный формат пакета")
+    if max_hashes is not None and count > max_hashes:
+        raise PayloadError(f"Слишком много хешей в пакете (максимум {max_hashes})")
+    if len(data) != HEADER.size + count * RECORD.itemsize:
+        raise PayloadError("Размер пакета не совпадает с числом хешей")
+    records = np.frombuffer(data, dtype=RECORD, count=count, offset=HEADER.size)
+    times = (records["t1"] / TIME_SCALE).round(2).tolist()
+    # Тип S6 отбрасывает нулевые байты в конце, поэтому хеш дополняется до 6 байт
+    hashes = [h.ljust(6, b"\0").hex() for h in records["hash"].tolist()]
+    return profile_version, float(duration), list(zip(hashes, times))
@@ -0,0 +1,211 @@
+import logging
+from collections import Counter
+
+from sqlalchemy import bindparam, delete, event, func, insert, select, update
+from sqlalchemy.dialects import mysql, sqlite
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models import AudioFingerprint, AudioTrack, HashStat, HashStatTotal, PrunedHash
+from app.utils.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+UPSERT_CHUNK = 1000
+
+# Набор «стоп-хешей» каталога по версии профиля, перечитывается раз в ttl
+_stop_hashes_cache = TTLCache(max_size=16, ttl=settings.STOP_HASHES_CACHE_TTL_SECONDS)
+
+
+def count_track_hashes(hashes) -> Counter:
+    """
+    Частота каждого хеша внутри дорожки.
+
+    Args:
+        hashes (list[tuple[str, float]]): Хеши дорожки (hash, t1).
+    """
+    return Counter(h for h, _ in hashes)
+
+
+def prune_hashes(hashes, counts, max_occurrences, stop_hashes=frozenset()):
+    """
+    Отбрасывает хеши, которые повторяются в дорожке чаще max_occurrences раз
+    (тишина, музыкальная подложка, повторяющиеся эффекты) или входят в глобальный стоп-список.
+
+    Returns:
+        list[tuple[str, float]]: Оставшиеся хеши.
+    """
+    return [
+        (h, t1) for h, t1 in hashes
+        if counts[h] <= max_occurrences and h not in stop_hashes
+    ]
+
+
+def _upsert(dialect_name, table, rows, index_elements, counters):
+    if dialect_name == "mysql":
+        stmt = mysql.insert(table).values(rows)
+        return stmt.on_duplicate_key_update(
+            **{name: getattr(table, name) + getattr(stmt.inserted, name) for name in counters}
+        )
+    stmt = sqlite.insert(table).values(rows)
+    return stmt.on_conflict_do_update(
+        index_elements=index_elements,
+        set_={name: getattr(table, name) + getattr(stmt.excluded, name) for name in counters},
+    )
+
+
+def update_hash_stats(db, profile: int, counts: Counter) -> None:
+    """
+    Добавляет статистику новой дорожки в hash_stats версии профиля (без commit: фиксируется
+    вместе с отпечатками). Статистика считается по всем хешам дорожки до отсечения,
+    чтобы документная частота не занижалась; отсечённые хеши запоминаются
+    (record_pruned_hashes), чтобы вклад дорожки можно было вычесть.
+
+    Args:
+        db (Session): Синхронная сессия.
+        profile (int): Версия профиля, которой посчитаны хеши.
+        counts (Counter): Частоты хешей дорожки.
+    """
+    if not counts:
+        return
+    dialect_name = db.get_bind().dialect.name
+    items = sorted(counts.items())
+    for i in range(0, len(items), UPSERT_CHUNK):
+        rows = [
+            {"profile": profile, "hash": h, "track_count": 1, "total_count": n}
+            for h, n in items[i:i + UPSERT_CHUNK]
+        ]
+        db.execute(_upsert(dialect_name, HashStat, rows, [HashStat.profile, HashStat.hash],
+                           ("track_count", "total_count")))
+    db.execute(_upsert(dialect_name, HashStatTotal, [{"profile": profile, "track_count": 1}],
+                       [HashStatTotal.profile], ("track_count",)))
+
+
+def record_pruned_hashes(db, track_id: int, profile: int, counts: Counter, kept) -> None:
+    """
+    Запоминает хеши дорожки, учтённые в статистике, но не записанные в audio_fingerprints.
+
+    Args:
+        counts (Counter): Частоты всех хешей дорожки.
+        kept (list[tuple[str, float]]): Записанные хеши.
+    """
+    kept_hashes = {h for h, _ in kept}
+    rows = [
+        {"audio_track_id": track_id, "profile": profile, "hash": h, "count": n}
+        for h, n in counts.items() if h not in kept_hashes
+    ]
+    for i in range(0, len(rows), UPSERT_CHUNK):
+        db.execute(insert(PrunedHash), rows[i:i + UPSERT_CHUNK])
+
+
+def hash_stat_profiles(db, track_id: int) -> list[int]:
+    """
+    Версии профиля, по которым дорожка учтена в hash_stats.
+    """
+    stored = select(AudioFingerprint.profile).where(AudioFingerprint.audio_track_id == track_id).distinct()
+    pruned = select(PrunedHash.profile).where(PrunedHash.audio_track_id == track_id).distinct()
+    return sorted(set(db.execute(stored).scalars()) | set(db.execute(pruned).scalars()))
+
+
+def remove_hash_stats(db, track_id: int, profiles=None) -> None:
+    """
+    Вычитает вклад дорожки из hash_stats (без commit) и удаляет её записи в pruned_hashes.
+
+    Вклад восстанавливается точно: записанные отпечатки плюс отсечённые хеши. Вызывается
+    до удаления отпечатков — при удалении дорожки (ORM-хук ниже), переиндексации той же
+    версией и переключении профиля.
+
+    Args:
+        db (Session): Синхронная сессия.
+        track_id (int): ID аудиодорожки.
+        profiles (list[int]|None): Версии профиля; по умолчанию все, по которым дорожка учтена.
+    """
+    if profiles is None:
+        profiles = hash_stat_profiles(db, track_id)
+    decrement = (
+        update(HashStat.__table__)
+          .where(HashStat.profile == bindparam("b_profile"))
+          .where(HashStat.hash == bindparam("b_hash"))
+          .values(track_count=HashStat.track_count - 1, total_count=HashStat.total_count - bindparam("b_count"))
+    )
+    for profile in profiles:
+        counts = Counter(dict(db.execute(
+            select(AudioFingerprint.hash, func.count())
+              .where(AudioFingerprint.audio_track_id == track_id)
+              .where(AudioFingerprint.profile == profile)
+              .group_by(AudioFingerprint.hash)
+        ).all()))
+        counts.update(dict(db.execute(
+            select(PrunedHash.hash, PrunedHash.count)
+              .where(PrunedHash.audio_track_id == track_id)
+              .where(PrunedHash.profile == profile)
+        ).all()))
+        if not counts:
+            continue
+        items = sorted(counts.items())
+        for i in range(0, len(items), UPSERT_CHUNK):
+            db.execute(decrement, [
+                {"b_profile": profile, "b_hash": h, "b_count": n} for h, n in items[i:i + UPSERT_CHUNK]
+            ])
+        db.execute(delete(HashStat).where(HashStat.profile == profile).where(HashStat.track_count <= 0))
+        db.execute(
+            update(HashStatTotal)
+              .where(HashStatTotal.profile == profile)
+              .values(track_count=HashStatTotal.track_count - 1)
+        )
+        db.execute(
+            delete(PrunedHash)
+              .where(PrunedHash.audio_track_id == track_id)
+              .where(PrunedHash.profile == profile)
+        )
+
+
+@event.listens_for(Session, "before_flush")
+def _remove_deleted_track_stats(session, flush_context, instances):
+    """
+    Удаление дорожки через ORM (в том числе каскадом от фильма) вычитает её вклад
+    из hash_stats до того, как отпечатки будут удалены.
+    """
+    for obj in session.deleted:
+        if isinstance(obj, AudioTrack):
+            remove_hash_stats(session, obj.id)
+
+
+def stop_hashes_query(profile: int, max_doc_freq: float, min_tracks: int):
+    """
+    Хеши версии профиля, встречающиеся больше чем в доле max_doc_freq дорожек,
+    учтённых в статистике этой версии. Пока таких дорожек меньше min_tracks,
+    документная частота не показательна и запрос ничего не возвращает.
+    """
+    n_tracks = func.coalesce(
+        select(HashStatTotal.track_count).where(HashStatTotal.profile == profile).scalar_subquery(), 0
+    )
+    return (
+        select(HashStat.hash)
+          .where(HashStat.profile == profile)
+          .where(n_tracks >= min_tracks)
+          .where(HashStat.track_count > max_doc_freq * n_tracks)
+    )
+
+
+def get_stop_hashes(db, profile: int, max_doc_freq: float, min_tracks: int) -> frozenset:
+    """
+    Стоп-хеши версии профиля для синхронной сессии (с кэшем).
+    """
+    cached = _stop_hashes_cache.get(profile)
+    if cached is None:
+        cached = frozenset(db.execute(stop_hashes_query(profile, max_doc_freq, min_tracks)).scalars())
+        _stop_hashes_cache.set(profile, cached)
+    return cached
+
+
+async def get_stop_hashes_async(db, profile: int, max_doc_freq: float, min_tracks: int) -> frozenset:
+    """
+    Стоп-хеши версии профиля для асинхронной сессии (с кэшем).
+    """
+    cached = _stop_hashes_cache.get(profile)
+    if cached is None:
+        result = await db.execute(stop_hashes_query(profile, max_doc_freq, min_tracks))
+        cached = frozenset(result.scalars())
+        _stop_hashes_cache.set(profile, cached)
+    return cached
@@ -0,0 +1,408 @@
+import hashlib
+import logging
+from collections import Counter, defaultdict
+
+import numpy as np
+from scipy.signal import correlate, resample_poly
+from sqlalchemy import select
+
+from app.models import AudioFingerprint
+from app.utils.audio import decoder_pool
+from app.utils.peaks import extract_peaks
+from app.utils.profiles import FingerprintProfile, PipelineParams, get_profile, DEFAULT_PROFILE_VERSION
+from app.utils.fingerprinting import generate_hashes_from_peaks
+from app.utils.metrics import timed, timed_stage
+from app.utils.pipeline import (
+    as_float,
+    butter_bandpass,
+    bandpass_filter,
+    to_profile_rate,
+    apply_bandpass,
+    pair_order,
+    extract_fragment_peaks,
+    hash_fragment_peaks,
+    compute_fragment_hashes,
+)
+
+logger = logging.getLogger(__name__)
+
+FRAGMENT_SAMPLE_RATE = 16000
+REFINE_SAMPLE_RATE = 4000
+DELTA_TOLERANCE = 0.02
+MIN_FRAGMENT_HASHES = 5
+
+
+@timed_stage("load")
+def load_fragment(audio_path, sr=FRAGMENT_SAMPLE_RATE):
+    """
+    Загружает фрагмент в моно с частотой sr через пул декодеров
+    (моно WAV нужной частоты читается напрямую, остальные форматы — потоком из ffmpeg).
+
+    Returns:
+        tuple[np.ndarray, int]: Сигнал и частота дискретизации.
+    """
+    return decoder_pool.load(audio_path, sr), sr
+
+
+def pcm_digest(y):
+    """
+    SHA-256 декодированного сигнала: одинаковый звук в разных контейнерах даёт один ключ.
+    """
+    return hashlib.sha256(np.ascontiguousarray(y, dtype=np.float32).tobytes()).hexdigest()
+
+
+@timed_stage("peaks")
+def fragment_peaks(y, sr, params: PipelineParams | None = None):
+    """
+    Извлекает пики фрагмента с параметрами поиска профиля (см. pipeline.extract_fragment_peaks).
+    """
+    return extract_fragment_peaks(y, sr, params or get_profile(DEFAULT_PROFILE_VERSION).query)
+
+
+@timed_stage("hashing")
+def fragment_hashes(peaks, freqs, anchor_amplitudes=None, params: PipelineParams | None = None):
+    """
+    Строит хеши фрагмента с параметрами поиска профиля (см. pipeline.hash_fragment_peaks).
+    """
+    return hash_fragment_peaks(peaks, freqs, anchor_amplitudes, params or get_profile(DEFAULT_PROFILE_VERSION).query)
+
+
+def fingerprint_fragment(y, sr, profile: FingerprintProfile | None = None):
+    """
+    Полный CPU-конвейер фрагмента: приведение к частоте профиля, полосовой фильтр, пики, хеши
+    (параметры поиска профиля дорожки, с которой сравнивается фрагмент). Тот же конвейер
+    выполняет клиентский пакет перед /match/hashes.
+
+    Returns:
+        tuple[np.ndarray, list[tuple[str, float]]]: Исходный сигнал (для уточнения) и хеши.
+    """
+    return y, compute_fragment_hashes(y, sr, profile or get_profile(DEFAULT_PROFILE_VERSION), timer=timed)
+
+
+def fingerprint_track(y, sr, profile: FingerprintProfile | None = None):
+    """
+    Строит хеши аудиодорожки с параметрами индексации профиля (сигнал любой частоты
+    приводится к частоте профиля).
+
+    Returns:
+        tuple[np.ndarray, list[tuple[str, float]]]: Времена пиков и хеши (hash, t1).
+    """
+    profile = profile or get_profile(DEFAULT_PROFILE_VERSION)
+    params = profile.track
+    filtered = y
+    if sr != profile.sample_rate:
+        with timed("resample", pipeline="ingest"):
+            filtered = to_profile_rate(y, sr, profile)
+    with timed("bandpass", pipeline="ingest"):
+        filtered = apply_bandpass(filtered, profile.sample_rate, params)
+    with timed("peaks", pipeline="ingest"):
+        peaks, freqs, _ = extract_peaks(
+            filtered, profile.sample_rate,
+            normalize=True,
+            return_freqs=True,
+            return_amplitudes=True,
+            **params.peaks
+        )
+    with timed("hashing", pipeline="ingest"):
+        order = pair_order(peaks, freqs, params)
+        if order is not None:
+            peaks, freqs = peaks[order], freqs[order]
+        hashes = [(h, as_float(t1)) for h, t1 in generate_hashes_from_peaks(
+            peaks, freqs=freqs, amplitudes=None, **params.hashes
+        )]
+    return peaks, hashes
+
+
+def fingerprint_query(track_id, hashes, profile, offset_range=None):
+    """
+    Запрос отпечатков дорожки, совпадающих с хешами фрагмента.
+
+    Args:
+        track_id (int): ID аудиодорожки.
+        hashes (list[str]): Уникальные хеши.
+        profile (int): Активная версия профиля дорожки (AudioTrack.fingerprint_profile).
+        offset_range (tuple[float, float]|None): Диапазон смещений отпечатков в дорожке (сек);
+            запрос идёт по индексу (audio_track_id, profile, offset) и читает только этот участок.
+    """
+    query = (
+        select(AudioFingerprint.hash, AudioFingerprint.offset)
+          .where(AudioFingerprint.audio_track_id == track_id)
+          .where(AudioFingerprint.profile == profile)
+          .where(AudioFingerprint.hash.in_(hashes))
+    )
+    if offset_range is not None:
+        query = query.where(AudioFingerprint.offset.between(*offset_range))
+    return query
+
+
+def hint_range(offset_hint, window, fragment_duration):
+    """
+    Диапазоны поиска вокруг подсказанного смещения.
+
+    Args:
+        offset_hint (float): Ожидаемое начало фрагмента в дорожке (сек).
+        window (float): Допустимое отклонение от подсказки (сек).
+        fragment_duration (float): Длительность фрагмента (сек).
+
+    Returns:
+        tuple[tuple[float, float], tuple[float, float]]: Диапазон смещений фрагмента
+        (для ProgressiveVoter) и диапазон смещений отпечатков (для fingerprint_query):
+        хеши фрагмента лежат в дорожке на [начало, начало + длительность].
+    """
+    lo = max(0.0, offset_hint - window)
+    hi = offset_hint + window
+    return (lo, hi), (lo, hi + fragment_duration)
+
+
+def batch_fingerprint_query(track_ids, hashes, profile):
+    """
+    Один запрос отпечатков сразу для нескольких дорожек и объединения хешей нескольких фрагментов.
+
+    Args:
+        track_ids (list[int]): ID аудиодорожек с одной активной версией профиля.
+        hashes (list[str]): Уникальные хеши.
+        profile (int): Версия профиля.
+    """
+    return (
+        select(AudioFingerprint.audio_track_id, AudioFingerprint.hash, AudioFingerprint.offset)
+          .where(AudioFingerprint.audio_track_id.in_(track_ids))
+          .where(AudioFingerprint.profile == profile)
+          .where(AudioFingerprint.hash.in_(hashes))
+    )
+
+
+def group_fingerprints_by_track(rows):
+    """
+    Группирует строки (audio_track_id, hash, offset) по дорожке и хешу.
+
+    Returns:
+        dict[int, dict[str, list[float]]]: track_id -> {hash: [offset, ...]}.
+    """
+    by_track = defaultdict(lambda: defaultdict(list))
+    for track_id, h_db, off in rows:
+        by_track[track_id][h_db].append(off)
+    return by_track
+
+
+def group_fingerprints(rows):
+    """
+    Группирует строки (hash, offset) из БД по хешу.
+    """
+    fps_dict = defaultdict(list)
+    for h_db, off in rows:
+        fps_dict[h_db].append(off)
+    return fps_dict
+
+
+@timed_stage("voting")
+def vote_offsets(hashes, fps_dict, tolerance=DELTA_TOLERANCE, max_offsets=None):
+    """
+    Голосование по разнице времени t2 - t1 с квантованием на tolerance.
+
+    Args:
+        max_offsets (int|None): Хеши, у которых в дорожке больше смещений, не голосуют:
+            они почти не несут сигнала, но раздувают цикл голосования.
+
+    Returns:
+        Counter: Число голосов для каждого смещения.
+    """
+    counts = Counter()
+    for h, t1 in hashes:
+        offsets = fps_dict.get(h, [])
+        if max_offsets is not None and len(offsets) > max_offsets:
+            continue
+        for t2 in offsets:
+            counts[offset_bin(t2 - t1, tolerance)] += 1
+    return counts
+
+
+def offset_bin(delta, tolerance=DELTA_TOLERANCE):
+    """
+    Квантует разницу времени t2 - t1 до корзины голосования.
+    """
+    return round(round(delta / tolerance) * tolerance, 3)
+
+
+def pick_best_offset(counts, total_checked):
+    """
+    Выбирает смещение с максимумом голосов.
+
+    Returns:
+        tuple[float, int, float]: Смещение, число голосов, грубая уверенность (%).
+    """
+    offset = max(counts, key=counts.get)
+    score = counts[offset]
+    raw_confidence = round(min(score / total_checked, 1.0) * 100, 2)
+    return offset, score, raw_confidence
+
+
+def best_with_margin(counts, tolerance=DELTA_TOLERANCE, neighbors=1):
+    """
+    Лучшая корзина смещения и её отрыв от второй.
+
+    Соседние корзины (±neighbors) не считаются конкурентами: это то же смещение,
+    размазанное квантованием.
+
+    Returns:
+        tuple[float, int, int]: Смещение, голоса за него, голоса лучшей из остальных корзин.
+    """
+    offset = max(counts, key=counts.get)
+    score = counts[offset]
+    window = tolerance * (neighbors + 0.5)
+    runner_up = max((c for off, c in counts.items() if abs(off - offset) > window), default=0)
+    return offset, score, runner_up
+
+
+def is_decisive(counts, min_votes, ratio, tolerance=DELTA_TOLERANCE):
+    """
+    Достаточно ли уверенно лучшее смещение: не меньше min_votes голосов
+    и не меньше чем в ratio раз больше голосов, чем у лучшей из остальных корзин.
+    """
+    if not counts:
+        return False
+    _, score, runner_up = best_with_margin(counts, tolerance)
+    return score >= min_votes and score >= ratio * runner_up
+
+
+class ProgressiveVoter:
+    """
+    Голосование раундами с ранней остановкой.
+
+    Хеши берутся по порядку (fragment_hashes ставит сильнейшие якоря первыми),
+    каждый следующий раунд в growth раз больше предыдущего. После раунда
+    голосование прекращается, если лучшее смещение уже решающе (is_decisive).
+    Сам поиск в БД выполняет вызывающий код, поэтому класс работает и с
+    синхронной, и с асинхронной сессией:
+
+        voter = ProgressiveVoter(hashes, ...)
+        while (missing := voter.next_round()) is not None:
+            voter.add(lookup(missing) if missing else [])
+
+    Args:
+        hashes (list[tuple[str, float]]): Хеши фрагмента (hash, t1).
+        first_round (int): Число хешей в первом раунде.
+        growth (float): Рост размера раунда.
+        min_votes (int): Минимум голосов для ранней остановки.
+        ratio (float): Во сколько раз лучшее смещение должно опережать второе.
+        max_offsets (int|None): Порог частоты хеша в дорожке (см. vote_offsets).
+        offset_range (tuple[float, float]|None): Допустимые смещения фрагмента (сек);
+            голоса за корзины вне диапазона отбрасываются (см. hint_range).
+    """
+
+    def __init__(self, hashes, first_round=200, growth=2.0, min_votes=8, ratio=3.0,
+                 tolerance=DELTA_TOLERANCE, max_offsets=None, offset_range=None):
+        self.hashes = hashes
+        self.offset_range = offset_range
+        self.max_offsets = max_offsets
+        self.min_votes = min_votes
+        self.ratio = ratio
+        self.tolerance = tolerance
+        self.growth = growth
+        self.counts = Counter()
+        self.fps_dict = defaultdict(list)
+        self.used = 0
+        self.rounds = 0
+        self.decided = False
+        self._size = max(1, first_round)
+        self._batch = []
+        self._queried = set()
+
+    def next_round(self):
+        """
+        Готовит следующий раунд.
+
+        Returns:
+            list[str] | None: Хеши раунда, которых ещё нет в выборке из БД
+            (может быть пустым), или None, если голосование окончено.
+        """
+        if self.decided or self.used >= len(self.hashes):
+            return None
+        end = min(len(self.hashes), self.used + int(self._size))
+        self._batch = self.hashes[self.used:end]
+        missing = list({h for h, _ in self._batch} - self._queried)
+        self._queried.update(missing)
+        return missing
+
+    def add(self, rows) -> bool:
+        """
+        Учитывает строки (hash, offset) из БД и голоса раунда.
+
+        Returns:
+            bool: Можно ли остановиться.
+        """
+        for h_db, off in rows:
+            self.fps_dict[h_db].append(off)
+        votes = vote_offsets(self._batch, self.fps_dict, self.tolerance, self.max_offsets)
+        if self.offset_range is not None:
+            lo, hi = self.offset_range
+            votes = {bin_: n for bin_, n in votes.items() if lo - self.tolerance <= bin_ <= hi + self.tolerance}
+        self.counts.update(votes)
+        self.used += len(self._batch)
+        self.rounds += 1
+        self._size *= self.growth
+        self.decided = is_decisive(self.counts, self.min_votes, self.ratio, self.tolerance)
+        return self.decided
+
+
+def to_refine_rate(y, sr):
+    """
+    Понижает частоту сигнала до REFINE_SAMPLE_RATE (частота копий дорожек для уточнения).
+    """
+    if sr == REFINE_SAMPLE_RATE:
+        return np.asarray(y, dtype=np.float32)
+    return resample_poly(y, REFINE_SAMPLE_RATE, sr).astype(np.float32)
+
+
+@timed_stage("refinement")
+def refine_offset(y, sr, track_pcm, offset, max_lag=None):
+    """
+    Уточняет смещение кросс-корреляцией фрагмента с участком дорожки.
+
+    Без max_lag корреляция считается по всем сдвигам в пределах длины фрагмента.
+    С max_lag берётся участок дорожки на max_lag шире с каждой стороны и считаются
+    только сдвиги ±max_lag (mode='valid'): так уточняется смещение, которому уже
+    можно доверять, например найденное возле подсказки offset_hint.
+
+    Args:
+        y (np.ndarray): Фрагмент без полосового фильтра (фильтр сдвигает фазу
+            относительно дорожки).
+        sr (int): Частота дискретизации фрагмента (Гц).
+        track_pcm (np.ndarray): Дорожка с частотой REFINE_SAMPLE_RATE (см. app.utils.pcm_cache).
+        offset (float): Грубое смещение (сек).
+        max_lag (float|None): Максимальная поправка к offset (сек).
+
+    Returns:
+        tuple[float, float]: Уточнённое смещение (сек) и корреляционная уверенность (%).
+    """
+    y = to_refine_rate(y, sr)
+    if max_lag is not None:
+        return _refine_offset_window(y, track_pcm, offset, int(max_lag * REFINE_SAMPLE_RATE))
+    start_sample = max(0, int(offset * REFINE_SAMPLE_RATE))
+    n_samples = len(y)
+    segment = np.asarray(track_pcm[start_sample:start_sample + n_samples], dtype=np.float32)
+    if len(segment) < n_samples:
+        segment = np.pad(segment, (0, n_samples - len(segment)), mode='constant')
+    corr = correlate(y, segment, mode='full', method='fft')
+    # Пик на lag означает y[n + lag] ~ segment[n], то есть фрагмент начинается на lag раньше offset
+    lag = np.argmax(corr) - (n_samples - 1)
+    delta_sec = -lag / REFINE_SAMPLE_RATE
+    norm_corr = corr.max() / np.sqrt(np.dot(y, y) * np.dot(segment, segment))
+    return offset + delta_sec, round(float(norm_corr) * 100, 2)
+
+
+def _refine_offset_window(y, track_pcm, offset, max_lag):
+    """
+    Корреляция фрагмента (уже с частотой REFINE_SAMPLE_RATE) только по сдвигам ±max_lag отсчётов.
+    """
+    n_samples = len(y)
+    start_sample = int(offset * REFINE_SAMPLE_RATE) - max_lag
+    pad_left = max(0, -start_sample)
+    segment = np.asarray(track_pcm[max(0, start_sample):start_sample + n_samples + 2 * max_lag], dtype=np.float32)
+    segment = np.pad(segment, (pad_left, max(0, n_samples + 2 * max_lag - pad_left - len(segment))), mode='constant')
+    # corr[k] = sum(y[n] * segment[n + k]): фрагмент начинается на k - max_lag отсчётов позже offset
+    corr = correlate(segment, y, mode='valid', method='fft')
+    k = int(np.argmax(corr))
+    matched = segment[k:k + n_samples]
+    energy = np.sqrt(np.dot(y, y) * np.dot(matched, matched))
+    norm_corr = corr[k] / energy if energy > 0 else 0.0
+    return offset + (k - max_lag) / REFINE_SAMPLE_RATE, round(float(norm_corr) * 100, 2)
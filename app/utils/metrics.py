@@ -0,0 +1,152 @@
+import time
+import functools
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from prometheus_client import Counter, Gauge, Histogram, CONTENT_TYPE_LATEST, generate_latest
+from starlette.datastructures import MutableHeaders
+
+# Сетка бакетов от 1 мс до ~1 минуты: покрывает и хеширование, и ffmpeg/индексацию
+_STAGE_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+    1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+)
+
+STAGE_DURATION = Histogram(
+    "vmm_stage_duration_seconds",
+    "Длительность стадий конвейеров сопоставления и индексации",
+    ["pipeline", "stage"],
+    buckets=_STAGE_BUCKETS,
+)
+DB_POOL_CHECKOUT = Histogram(
+    "vmm_db_pool_checkout_seconds",
+    "Ожидание соединения из пула БД по маршрутам",
+    ["route"],
+    buckets=_STAGE_BUCKETS,
+)
+
+# Пул декодеров (app.utils.audio.DecoderPool)
+DECODE_DURATION = Histogram(
+    "vmm_decode_duration_seconds",
+    "Длительность декодирования: ffmpeg или чтение готового PCM без декодирования",
+    ["mode"],
+    buckets=_STAGE_BUCKETS,
+)
+DECODER_QUEUE_WAIT = Histogram(
+    "vmm_decoder_queue_wait_seconds",
+    "Ожидание свободного слота пула декодеров",
+    buckets=_STAGE_BUCKETS,
+)
+DECODER_IN_FLIGHT = Gauge("vmm_decoder_in_flight", "Декодирований выполняется сейчас")
+DECODER_CONCURRENCY_LIMIT = Gauge("vmm_decoder_concurrency_limit", "Предел одновременных декодирований")
+DECODED_AUDIO_SECONDS = Counter("vmm_decoded_audio_seconds_total", "Секунд аудио декодировано", ["mode"])
+DECODE_FAILURES = Counter("vmm_decode_failures_total", "Ошибки декодирования", ["reason"])
+LOOKUP_HASHES = Counter(
+    "vmm_lookup_hashes_total",
+    "Хеши фрагментов, запрошенные в БД, по профилю отпечатков и результату (found/missing)",
+    ["profile", "result"],
+)
+MATCH_RESULT_CACHE = Counter(
+    "vmm_match_result_cache_total",
+    "Результаты /match/audio: из кэша (hit), из одновременного одинакового запроса (coalesced), посчитанные (miss)",
+    ["result"],
+)
+
+# Допуск запросов сопоставления (app.utils.admission)
+ADMISSION_QUEUE_WAIT = Histogram(
+    "vmm_admission_queue_wait_seconds",
+    "Ожидание допуска запроса в очереди по маршрутам",
+    ["route"],
+    buckets=_STAGE_BUCKETS,
+)
+ADMISSION_IN_FLIGHT = Gauge("vmm_admission_in_flight", "Допущенных запросов выполняется сейчас")
+ADMISSION_QUEUED = Gauge("vmm_admission_queued", "Запросов ждут допуска")
+ADMISSION_RESERVED_BYTES = Gauge("vmm_admission_reserved_bytes", "Оценённая память допущенных запросов")
+ADMISSION_REJECTED = Counter(
+    "vmm_admission_rejected_total",
+    "Отклонённые запросы по маршрутам и причине (queue_full/timeout)",
+    ["route", "reason"],
+)
+
+# Список (stage, seconds) текущего запроса для заголовка Server-Timing
+_server_timings: ContextVar[list | None] = ContextVar("server_timings", default=None)
+
+
+def add_server_timing(stage: str, elapsed: float) -> None:
+    """
+    Добавляет стадию в Server-Timing текущего запроса (если он собирается).
+    """
+    timings = _server_timings.get()
+    if timings is not None:
+        timings.append((stage, elapsed))
+
+
+@contextmanager
+def timed(stage: str, pipeline: str = "match"):
+    """
+    Измеряет блок кода: пишет гистограмму и, если запрос собирает Server-Timing, добавляет стадию.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_DURATION.labels(pipeline, stage).observe(elapsed)
+        add_server_timing(stage, elapsed)
+
+
+def timed_stage(stage: str, pipeline: str = "match"):
+    """
+    Декоратор-вариант timed для синхронных функций.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with timed(stage, pipeline):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def server_timing_header(timings) -> str:
+    """
+    Формирует значение заголовка Server-Timing (длительности в мс).
+    """
+    return ", ".join(f"{stage};dur={elapsed * 1000:.1f}" for stage, elapsed in timings)
+
+
+class ServerTimingMiddleware:
+    """
+    ASGI-middleware: собирает стадии, измеренные через timed() во время запроса,
+    и добавляет их в заголовок Server-Timing вместе с общей длительностью.
+
+    Список стадий общий и для кода в пуле потоков: run_in_threadpool копирует
+    контекст, а копия ссылается на тот же список.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings = []
+        token = _server_timings.set(timings)
+        started = time.perf_counter()
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start" and timings:
+                entries = timings + [("total", time.perf_counter() - started)]
+                MutableHeaders(scope=message).append("Server-Timing", server_timing_header(entries))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _server_timings.reset(token)
+
+
+def render_metrics() -> tuple[bytes, str]:
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -0,0 +1,116 @@
+import os
+import uuid
+import logging
+
+import numpy as np
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models import AudioTrack
+from app.utils.audio import decoder_pool
+from app.utils.cache import TTLCache
+from app.utils.matching import REFINE_SAMPLE_RATE, to_refine_rate
+
+logger = logging.getLogger(__name__)
+
+
+class PcmCache:
+    """
+    Кэш дорожек для уточнения смещения: PCM int16 с частотой REFINE_SAMPLE_RATE
+    в файлах .npy, открытых через memory map.
+
+    Файл строится при индексации, а для старых дорожек — лениво из track_path
+    при первом обращении. После этого уточнение не зависит от исходного WAV
+    и не декодирует его: срез memmap читает только нужные страницы. Открытый memmap
+    используется, пока файл на диске тот же (сверяется inode): файл, удалённый или
+    пересобранный другим процессом, открывается заново.
+
+    Args:
+        directory (str): Каталог файлов кэша.
+        max_open (int): Сколько memmap держать открытыми (LRU).
+    """
+
+    def __init__(self, directory: str, max_open: int = 64):
+        self.directory = directory
+        self._open = TTLCache(max_size=max_open, ttl=float("inf"))
+
+    def path(self, track_id: int) -> str:
+        return os.path.join(self.directory, f"track_{track_id}.npy")
+
+    def build(self, track_id: int, y, sr: int) -> str:
+        """
+        Сохраняет копию дорожки (атомарно: запись во временный файл и rename).
+
+        Args:
+            track_id (int): ID аудиодорожки.
+            y (np.ndarray): Сигнал в диапазоне [-1, 1].
+            sr (int): Частота дискретизации сигнала (Гц).
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        pcm = np.clip(to_refine_rate(y, sr) * 32767.0, -32768, 32767).astype(np.int16)
+        path = self.path(track_id)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.save(f, pcm)
+        os.replace(tmp_path, path)
+        self._open.pop(track_id)
+        return path
+
+    def get(self, track_id: int, track_path: str | None = None) -> np.memmap:
+        """
+        Возвращает PCM дорожки (int16, REFINE_SAMPLE_RATE) через memory map.
+
+        Raises:
+            FileNotFoundError: Кэша нет, а исходный файл недоступен.
+        """
+        path = self.path(track_id)
+        cached = self._open.get(track_id)
+        if cached is not None:
+            pcm, inode = cached
+            try:
+                if os.stat(path).st_ino == inode:
+                    return pcm
+            except FileNotFoundError:
+                pass
+            self._open.pop(track_id)
+        if not os.path.exists(path):
+            if not track_path or not os.path.exists(track_path):
+                raise FileNotFoundError(f"Нет PCM-кэша и исходного файла для дорожки {track_id}")
+            logger.info("Строим PCM-кэш дорожки %d из %s", track_id, track_path)
+            self.build(track_id, decoder_pool.load(track_path, REFINE_SAMPLE_RATE), REFINE_SAMPLE_RATE)
+        inode = os.stat(path).st_ino
+        pcm = np.load(path, mmap_mode="r")
+        self._open.set(track_id, (pcm, inode))
+        return pcm
+
+    def remove(self, track_id: int) -> None:
+        self._open.pop(track_id)
+        try:
+            os.remove(self.path(track_id))
+        except FileNotFoundError:
+            pass
+
+
+track_pcm_cache = PcmCache(settings.PCM_CACHE_DIR, settings.PCM_CACHE_MAX_OPEN)
+
+_DELETED_TRACKS_KEY = "pcm_cache_deleted_tracks"
+
+
+@event.listens_for(Session, "before_flush")
+def _collect_deleted_tracks(session, flush_context, instances):
+    # Дорожки, удалённые через ORM (в том числе каскадом от фильма); файлы удаляются после commit
+    deleted = [obj.id for obj in session.deleted if isinstance(obj, AudioTrack)]
+    if deleted:
+        session.info.setdefault(_DELETED_TRACKS_KEY, set()).update(deleted)
+
+
+@event.listens_for(Session, "after_commit")
+def _remove_deleted_tracks(session):
+    for track_id in session.info.pop(_DELETED_TRACKS_KEY, ()):
+        track_pcm_cache.remove(track_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_deleted_tracks(session):
+    session.info.pop(_DELETED_TRACKS_KEY, None)
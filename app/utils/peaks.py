@@ -19,7 +19,11 @@ def extract_peaks(
     max_freq: float = 4000.0,
     threshold: float = 0.6,
     absolute_threshold: float | None = None,
-    max_peaks: int | None = None
+    max_peaks: int | None = None,
+    peaks_per_second: float | None = None,
+    bands: int = 1,
+    slice_seconds: float = 1.0,
+    median_kernel: int = 3
 ) -> tuple:
     """
     Извлекает локальные спектральные пики из аудиосигнала с применением
@@ -38,6 +42,15 @@ def extract_peaks(
         threshold (float): Относительный порог для пиков (например, 0.6).
         absolute_threshold (float|None): Абсолютный порог (если None — не применяем).
         max_peaks (int|None): Максимальное число пиков (берутся по амплитуде).
+        peaks_per_second (float|None): Бюджет пиков на секунду. В каждом отрезке
+            slice_seconds и в каждой из bands полос (логарифмическая шкала) остаётся
+            не больше peaks_per_second * slice_seconds / bands сильнейших пиков,
+            поэтому число пиков растёт линейно с длительностью, а тихие участки
+            не теряют пики в пользу громких. Порядок пиков не меняется.
+        bands (int): Число частотных полос для бюджета.
+        slice_seconds (float): Длина отрезка времени для бюджета (сек).
+        median_kernel (int): Окно медианного фильтра сигнала (отсчётов); 1 — без фильтра.
+            На 8 кГц окно в 3 отсчёта уже заметно срезает верх полосы.
 
     Returns:
         peak_times (np.ndarray): Времена пиков (сек).
@@ -61,7 +74,8 @@ def extract_peaks(
             )
 
     # Лёгкая фильтрация артефактов
-    audio_data = medfilt(audio_data, kernel_size=3)
+    if median_kernel > 1:
+        audio_data = medfilt(audio_data, kernel_size=median_kernel)
 
     # Построение спектрограммы
     try:
@@ -114,6 +128,17 @@ def extract_peaks(
 
     # Индексы пиков
     freq_idx, time_idx = np.where(peak_mask)
+
+    # Бюджет пиков по отрезкам времени и частотным полосам
+    if peaks_per_second is not None:
+        keep = _budget_peaks(
+            spec[freq_idx, time_idx], freqs[freq_idx], time_idx,
+            per_cell=max(1, int(np.ceil(peaks_per_second * slice_seconds / bands))),
+            frames_per_slice=max(1, int(round(slice_seconds * rate / hop_size))),
+            band_edges=np.geomspace(max(freqs[0], 1.0), freqs[-1], bands + 1)[1:-1],
+        )
+        freq_idx, time_idx = freq_idx[keep], time_idx[keep]
+
     peak_times = times[time_idx]
     peak_freqs = freqs[freq_idx] if return_freqs else None
     peak_amplitudes = spec[freq_idx, time_idx]  # всегда доступна для фильтрации
@@ -133,3 +158,17 @@ def extract_peaks(
 
     logger.info("Извлечено %d пиков", peak_times.size)
     return peak_times, peak_freqs, peak_amplitudes
+
+
+def _budget_peaks(amplitudes, peak_freqs, time_idx, per_cell, frames_per_slice, band_edges):
+    """
+    Индексы пиков, входящих в top-per_cell по амплитуде в своей ячейке
+    (отрезок времени x частотная полоса), в исходном порядке.
+    """
+    band = np.searchsorted(band_edges, peak_freqs, side="right")
+    cell = (time_idx // frames_per_slice) * (len(band_edges) + 1) + band
+    order = np.lexsort((-amplitudes, cell))
+    sorted_cell = cell[order]
+    starts = np.flatnonzero(np.r_[True, sorted_cell[1:] != sorted_cell[:-1]])
+    rank = np.arange(order.size) - np.repeat(starts, np.diff(np.r_[starts, order.size]))
+    return np.sort(order[rank < per_cell])
@@ -0,0 +1,138 @@
+"""
+CPU-конвейер хешей фрагмента: приведение к частоте профиля, полосовой фильтр, пики, хеши.
+
+Модуль не зависит от app.* (импорты относительные): он входит в клиентский пакет
+(см. client/), чтобы клиент строил ровно те же хеши, что и сервер.
+"""
+from contextlib import nullcontext
+
+import numpy as np
+from scipy.signal import butter, lfilter, resample_poly
+
+from .fingerprinting import generate_hashes_from_peaks
+from .peaks import extract_peaks
+from .profiles import FingerprintProfile, PipelineParams
+
+
+def as_float(x):
+    """
+    Время хеша как float с точностью до сотых (numpy-скаляры приводятся к float).
+    """
+    return round(float(x), 2)
+
+
+def _untimed(stage):
+    return nullcontext()
+
+
+def butter_bandpass(lowcut, highcut, fs, order=5):
+    nyq = 0.5 * fs
+    low = lowcut / nyq
+    high = highcut / nyq
+    b, a = butter(order, [low, high], btype='band')
+    return b, a
+
+
+def bandpass_filter(data, lowcut=100.0, highcut=4000.0, fs=16000, order=5):
+    b, a = butter_bandpass(lowcut, highcut, fs, order=order)
+    return lfilter(b, a, data)
+
+
+def to_profile_rate(y, sr, profile: FingerprintProfile):
+    """
+    Приводит сигнал к частоте профиля. 16 -> 8 кГц — децимация в 2 раза
+    с антиалиасинговым FIR-фильтром (resample_poly).
+    """
+    if sr == profile.sample_rate:
+        return y
+    return resample_poly(y, profile.sample_rate, sr).astype(np.float32)
+
+
+def apply_bandpass(y, sr, params: PipelineParams):
+    """
+    Полосовой фильтр профиля (или исходный сигнал, если фильтр не задан).
+    """
+    if params.bandpass is None:
+        return y
+    lowcut, highcut = params.bandpass
+    return bandpass_filter(y, lowcut=lowcut, highcut=highcut, fs=sr)
+
+
+def pair_order(times, freqs, params: PipelineParams):
+    """
+    Порядок пиков, в котором generate_hashes_from_peaks подбирает пары.
+
+    Returns:
+        np.ndarray | None: Индексы пиков или None, если порядок extract_peaks подходит как есть.
+    """
+    if params.pair_order == "time":
+        return np.lexsort((freqs, times))
+    return None
+
+
+def extract_fragment_peaks(y, sr, params: PipelineParams):
+    """
+    Извлекает пики фрагмента с параметрами поиска профиля.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray, np.ndarray]: Времена, частоты и амплитуды пиков.
+    """
+    return extract_peaks(
+        y, sr,
+        normalize=True,
+        return_freqs=True,
+        return_amplitudes=True,
+        **params.peaks
+    )
+
+
+def hash_fragment_peaks(peaks, freqs, anchor_amplitudes, params: PipelineParams):
+    """
+    Строит хеши фрагмента с параметрами поиска профиля.
+
+    Args:
+        anchor_amplitudes (np.ndarray|None): Амплитуды пиков. Если заданы, хеши упорядочены
+            по убыванию амплитуды опорного пика: самые надёжные якоря идут первыми.
+            В сам хеш амплитуды не входят.
+
+    Returns:
+        list[tuple[str, float]]: Список пар (hash, t1).
+    """
+    order = pair_order(peaks, freqs, params)
+    if order is not None:
+        peaks, freqs = peaks[order], freqs[order]
+        if anchor_amplitudes is not None:
+            anchor_amplitudes = np.asarray(anchor_amplitudes)[order]
+    hashes = generate_hashes_from_peaks(
+        peaks, freqs=freqs, amplitudes=None, return_anchors=True, **params.hashes
+    )
+    if anchor_amplitudes is not None and len(hashes):
+        amps = np.asarray(anchor_amplitudes)
+        hashes.sort(key=lambda item: -amps[item[2]])
+    return [(h, as_float(t1)) for h, t1, _ in hashes]
+
+
+def compute_fragment_hashes(y, sr, profile: FingerprintProfile, timer=_untimed):
+    """
+    Хеши фрагмента по параметрам поиска профиля.
+
+    Args:
+        y (np.ndarray): Моно-сигнал фрагмента.
+        sr (int): Частота дискретизации сигнала (Гц); приводится к частоте профиля.
+        profile (FingerprintProfile): Профиль дорожки, с которой сравнивается фрагмент.
+        timer (Callable[[str], ContextManager]): Замер стадий (на сервере — metrics.timed).
+
+    Returns:
+        list[tuple[str, float]]: Пары (hash, t1) от сильных якорей к слабым.
+    """
+    params = profile.query
+    filtered = y
+    if sr != profile.sample_rate:
+        with timer("resample"):
+            filtered = to_profile_rate(y, sr, profile)
+    with timer("bandpass"):
+        filtered = apply_bandpass(filtered, profile.sample_rate, params)
+    with timer("peaks"):
+        peaks, freqs, amplitudes = extract_fragment_peaks(filtered, profile.sample_rate, params)
+    with timer("hashing"):
+        return hash_fragment_peaks(peaks, freqs, amplitudes, params)
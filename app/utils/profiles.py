@@ -0,0 +1,131 @@
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Mapping
+
+
+@dataclass(frozen=True)
+class PipelineParams:
+    """
+    Параметры одной стороны конвейера отпечатков: полосовой фильтр, пики, хеши.
+
+    Args:
+        peaks (Mapping): Аргументы extract_peaks.
+        hashes (Mapping): Аргументы generate_hashes_from_peaks.
+        bandpass (tuple[float, float] | None): Полоса фильтра (Гц) или None без фильтрации.
+        pair_order (str): Порядок пиков при подборе пар: "frequency" — как возвращает
+            extract_peaks (по частоте, затем по времени), "time" — по времени.
+    """
+    peaks: Mapping
+    hashes: Mapping
+    bandpass: tuple[float, float] | None = (100.0, 4000.0)
+    pair_order: str = "frequency"
+
+
+@dataclass(frozen=True)
+class FingerprintProfile:
+    """
+    Именованная версия параметров отпечатков.
+
+    Хеш включает частоты пиков и квантованную разницу времён, поэтому отпечатки
+    дорожки и хеши фрагмента совпадают, только если посчитаны с одинаковыми
+    frame_size и time_precision. Каждая дорожка хранит версию профиля, с которым
+    проиндексирована, а поиск строит хеши фрагмента по профилю найденной дорожки.
+
+    Модуль не зависит от app.*: профили можно передавать в рабочие процессы.
+
+    Args:
+        version (int): Номер версии (хранится в audio_tracks.fingerprint_profile).
+        name (str): Короткое имя для логов и отчётов.
+        sample_rate (int): Частота дискретизации, на которой считаются пики (Гц).
+        track (PipelineParams): Параметры индексации дорожек.
+        query (PipelineParams): Параметры фрагментов поиска.
+    """
+    version: int
+    name: str
+    sample_rate: int
+    track: PipelineParams
+    query: PipelineParams
+
+    @property
+    def unified(self) -> bool:
+        return self.track == self.query
+
+
+def _params(**kwargs) -> Mapping:
+    return MappingProxyType(kwargs)
+
+
+# v1: исторические параметры, с которыми проиндексированы старые дорожки, без бюджета
+# пиков. Индексация и поиск расходятся по frame_size, порогу и точности времени,
+# поэтому хеши совпадают редко; нужен только для старых дорожек.
+LEGACY_PROFILE = FingerprintProfile(
+    version=1,
+    name="legacy",
+    sample_rate=16000,
+    track=PipelineParams(
+        peaks=_params(frame_size=1024, hop_size=256, min_freq=100.0, max_freq=4000.0, threshold=0.6),
+        hashes=_params(fan_value=15, min_delta=0.5, max_delta=8.0, time_precision=0.05),
+        bandpass=None,
+    ),
+    query=PipelineParams(
+        peaks=_params(frame_size=2048, hop_size=256, min_freq=100.0, max_freq=4000.0,
+                      threshold=0.8, absolute_threshold=0.2, max_peaks=800),
+        hashes=_params(fan_value=10, min_delta=0.5, max_delta=6.0, time_precision=0.01,
+                       target_density=80.0, max_hashes=200000),
+    ),
+)
+
+# v2: одни и те же фильтр, пики и хеши для индексации и поиска. Без абсолютного порога
+# (он зависит от нормализации, то есть от длины сигнала); пары подбираются по времени,
+# поэтому набор соседей пика не зависит от того, сколько пиков той же частоты в сигнале.
+_UNIFIED_PARAMS = PipelineParams(
+    peaks=_params(frame_size=2048, hop_size=256, min_freq=100.0, max_freq=4000.0,
+                  threshold=0.8, peaks_per_second=60.0, bands=6),
+    hashes=_params(fan_value=5, min_delta=0.0, max_delta=3.0, time_precision=0.05,
+                   target_density=80.0, max_hashes=5000000),
+    pair_order="time",
+)
+UNIFIED_PROFILE = FingerprintProfile(
+    version=2,
+    name="unified",
+    sample_rate=16000,
+    track=_UNIFIED_PARAMS,
+    query=_UNIFIED_PARAMS,
+)
+
+# v3: те же окна и частотная сетка, что у v2 (128 мс, шаг 16 мс, 7.8 Гц на бин), но сигнал
+# декодируется сразу в 8 кГц: STFT вдвое короче, а полосу 100–4000 Гц задают частота
+# Найквиста и маска частот extract_peaks вместо отдельного полосового фильтра во времени.
+# Медианный фильтр отключён: на 8 кГц он срезает верх полосы и точность падает.
+_NARROWBAND_PARAMS = PipelineParams(
+    peaks=_params(frame_size=1024, hop_size=128, min_freq=100.0, max_freq=4000.0,
+                  threshold=0.8, peaks_per_second=60.0, bands=6, median_kernel=1),
+    hashes=_UNIFIED_PARAMS.hashes,
+    bandpass=None,
+    pair_order="time",
+)
+NARROWBAND_PROFILE = FingerprintProfile(
+    version=3,
+    name="narrowband",
+    sample_rate=8000,
+    track=_NARROWBAND_PARAMS,
+    query=_NARROWBAND_PARAMS,
+)
+
+PROFILES = {profile.version: profile for profile in (LEGACY_PROFILE, UNIFIED_PROFILE, NARROWBAND_PROFILE)}
+DEFAULT_PROFILE_VERSION = UNIFIED_PROFILE.version
+
+
+def get_profile(version: int | None) -> FingerprintProfile:
+    """
+    Профиль по версии; None — дорожка без версии, проиндексированная до появления профилей.
+
+    Raises:
+        ValueError: Неизвестная версия.
+    """
+    if version is None:
+        return LEGACY_PROFILE
+    try:
+        return PROFILES[version]
+    except KeyError:
+        raise ValueError(f"Неизвестная версия профиля отпечатков: {version}") from None
@@ -0,0 +1,278 @@
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import pstats
+import cProfile
+import logging
+import threading
+import functools
+from contextvars import ContextVar
+
+from starlette.concurrency import run_in_threadpool as _starlette_run_in_threadpool
+
+logger = logging.getLogger(__name__)
+
+
+class ProfileSession:
+    """
+    Профиль одного запроса: потоки, которые на него работают, и собранные данные.
+
+    Args:
+        mode (str): "cprofile" — детерминированный профиль (pstats),
+            "sampling" — выборка стеков (speedscope).
+        interval (float): Период выборки стеков (сек) для режима "sampling".
+    """
+
+    def __init__(self, mode: str, interval: float = 0.005):
+        self.mode = mode
+        self.interval = interval
+        self.meta: dict = {}
+        self.thread_ids: set[int] = set()
+        self._profiles: list[cProfile.Profile] = []
+        self._samples: list[tuple[str, list[tuple[str, str, int]], float]] = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._sampler: threading.Thread | None = None
+
+    # --- регистрация потоков ---
+
+    def enter_thread(self):
+        """
+        Подключает текущий поток к сессии. Возвращает профилировщик (для cProfile) или None.
+        """
+        with self._lock:
+            self.thread_ids.add(threading.get_ident())
+        if self.mode != "cprofile":
+            return None
+        profiler = cProfile.Profile()
+        with self._lock:
+            self._profiles.append(profiler)
+        profiler.enable()
+        return profiler
+
+    def exit_thread(self, profiler) -> None:
+        if profiler is not None:
+            profiler.disable()
+        with self._lock:
+            self.thread_ids.discard(threading.get_ident())
+
+    # --- выборка стеков ---
+
+    def start_sampler(self) -> None:
+        if self.mode != "sampling":
+            return
+        self._sampler = threading.Thread(target=self._sample_loop, name="profile-sampler", daemon=True)
+        self._sampler.start()
+
+    def stop_sampler(self) -> None:
+        self._stop.set()
+        if self._sampler is not None:
+            self._sampler.join()
+
+    def _sample_loop(self) -> None:
+        last = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            now = time.perf_counter()
+            weight, last = (now - last) * 1000, now
+            frames = sys._current_frames()
+            with self._lock:
+                thread_ids = list(self.thread_ids)
+            for tid in thread_ids:
+                frame = frames.get(tid)
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append((code.co_name, code.co_filename, frame.f_lineno))
+                    frame = frame.f_back
+                if stack:
+                    self._samples.append((str(tid), stack[::-1], weight))
+
+    # --- сохранение ---
+
+    def write(self, path_base: str, duration_ms: float) -> str:
+        """
+        Сохраняет профиль (.pstats или .speedscope.json) и метаданные рядом (.meta.json).
+        """
+        if self.mode == "cprofile":
+            path = f"{path_base}.pstats"
+            stats = None
+            for profiler in self._profiles:
+                if stats is None:
+                    stats = pstats.Stats(profiler)
+                else:
+                    stats.add(profiler)
+            if stats is None:
+                return ""
+            stats.dump_stats(path)
+        else:
+            path = f"{path_base}.speedscope.json"
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(self._speedscope(os.path.basename(path_base), duration_ms), f)
+
+        with open(f"{path_base}.meta.json", "w", encoding="utf-8") as f:
+            json.dump({**self.meta, "duration_ms": round(duration_ms, 1), "mode": self.mode},
+                      f, ensure_ascii=False, default=str)
+        return path
+
+    def _speedscope(self, name: str, duration_ms: float) -> dict:
+        frames, frame_index = [], {}
+        by_thread: dict[str, dict] = {}
+        for thread, stack, weight in self._samples:
+            indices = []
+            for frame in stack:
+                if frame not in frame_index:
+                    frame_index[frame] = len(frames)
+                    frames.append({"name": frame[0], "file": frame[1], "line": frame[2]})
+                indices.append(frame_index[frame])
+            profile = by_thread.setdefault(thread, {"samples": [], "weights": []})
+            profile["samples"].append(indices)
+            profile["weights"].append(round(weight, 3))
+
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": name,
+            "exporter": "voice_movie_matcher",
+            "shared": {"frames": frames},
+            "profiles": [
+                {
+                    "type": "sampled",
+                    "name": f"thread {thread}",
+                    "unit": "milliseconds",
+                    "startValue": 0,
+                    "endValue": round(duration_ms, 3),
+                    "samples": data["samples"],
+                    "weights": data["weights"],
+                }
+                for thread, data in by_thread.items()
+            ],
+        }
+
+
+_cprofile_slot = threading.Lock()
+_active_session: ContextVar[ProfileSession | None] = ContextVar("profile_session", default=None)
+
+
+def annotate_profile(**meta) -> None:
+    """
+    Добавляет метаданные (movie_id, длительность фрагмента, число хешей...) к профилю текущего запроса.
+    """
+    session = _active_session.get()
+    if session is not None:
+        session.meta.update(meta)
+
+
+async def run_in_threadpool(func, *args, **kwargs):
+    """
+    Замена starlette.concurrency.run_in_threadpool: если запрос профилируется,
+    поток пула подключается к профилю на время выполнения func.
+    """
+    session = _active_session.get()
+    if session is None:
+        return await _starlette_run_in_threadpool(func, *args, **kwargs)
+
+    @functools.wraps(func)
+    def profiled(*a, **kw):
+        profiler = session.enter_thread()
+        try:
+            return func(*a, **kw)
+        finally:
+            session.exit_thread(profiler)
+
+    return await _starlette_run_in_threadpool(profiled, *args, **kwargs)
+
+
+def _rotate(directory: str, max_files: int) -> None:
+    """
+    Оставляет в каталоге не более max_files профилей (самые старые удаляются вместе с метаданными).
+    """
+    entries = []
+    for name in os.listdir(directory):
+        if name.endswith(".meta.json"):
+            continue
+        path = os.path.join(directory, name)
+        entries.append((os.path.getmtime(path), path))
+    entries.sort()
+    for _, path in entries[:max(0, len(entries) - max_files)]:
+        base = path.removesuffix(".pstats").removesuffix(".speedscope.json")
+        for victim in (path, f"{base}.meta.json"):
+            try:
+                os.remove(victim)
+            except OSError:
+                pass
+
+
+class ProfilingMiddleware:
+    """
+    Выборочное профилирование запросов (opt-in).
+
+    Доля sample_rate запросов профилируется cProfile целиком (.pstats).
+    Остальные запросы при заданном slow_ms сопровождаются дешёвой выборкой стеков,
+    которая сохраняется (speedscope) только если запрос оказался медленнее порога.
+    В профиль попадают поток event loop и потоки пула, выполняющие работу запроса
+    через app.utils.profiling.run_in_threadpool. Профиль потока event loop включает
+    и параллельно выполняющиеся корутины других запросов.
+    """
+
+    def __init__(self, app, paths, directory: str, sample_rate: float = 0.0,
+                 slow_ms: float = 0.0, max_files: int = 50, interval_ms: float = 5.0):
+        self.app = app
+        self.paths = tuple(paths)
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.slow_ms = slow_ms
+        self.max_files = max_files
+        self.interval = interval_ms / 1000
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith(self.paths):
+            await self.app(scope, receive, send)
+            return
+
+        # cProfile в потоке event loop один на процесс: параллельный запрос уходит в выборку стеков
+        if self.sample_rate > 0 and random.random() < self.sample_rate and _cprofile_slot.acquire(blocking=False):
+            session = ProfileSession("cprofile")
+        elif self.slow_ms > 0:
+            session = ProfileSession("sampling", interval=self.interval)
+        else:
+            await self.app(scope, receive, send)
+            return
+
+        session.meta.update(path=scope["path"], method=scope["method"], started_at=time.time())
+        status = {}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        token = _active_session.set(session)
+        loop_profiler = session.enter_thread()
+        session.start_sampler()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            duration_ms = (time.perf_counter() - started) * 1000
+            session.exit_thread(loop_profiler)
+            session.stop_sampler()
+            if session.mode == "cprofile":
+                _cprofile_slot.release()
+            _active_session.reset(token)
+            session.meta["status_code"] = status.get("code")
+            if session.mode == "cprofile" or duration_ms >= self.slow_ms:
+                await _starlette_run_in_threadpool(self._save, session, scope["path"], duration_ms)
+
+    def _save(self, session: ProfileSession, path: str, duration_ms: float) -> None:
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            slug = path.strip("/").replace("/", "_") or "root"
+            stamp = time.strftime("%Y%m%d-%H%M%S")
+            base = os.path.join(self.directory, f"{stamp}_{slug}_{int(duration_ms)}ms_{uuid.uuid4().hex[:8]}")
+            written = session.write(base, duration_ms)
+            _rotate(self.directory, self.max_files)
+            logger.info("Профиль запроса %s (%.0f мс) сохранён: %s", path, duration_ms, written)
+        except Exception as e:
+            logger.warning("Не удалось сохранить профиль запроса %s: %s", path, e)
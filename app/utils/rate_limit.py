@@ -0,0 +1,67 @@
+import time
+import threading
+from collections import deque
+
+
+class SlidingWindowRateLimiter:
+    """
+    Ограничитель частоты попыток по ключу (email, IP) со скользящим окном.
+
+    Args:
+        max_attempts (int): Допустимое число попыток в окне.
+        window (float): Длина окна (сек).
+        max_keys (int): Максимальное число отслеживаемых ключей.
+    """
+
+    def __init__(self, max_attempts: int, window: float, max_keys: int = 10000):
+        self.max_attempts = max_attempts
+        self.window = window
+        self.max_keys = max_keys
+        self._attempts: dict[str, deque] = {}
+        self._lock = threading.Lock()
+
+    def _prune(self, attempts: deque, now: float) -> None:
+        while attempts and attempts[0] <= now - self.window:
+            attempts.popleft()
+
+    def hit(self, key: str) -> bool:
+        """
+        Регистрирует попытку. Возвращает False, если лимит для ключа уже исчерпан.
+        """
+        now = time.monotonic()
+        with self._lock:
+            attempts = self._attempts.get(key)
+            if attempts is None:
+                if len(self._attempts) >= self.max_keys:
+                    self._evict_idle(now)
+                attempts = self._attempts[key] = deque()
+            self._prune(attempts, now)
+            if len(attempts) >= self.max_attempts:
+                return False
+            attempts.append(now)
+            return True
+
+    def retry_after(self, key: str) -> float:
+        """
+        Сколько секунд осталось до освобождения следующей попытки.
+        """
+        now = time.monotonic()
+        with self._lock:
+            attempts = self._attempts.get(key)
+            if not attempts or len(attempts) < self.max_attempts:
+                return 0.0
+            return max(0.0, attempts[0] + self.window - now)
+
+    def reset(self, key: str) -> None:
+        with self._lock:
+            self._attempts.pop(key, None)
+
+    def _evict_idle(self, now: float) -> None:
+        for key in list(self._attempts):
+            attempts = self._attempts[key]
+            self._prune(attempts, now)
+            if not attempts:
+                del self._attempts[key]
+        # если все ключи активны — вытесняем самые старые
+        while len(self._attempts) >= self.max_keys:
+            del self._attempts[next(iter(self._attempts))]
@@ -0,0 +1,262 @@
+import logging
+from collections import Counter, deque
+
+import numpy as np
+from scipy.signal import firwin, lfilter
+
+from app.utils.peaks import extract_peaks
+from app.utils.fingerprinting import generate_hashes_from_peaks
+from app.utils.metrics import timed
+from app.utils.profiles import FingerprintProfile, get_profile, DEFAULT_PROFILE_VERSION
+from app.utils.pipeline import as_float
+from app.utils.matching import (
+    DELTA_TOLERANCE,
+    butter_bandpass,
+    pair_order,
+    offset_bin,
+    best_with_margin,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class StreamingDecimator:
+    """
+    Понижение частоты потока в factor раз: антиалиасинговый FIR-фильтр с состоянием
+    между блоками и прореживание. Задержка фильтра кратна factor и компенсируется,
+    поэтому k-й выходной отсчёт соответствует отсчёту k * factor входного потока.
+
+    Args:
+        factor (int): Кратность понижения частоты.
+        taps_per_phase (int): Длина фильтра в отсчётах на фазу (больше — круче срез).
+    """
+
+    def __init__(self, factor: int, taps_per_phase: int = 16):
+        self.factor = factor
+        numtaps = 2 * factor * taps_per_phase + 1
+        self._taps = firwin(numtaps, 0.95 / factor)
+        self._zi = np.zeros(numtaps - 1)
+        self._delay = (numtaps - 1) // 2
+        self._position = 0  # номер следующего входного отсчёта
+
+    def push(self, samples: np.ndarray) -> np.ndarray:
+        filtered, self._zi = lfilter(self._taps, 1.0, samples, zi=self._zi)
+        first = self._position
+        self._position += len(samples)
+        start = max(first, self._delay)
+        start += -(start - self._delay) % self.factor
+        return filtered[start - first::self.factor]
+
+
+class StreamingPeakExtractor:
+    """
+    Инкрементальное извлечение пиков из непрерывного потока отсчётов.
+
+    Полосовой фильтр переносит своё состояние между блоками (результат совпадает
+    с фильтрацией всего сигнала целиком). Если частота профиля ниже частоты потока,
+    поток после фильтра прореживается (StreamingDecimator). extract_peaks вызывается на буфере
+    с перекрытием: пики у краёв буфера, на которые влияют паддинг STFT, медианный
+    фильтр и 3x3-поиск максимумов, откладываются до следующего вызова. Начало буфера
+    всегда кратно hop_size, поэтому сетка кадров совпадает с сеткой всего потока.
+
+    Args:
+        sr (int): Частота дискретизации потока (Гц).
+        step_seconds (float): Минимальный прирост аудио между вызовами extract_peaks (сек).
+        peak_params (dict): Параметры extract_peaks (по умолчанию — параметры поиска профиля по умолчанию).
+        bandpass (tuple[float, float] | None): Полоса фильтра (Гц) или None без фильтрации.
+        decimation (int): Во сколько раз понизить частоту перед извлечением пиков.
+    """
+
+    def __init__(self, sr: int, step_seconds: float = 0.5, peak_params: dict | None = None,
+                 bandpass: tuple[float, float] | None = (100.0, 4000.0), decimation: int = 1):
+        self.sr = sr // decimation
+        if peak_params is None:
+            peak_params = get_profile(DEFAULT_PROFILE_VERSION).query.peaks
+        self.params = dict(peak_params)
+        # Ограничение числа пиков относится ко всему фрагменту, а не к окну потока
+        self.params.pop("max_peaks", None)
+        self.hop = self.params["hop_size"]
+        self.margin = (self.params["frame_size"] // 2 // self.hop + 2) * self.hop
+        self.step = max(self.hop, int(step_seconds * self.sr) // self.hop * self.hop)
+
+        self._bandpass = None
+        if bandpass is not None:
+            b, a = butter_bandpass(*bandpass, sr)
+            self._bandpass = (b, a, np.zeros(max(len(a), len(b)) - 1))
+        self._decimator = StreamingDecimator(decimation) if decimation > 1 else None
+        self._buffer = np.zeros(0, dtype=np.float32)
+        self._buffer_start = 0     # номер первого отсчёта буфера в потоке
+        self._emitted_until = 0    # отсчёт, до которого пики уже выданы
+        self.total_samples = 0
+
+    @property
+    def stream_time(self) -> float:
+        return self.total_samples / self.sr
+
+    def push(self, samples: np.ndarray):
+        """
+        Добавляет блок отсчётов.
+
+        Returns:
+            tuple[np.ndarray, np.ndarray] | None: Новые пики (время в секундах от начала
+            потока, частота) или None, если накоплено меньше step.
+        """
+        filtered = samples
+        if self._bandpass is not None:
+            b, a, zi = self._bandpass
+            filtered, zi = lfilter(b, a, filtered, zi=zi)
+            self._bandpass = (b, a, zi)
+        if self._decimator is not None:
+            filtered = self._decimator.push(filtered)
+        self._buffer = np.concatenate([self._buffer, filtered.astype(np.float32)])
+        self.total_samples += len(filtered)
+
+        safe_end = (self.total_samples - self.margin) // self.hop * self.hop
+        if safe_end - self._emitted_until < self.step:
+            return None
+
+        times, freqs, _ = extract_peaks(
+            self._buffer, self.sr, normalize=True, return_freqs=True, return_amplitudes=False, **self.params
+        )
+        half_hop = self.hop / self.sr / 2
+        times = times.astype(np.float64) + self._buffer_start / self.sr
+        keep = (times >= self._emitted_until / self.sr - half_hop) & (times < safe_end / self.sr - half_hop)
+        times, freqs = times[keep], freqs[keep]
+
+        self._emitted_until = safe_end
+        new_start = max(self._buffer_start, safe_end - self.margin)
+        self._buffer = self._buffer[new_start - self._buffer_start:]
+        self._buffer_start = new_start
+        return times, freqs
+
+
+class LiveMatcher:
+    """
+    Сопоставление непрерывного потока с одной аудиодорожкой.
+
+    Хранит пики и голоса за последние window_seconds. После каждого шага хеши
+    пересчитываются по окну пиков, дальше идут только ещё не выданные пары (hash, t1):
+    пара появляется, как только пришёл её второй пик, поэтому задержка обновления
+    ограничена шагом, а не длиной окна.
+
+    Args:
+        sr (int): Частота дискретизации потока (Гц).
+        step_seconds (float): Шаг извлечения пиков (сек).
+        window_seconds (float): Длина окна пиков и голосов (сек).
+        min_votes (int): Минимум голосов за лучшее смещение.
+        min_margin (int): Минимальный отрыв лучшего смещения от второго (голосов).
+        update_interval (float): Как часто повторять обновление при удержании захвата (сек).
+        max_offsets (int|None): Хеши с большим числом смещений в дорожке не голосуют.
+        profile (FingerprintProfile|None): Профиль отпечатков дорожки.
+    """
+
+    def __init__(self, sr: int, step_seconds: float, window_seconds: float, min_votes: int,
+                 min_margin: int, update_interval: float, tolerance: float = DELTA_TOLERANCE,
+                 max_offsets: int | None = None, profile: FingerprintProfile | None = None):
+        profile = profile or get_profile(DEFAULT_PROFILE_VERSION)
+        if sr % profile.sample_rate:
+            raise ValueError(f"Частота потока {sr} Гц не кратна частоте профиля {profile.sample_rate} Гц")
+        self.params = profile.query
+        self.extractor = StreamingPeakExtractor(sr, step_seconds, self.params.peaks, self.params.bandpass,
+                                                decimation=sr // profile.sample_rate)
+        self.window = window_seconds
+        self.min_votes = min_votes
+        self.min_margin = min_margin
+        self.update_interval = update_interval
+        self.tolerance = tolerance
+        self.max_offsets = max_offsets
+
+        self._times = np.zeros(0)
+        self._freqs = np.zeros(0, dtype=np.float32)
+        self._seen: dict[tuple[str, float], float] = {}
+        self._votes: deque[tuple[float, float]] = deque()
+        self.counts: Counter = Counter()
+        self.locked_offset: float | None = None
+        self._last_update = 0.0
+
+    def process(self, samples: np.ndarray) -> list[tuple[str, float]]:
+        """
+        CPU-часть шага: пики и новые хеши окна.
+
+        Returns:
+            list[tuple[str, float]]: Ещё не выданные пары (hash, t1); t1 — от начала потока.
+        """
+        with timed("peaks", pipeline="live"):
+            result = self.extractor.push(samples)
+        if result is None:
+            return []
+        times, freqs = result
+        window_start = self.extractor.stream_time - self.window
+
+        keep = self._times >= window_start
+        self._times = np.concatenate([self._times[keep], times])
+        self._freqs = np.concatenate([self._freqs[keep], freqs])
+        if self._times.size < 2:
+            return []
+
+        with timed("hashing", pipeline="live"):
+            # Тот же порядок пар, что у fragment_hashes, иначе хеши не совпадут
+            # с отпечатками дорожки: окно собрано из кусков и исходный порядок extract_peaks
+            # (по частоте, затем по времени) восстанавливается явно
+            order = pair_order(self._times, self._freqs, self.params)
+            if order is None:
+                order = np.lexsort((self._times, self._freqs))
+            hashes = generate_hashes_from_peaks(
+                self._times[order], freqs=self._freqs[order], amplitudes=None, **self.params.hashes
+            )
+            new_hashes = []
+            for h, t1 in hashes:
+                key = (h, as_float(t1))
+                if key not in self._seen:
+                    self._seen[key] = key[1]
+                    new_hashes.append(key)
+            self._seen = {k: t for k, t in self._seen.items() if t >= window_start}
+        return new_hashes
+
+    def vote(self, hashes, fps_dict) -> dict | None:
+        """
+        Добавляет голоса новых хешей, забывает голоса старше окна.
+
+        Returns:
+            dict | None: Событие для клиента ("match" или "lost") или None.
+        """
+        stream_time = self.extractor.stream_time
+        for h, t1 in hashes:
+            offsets = fps_dict.get(h, ())
+            if self.max_offsets is not None and len(offsets) > self.max_offsets:
+                continue
+            for t2 in offsets:
+                bin_delta = offset_bin(t2 - t1, self.tolerance)
+                self._votes.append((t1, bin_delta))
+                self.counts[bin_delta] += 1
+        while self._votes and self._votes[0][0] < stream_time - self.window:
+            _, bin_delta = self._votes.popleft()
+            self.counts[bin_delta] -= 1
+            if self.counts[bin_delta] <= 0:
+                del self.counts[bin_delta]
+
+        if not self.counts:
+            return self._lost(stream_time)
+        offset, score, runner_up = best_with_margin(self.counts, self.tolerance)
+        if score < self.min_votes or score - runner_up < self.min_margin:
+            return self._lost(stream_time)
+
+        changed = self.locked_offset is None or abs(offset - self.locked_offset) > self.tolerance * 1.5
+        if not changed and stream_time - self._last_update < self.update_interval:
+            return None
+        self.locked_offset = offset
+        self._last_update = stream_time
+        return {
+            "type": "match",
+            "offset": float(offset),
+            "position": round(float(offset) + stream_time, 3),
+            "stream_time": round(stream_time, 3),
+            "score": int(score),
+            "runner_up": int(runner_up),
+        }
+
+    def _lost(self, stream_time):
+        if self.locked_offset is None:
+            return None
+        self.locked_offset = None
+        return {"type": "lost", "stream_time": round(stream_time, 3)}
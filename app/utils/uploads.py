@@ -0,0 +1,420 @@
+import os
+import re
+import json
+import time
+import uuid
+import asyncio
+import threading
+import hashlib
+import logging
+from dataclasses import dataclass, asdict
+
+from fastapi import HTTPException
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse
+
+from app.config import settings
+from app.utils.admission import request_content_length
+from app.utils.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+UPLOADS_DIR = "media/uploads"
+_UPLOAD_ID_RE = re.compile(r"^[0-9a-f]{32}$")
+_SHA256_RE = re.compile(r"^[0-9a-f]{64}$")
+
+
+@dataclass
+class StoredUpload:
+    """
+    Сохранённый файл: путь, размер и SHA-256 содержимого.
+    """
+    path: str
+    size: int
+    sha256: str
+
+
+def too_large(max_bytes: int) -> HTTPException:
+    return HTTPException(status_code=413, detail=f"Файл больше допустимого размера ({_format_size(max_bytes)})")
+
+
+def _format_size(n: int) -> str:
+    for unit in ("Б", "КБ", "МБ"):
+        if n < 1024:
+            return f"{n:.4g} {unit}"
+        n /= 1024
+    return f"{n:.4g} ГБ"
+
+
+def _remove(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def write_upload(upload, path: str, max_bytes: int, chunk_size: int | None = None) -> StoredUpload:
+    """
+    Копирует загруженный файл в path блоками chunk_size, считая SHA-256 по ходу записи.
+
+    Размер, известный после разбора формы, проверяется до записи; иначе копирование
+    прерывается, как только файл превысил max_bytes. Недописанный файл удаляется.
+    Синхронная: асинхронный код вызывает save_upload.
+
+    Args:
+        upload (UploadFile): Файл из формы.
+        path (str): Итоговый путь файла.
+        max_bytes (int): Предельный размер (байт).
+        chunk_size (int|None): Размер блока (по умолчанию UPLOAD_CHUNK_SIZE).
+
+    Raises:
+        HTTPException: 413, если файл больше max_bytes.
+    """
+    if upload.size is not None and upload.size > max_bytes:
+        raise too_large(max_bytes)
+    chunk_size = chunk_size or settings.UPLOAD_CHUNK_SIZE
+    digest = hashlib.sha256()
+    size = 0
+    upload.file.seek(0)
+    try:
+        with open(path, "wb") as out:
+            while chunk := upload.file.read(chunk_size):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise too_large(max_bytes)
+                digest.update(chunk)
+                out.write(chunk)
+    except BaseException:
+        _remove(path)
+        raise
+    return StoredUpload(path=path, size=size, sha256=digest.hexdigest())
+
+
+async def save_upload(upload, path: str, max_bytes: int, chunk_size: int | None = None) -> StoredUpload:
+    """
+    write_upload в пуле потоков (файл формы после разбора лежит во временном файле на диске).
+    """
+    return await run_in_threadpool(write_upload, upload, path, max_bytes, chunk_size)
+
+
+class UploadLimitMiddleware:
+    """
+    ASGI-middleware: предел размера тела запроса по путям, проверяемый до разбора multipart.
+
+    Запрос с Content-Length больше предела сразу получает 413, тело не читается.
+    Без Content-Length (chunked) тело считается по мере чтения, и чтение прерывается
+    HTTPException 413, как только предел превышен, — до того как Starlette
+    сохранит всю форму во временные файлы.
+
+    Args:
+        limits (dict[str, int]): Путь -> предельный размер тела (байт).
+    """
+
+    def __init__(self, app, limits: dict[str, int]):
+        self.app = app
+        self.limits = dict(limits)
+
+    async def __call__(self, scope, receive, send):
+        limit = self.limits.get(scope["path"]) if scope["type"] == "http" else None
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+
+        content_length = request_content_length(scope)
+        if content_length is not None and content_length > limit:
+            error = too_large(limit)
+            await JSONResponse({"detail": error.detail}, status_code=error.status_code)(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    raise too_large(limit)
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+@dataclass
+class ResumableUpload:
+    """
+    Метаданные возобновляемой загрузки (файл upload_{upload_id}.meta.json рядом с данными).
+    """
+    upload_id: str
+    filename: str
+    size: int
+    sha256: str | None
+    created_at: float
+    complete: bool = False
+
+
+class ResumableUploads:
+    """
+    Возобновляемые загрузки больших файлов (дорожки, фильмы) частями.
+
+    Клиент объявляет имя и размер файла (create), затем отправляет части сырым телом
+    запроса с указанием смещения (append). Части пишутся сразу в файл в directory, без
+    разбора multipart и временных копий; после обрыва загрузка продолжается со смещения,
+    которое возвращает status. SHA-256 считается по ходу записи (состояние хеша хранится
+    в памяти процесса; если его нет, уже загруженная часть перечитывается). Когда файл
+    получен целиком, хеш сверяется с объявленным, а файл переименовывается в итоговый.
+    Готовый файл забирает эндпоинт загрузки дорожки или фильма (take) по upload_id.
+
+    Параллельные части одной загрузки в процессе выполняются по очереди; смещение
+    всегда сверяется с размером файла на диске. Объявленные размеры всех загрузок
+    в каталоге вместе не превышают max_reserved_bytes, устаревшие загрузки удаляются
+    при каждом объявлении и при каждой части.
+
+    Args:
+        directory (str): Каталог файлов загрузок.
+        max_bytes (int): Предельный размер файла (байт).
+        max_reserved_bytes (int): Предельный суммарный размер загрузок в каталоге (байт).
+        ttl_seconds (float): Время жизни незавершённой или не забранной загрузки (сек).
+        chunk_size (int): Размер блока записи на диск (байт).
+    """
+
+    def __init__(self, directory: str, max_bytes: int, max_reserved_bytes: int,
+                 ttl_seconds: float, chunk_size: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_reserved_bytes = max_reserved_bytes
+        self.ttl_seconds = ttl_seconds
+        self.chunk_size = chunk_size
+        self._hashers = TTLCache(max_size=256, ttl=ttl_seconds)
+        self._locks: dict[str, asyncio.Lock] = {}
+        self._create_lock = threading.Lock()
+
+    def _meta_path(self, upload_id: str) -> str:
+        return os.path.join(self.directory, f"upload_{upload_id}.meta.json")
+
+    def _part_path(self, upload_id: str) -> str:
+        return os.path.join(self.directory, f"upload_{upload_id}.part")
+
+    def _final_path(self, upload: ResumableUpload) -> str:
+        ext = os.path.splitext(upload.filename)[1].lower()
+        return os.path.join(self.directory, f"upload_{upload.upload_id}{ext}")
+
+    def _save(self, upload: ResumableUpload) -> None:
+        path = self._meta_path(upload.upload_id)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(asdict(upload), f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def _load(self, upload_id: str) -> ResumableUpload:
+        if not _UPLOAD_ID_RE.match(upload_id or ""):
+            raise HTTPException(status_code=404, detail="Загрузка не найдена")
+        try:
+            with open(self._meta_path(upload_id), encoding="utf-8") as f:
+                return ResumableUpload(**json.load(f))
+        except FileNotFoundError:
+            raise HTTPException(status_code=404, detail="Загрузка не найдена")
+
+    def _offset(self, upload: ResumableUpload) -> int:
+        if upload.complete:
+            return upload.size
+        try:
+            return os.path.getsize(self._part_path(upload.upload_id))
+        except FileNotFoundError:
+            return 0
+
+    def _status(self, upload: ResumableUpload) -> dict:
+        return {
+            "upload_id": upload.upload_id,
+            "filename": upload.filename,
+            "size": upload.size,
+            "offset": self._offset(upload),
+            "complete": upload.complete,
+            "sha256": upload.sha256 if upload.complete else None,
+        }
+
+    def _discard(self, upload: ResumableUpload) -> None:
+        for path in (self._part_path(upload.upload_id), self._final_path(upload), self._meta_path(upload.upload_id)):
+            _remove(path)
+        self._hashers.pop(upload.upload_id)
+        self._locks.pop(upload.upload_id, None)
+
+    def _uploads(self):
+        if not os.path.isdir(self.directory):
+            return
+        for name in os.listdir(self.directory):
+            if not (name.startswith("upload_") and name.endswith(".meta.json")):
+                continue
+            upload_id = name[len("upload_"):-len(".meta.json")]
+            try:
+                yield self._load(upload_id)
+            except (HTTPException, ValueError, TypeError):
+                continue
+
+    def sweep(self) -> int:
+        """
+        Удаляет загрузки старше ttl_seconds.
+
+        Returns:
+            int: Число удалённых загрузок.
+        """
+        removed = 0
+        deadline = time.time() - self.ttl_seconds
+        for upload in self._uploads():
+            if upload.created_at < deadline:
+                self._discard(upload)
+                removed += 1
+        if removed:
+            logger.info("Удалено устаревших загрузок: %d", removed)
+        return removed
+
+    def reserved_bytes(self) -> int:
+        """
+        Суммарный объявленный размер загрузок в каталоге (незавершённых и не забранных).
+        """
+        return sum(upload.size for upload in self._uploads())
+
+    def create(self, filename: str, size: int, sha256: str | None = None) -> dict:
+        """
+        Объявляет новую загрузку.
+
+        Raises:
+            HTTPException: 400 — некорректные размер или хеш, 413 — файл больше max_bytes,
+                507 — загрузка не помещается в max_reserved_bytes.
+        """
+        if size <= 0:
+            raise HTTPException(status_code=400, detail="Размер файла должен быть положительным")
+        if size > self.max_bytes:
+            raise too_large(self.max_bytes)
+        if sha256 is not None:
+            sha256 = sha256.lower()
+            if not _SHA256_RE.match(sha256):
+                raise HTTPException(status_code=400, detail="sha256 должен быть 64 шестнадцатеричными символами")
+        with self._create_lock:
+            self.sweep()
+            reserved = self.reserved_bytes()
+            if reserved + size > self.max_reserved_bytes:
+                raise HTTPException(
+                    status_code=507,
+                    detail=f"Недостаточно места для загрузки: занято {_format_size(reserved)} "
+                           f"из {_format_size(self.max_reserved_bytes)}",
+                )
+            os.makedirs(self.directory, exist_ok=True)
+            upload = ResumableUpload(
+                upload_id=uuid.uuid4().hex,
+                filename=os.path.basename(filename),
+                size=size,
+                sha256=sha256,
+                created_at=time.time(),
+            )
+            open(self._part_path(upload.upload_id), "wb").close()
+            self._save(upload)
+        return self._status(upload)
+
+    def status(self, upload_id: str) -> dict:
+        return self._status(self._load(upload_id))
+
+    async def _hasher(self, upload_id: str, offset: int):
+        state = self._hashers.get(upload_id)
+        if state is not None and state[0] == offset:
+            return state[1]
+
+        def rehash():
+            digest = hashlib.sha256()
+            with open(self._part_path(upload_id), "rb") as f:
+                while chunk := f.read(self.chunk_size):
+                    digest.update(chunk)
+            return digest
+
+        return await run_in_threadpool(rehash)
+
+    async def append(self, upload_id: str, offset: int, stream, content_length: int | None = None) -> dict:
+        """
+        Дописывает часть файла с позиции offset из асинхронного потока байтов (тело запроса).
+
+        Прочитанное до обрыва соединения остаётся на диске: клиент продолжает со
+        смещения из status.
+
+        Raises:
+            HTTPException: 404 — загрузки нет, 409 — offset не равен загруженному или загрузка
+                завершена, 413 — часть выходит за объявленный размер, 400 — хеш не совпал
+                (загрузка начинается заново).
+        """
+        await run_in_threadpool(self.sweep)
+        lock = self._locks.setdefault(upload_id, asyncio.Lock())
+        async with lock:
+            upload = self._load(upload_id)
+            if upload.complete:
+                raise HTTPException(status_code=409, detail="Загрузка уже завершена")
+            current = self._offset(upload)
+            if offset != current:
+                raise HTTPException(status_code=409, detail={"message": "Неверное смещение части", "offset": current})
+            if content_length is not None and offset + content_length > upload.size:
+                raise HTTPException(status_code=413, detail="Часть выходит за объявленный размер файла")
+
+            digest = await self._hasher(upload_id, current)
+            written = current
+            buffer = bytearray()
+
+            def flush(f, data):
+                f.write(data)
+                digest.update(data)
+
+            with open(self._part_path(upload_id), "ab") as f:
+                try:
+                    async for chunk in stream:
+                        if written + len(buffer) + len(chunk) > upload.size:
+                            raise HTTPException(status_code=413, detail="Часть выходит за объявленный размер файла")
+                        buffer += chunk
+                        if len(buffer) >= self.chunk_size:
+                            await run_in_threadpool(flush, f, bytes(buffer))
+                            written += len(buffer)
+                            buffer.clear()
+                finally:
+                    if buffer:
+                        flush(f, bytes(buffer))
+                        written += len(buffer)
+                    self._hashers.set(upload_id, (written, digest))
+
+            if written == upload.size:
+                self._complete(upload, digest.hexdigest())
+            return self._status(upload)
+
+    def _complete(self, upload: ResumableUpload, sha256: str) -> None:
+        self._hashers.pop(upload.upload_id)
+        if upload.sha256 is not None and upload.sha256 != sha256:
+            open(self._part_path(upload.upload_id), "wb").close()
+            raise HTTPException(status_code=400, detail="SHA-256 не совпадает, загрузите файл заново")
+        os.replace(self._part_path(upload.upload_id), self._final_path(upload))
+        upload.sha256 = sha256
+        upload.complete = True
+        self._save(upload)
+        logger.info("Загрузка %s завершена: %s, %d байт, sha256=%s",
+                    upload.upload_id, upload.filename, upload.size, sha256)
+
+    def take(self, upload_id: str) -> StoredUpload:
+        """
+        Передаёт завершённую загрузку вызывающему: файл остаётся на месте, метаданные удаляются.
+
+        Raises:
+            HTTPException: 404 — загрузки нет, 409 — загрузка не завершена.
+        """
+        upload = self._load(upload_id)
+        if not upload.complete:
+            raise HTTPException(status_code=409, detail={"message": "Загрузка не завершена",
+                                                         "offset": self._offset(upload)})
+        _remove(self._meta_path(upload_id))
+        self._locks.pop(upload_id, None)
+        return StoredUpload(path=self._final_path(upload), size=upload.size, sha256=upload.sha256)
+
+    def abort(self, upload_id: str) -> None:
+        self._discard(self._load(upload_id))
+
+
+resumable_uploads = ResumableUploads(
+    UPLOADS_DIR,
+    max_bytes=settings.UPLOAD_MAX_TRACK_BYTES,
+    max_reserved_bytes=settings.UPLOAD_RESUMABLE_MAX_RESERVED_BYTES,
+    ttl_seconds=settings.UPLOAD_RESUMABLE_TTL_HOURS * 3600,
+    chunk_size=settings.UPLOAD_CHUNK_SIZE,
+)
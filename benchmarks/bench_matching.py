@@ -0,0 +1,318 @@
+"""
+Воспроизводимый бенчмарк конвейера сопоставления.
+
+Синтезирует каталог из N дорожек, индексирует его в SQLite (или в память),
+затем прогоняет зашумлённые фрагменты через те же стадии, что и /match/audio,
+и печатает JSON с перцентилями задержек по стадиям, пропускной способностью,
+памятью и долей попаданий.
+
+Запуск из корня репозитория:
+
+    python -m benchmarks.bench_matching --tracks 20 --clips 100 --out bench.json
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+import numpy as np
+import soundfile as sf
+from sqlalchemy import create_engine, func, insert, select
+from sqlalchemy.pool import StaticPool
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.models import Base, Movie, AudioTrack, AudioFingerprint  # noqa: E402
+from app.utils import matching  # noqa: E402
+from app.utils.hash_stats import count_track_hashes, prune_hashes  # noqa: E402
+from app.utils.pcm_cache import PcmCache  # noqa: E402
+from app.utils.profiles import PROFILES, DEFAULT_PROFILE_VERSION  # noqa: E402
+from benchmarks.synthetic import SAMPLE_RATE, synth_track, make_clip  # noqa: E402
+
+OFFSET_TOLERANCE = 0.1  # допуск попадания по смещению (сек)
+
+
+class StageTimer:
+    """
+    Копит длительности стадий (мс) и считает по ним перцентили.
+    """
+
+    def __init__(self):
+        self.samples = defaultdict(list)
+
+    @contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.samples[name].append((time.perf_counter() - started) * 1000)
+
+    def summary(self):
+        result = {}
+        for name, values in self.samples.items():
+            arr = np.asarray(values)
+            result[name] = {
+                "count": int(arr.size),
+                "mean_ms": round(float(arr.mean()), 3),
+                "p50_ms": round(float(np.percentile(arr, 50)), 3),
+                "p95_ms": round(float(np.percentile(arr, 95)), 3),
+                "p99_ms": round(float(np.percentile(arr, 99)), 3),
+                "max_ms": round(float(arr.max()), 3),
+            }
+        return result
+
+
+class SqlStore:
+    """
+    Хранилище отпечатков в SQLite со схемой приложения.
+    """
+
+    def __init__(self, path):
+        url = f"sqlite:///{path}" if path else "sqlite://"
+        self.engine = create_engine(url, poolclass=StaticPool, connect_args={"check_same_thread": False})
+        Base.metadata.create_all(self.engine)
+        self.conn = self.engine.connect()
+        self.profiles = {}
+
+    def add_track(self, title, track_path, duration, hashes, profile):
+        movie_id = self.conn.execute(insert(Movie).values(title=title)).inserted_primary_key[0]
+        track_id = self.conn.execute(
+            insert(AudioTrack).values(movie_id=movie_id, language="xx", track_path=track_path, duration=duration,
+                                      fingerprint_profile=profile)
+        ).inserted_primary_key[0]
+        self.profiles[track_id] = profile
+        if hashes:
+            self.conn.execute(
+                insert(AudioFingerprint),
+                [{"audio_track_id": track_id, "hash": h, "offset": t1, "profile": profile} for h, t1 in hashes],
+            )
+        self.conn.commit()
+        return track_id
+
+    def lookup(self, track_id, hashes):
+        return self.conn.execute(matching.fingerprint_query(track_id, hashes, self.profiles[track_id])).all()
+
+    def row_count(self):
+        return self.conn.execute(select(func.count()).select_from(AudioFingerprint)).scalar()
+
+
+class MemoryStore:
+    """
+    Хранилище отпечатков в словарях: нижняя граница стоимости поиска.
+    """
+
+    def __init__(self):
+        self.tracks = {}
+
+    def add_track(self, title, track_path, duration, hashes, profile):
+        track_id = len(self.tracks) + 1
+        index = defaultdict(list)
+        for h, t1 in hashes:
+            index[h].append(t1)
+        self.tracks[track_id] = index
+        return track_id
+
+    def lookup(self, track_id, hashes):
+        index = self.tracks[track_id]
+        return [(h, off) for h in hashes for off in index.get(h, ())]
+
+    def row_count(self):
+        return sum(len(v) for index in self.tracks.values() for v in index.values())
+
+
+def _git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def _peak_rss_mb():
+    # ru_maxrss в Linux — в килобайтах, в macOS — в байтах
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def ingest(args, store, pcm_cache, workdir, timer):
+    profile = PROFILES[args.profile]
+    tracks = []
+    for i in range(args.tracks):
+        seed = args.seed * 1000 + i
+        with timer.stage("synth"):
+            y = synth_track(seed, args.track_duration)
+        track_path = os.path.join(workdir, f"track_{i}.wav")
+        sf.write(track_path, y, SAMPLE_RATE, subtype="PCM_16")
+        with timer.stage("fingerprint"):
+            _, hashes = matching.fingerprint_track(y, SAMPLE_RATE, profile)
+            hashes = prune_hashes(hashes, count_track_hashes(hashes), args.max_hash_occurrences)
+        with timer.stage("store"):
+            track_id = store.add_track(f"bench-{seed}", track_path, len(y) / SAMPLE_RATE, hashes, profile.version)
+        with timer.stage("pcm_cache"):
+            pcm_cache.build(track_id, y, SAMPLE_RATE)
+        tracks.append({"id": track_id, "path": track_path, "signal": y, "hashes": len(hashes)})
+    return tracks
+
+
+def match_clip(store, pcm_cache, track, clip, timer, profile, progressive=True, max_offsets=None):
+    """
+    Повторяет стадии match_audio для одного фрагмента.
+    """
+    sr = profile.sample_rate
+    y = clip
+    if sr != SAMPLE_RATE:
+        with timer.stage("resample"):
+            y = matching.to_profile_rate(clip, SAMPLE_RATE, profile)
+    with timer.stage("bandpass"):
+        y = matching.apply_bandpass(y, sr, profile.query)
+    with timer.stage("peaks"):
+        peaks, freqs, amplitudes = matching.fragment_peaks(y, sr, profile.query)
+    with timer.stage("hashing"):
+        hashes = matching.fragment_hashes(peaks, freqs, anchor_amplitudes=amplitudes, params=profile.query)
+    if len(hashes) < matching.MIN_FRAGMENT_HASHES:
+        return None, len(hashes)
+    voter = matching.ProgressiveVoter(hashes, first_round=200 if progressive else len(hashes),
+                                      max_offsets=max_offsets)
+    rows = queried = found_hashes = 0
+    while (missing := voter.next_round()) is not None:
+        found = []
+        if missing:
+            with timer.stage("lookup"):
+                found = store.lookup(track["id"], missing)
+        rows += len(found)
+        queried += len(missing)
+        found_hashes += len({h for h, _ in found})
+        with timer.stage("voting"):
+            voter.add(found)
+    counts = voter.counts
+    if not counts:
+        return None, len(hashes)
+    offset, score, _ = matching.pick_best_offset(counts, voter.used)
+    refined = offset
+    with timer.stage("refinement"):
+        try:
+            refined, _ = matching.refine_offset(clip, SAMPLE_RATE, pcm_cache.get(track["id"]), offset)
+        except Exception:
+            pass
+    return {"raw_offset": float(offset), "refined_offset": float(refined), "score": int(score),
+            "rows": rows, "queried": queried, "found": found_hashes,
+            "hashes_used": voter.used, "rounds": voter.rounds}, len(hashes)
+
+
+def run(args):
+    logging.getLogger().setLevel(logging.WARNING)
+    for name in ("app.utils.peaks", "app.utils.fingerprinting"):
+        logging.getLogger(name).setLevel(logging.WARNING)
+
+    with tempfile.TemporaryDirectory(prefix="vmm-bench-") as workdir:
+        store = MemoryStore() if args.store == "memory" else SqlStore(
+            os.path.join(workdir, "bench.db") if args.store == "sqlite-file" else None
+        )
+
+        ingest_timer = StageTimer()
+        started = time.perf_counter()
+        pcm_cache = PcmCache(os.path.join(workdir, "pcm"))
+        tracks = ingest(args, store, pcm_cache, workdir, ingest_timer)
+        ingest_seconds = time.perf_counter() - started
+
+        rng = np.random.default_rng(args.seed)
+        match_timer = StageTimer()
+        raw_hits = refined_hits = matched = 0
+        hash_counts, row_counts, used_counts, round_counts = [], [], [], []
+        queried_total = found_total = 0
+        started = time.perf_counter()
+        for _ in range(args.clips):
+            track = tracks[int(rng.integers(0, len(tracks)))]
+            clip, true_offset = make_clip(track["signal"], rng, args.clip_duration, args.snr_db)
+            with match_timer.stage("total"):
+                result, n_hashes = match_clip(store, pcm_cache, track, clip, match_timer, PROFILES[args.profile],
+                                              args.progressive, args.max_offsets_per_hash)
+            hash_counts.append(n_hashes)
+            if result is None:
+                continue
+            matched += 1
+            row_counts.append(result["rows"])
+            used_counts.append(result["hashes_used"])
+            round_counts.append(result["rounds"])
+            queried_total += result["queried"]
+            found_total += result["found"]
+            raw_hits += abs(result["raw_offset"] - true_offset) <= OFFSET_TOLERANCE
+            refined_hits += abs(result["refined_offset"] - true_offset) <= OFFSET_TOLERANCE
+        match_seconds = time.perf_counter() - started
+
+        report = {
+            "benchmark": "matching",
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "git_revision": _git_revision(),
+            "environment": {"python": platform.python_version(), "numpy": np.__version__,
+                            "machine": platform.machine()},
+            "config": {k: v for k, v in vars(args).items() if k != "out"},
+            "ingest": {
+                "seconds": round(ingest_seconds, 3),
+                "tracks_per_second": round(len(tracks) / ingest_seconds, 3),
+                "hashes_per_track_mean": round(float(np.mean([t["hashes"] for t in tracks])), 1),
+                "stored_rows": int(store.row_count()),
+                "stages": ingest_timer.summary(),
+            },
+            "match": {
+                "seconds": round(match_seconds, 3),
+                "clips_per_second": round(args.clips / match_seconds, 3),
+                "hit_rate_raw": round(raw_hits / args.clips, 4),
+                "hit_rate_refined": round(refined_hits / args.clips, 4),
+                "matched_fraction": round(matched / args.clips, 4),
+                "query_hashes_mean": round(float(np.mean(hash_counts)), 1) if hash_counts else 0,
+                "lookup_hit_rate": round(found_total / queried_total, 4) if queried_total else 0,
+                "rows_per_clip_mean": round(float(np.mean(row_counts)), 1) if row_counts else 0,
+                "hashes_used_mean": round(float(np.mean(used_counts)), 1) if used_counts else 0,
+                "rounds_mean": round(float(np.mean(round_counts)), 2) if round_counts else 0,
+                "stages": match_timer.summary(),
+            },
+            "memory": {"peak_rss_mb": _peak_rss_mb()},
+        }
+    return report
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Бенчмарк сопоставления на синтетическом каталоге")
+    parser.add_argument("--tracks", type=int, default=10, help="число дорожек в каталоге")
+    parser.add_argument("--track-duration", type=float, default=120.0, help="длительность дорожки (сек)")
+    parser.add_argument("--clips", type=int, default=50, help="число фрагментов для поиска")
+    parser.add_argument("--clip-duration", type=float, default=8.0, help="длительность фрагмента (сек)")
+    parser.add_argument("--snr-db", type=float, default=10.0, help="отношение сигнал/шум фрагмента (дБ)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--store", choices=["sqlite", "sqlite-file", "memory"], default="sqlite")
+    parser.add_argument("--progressive", action=argparse.BooleanOptionalAction, default=True,
+                        help="голосование раундами с ранней остановкой, как в /match/audio")
+    parser.add_argument("--max-hash-occurrences", type=int, default=30,
+                        help="порог повторов хеша в дорожке при индексации")
+    parser.add_argument("--max-offsets-per-hash", type=int, default=30,
+                        help="хеш с большим числом смещений не голосует")
+    parser.add_argument("--profile", type=int, choices=sorted(PROFILES), default=DEFAULT_PROFILE_VERSION,
+                        help="версия профиля отпечатков (app/utils/profiles.py)")
+    parser.add_argument("--out", help="путь к JSON-отчёту (по умолчанию stdout)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    report = run(args)
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
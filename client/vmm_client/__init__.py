@@ -0,0 +1,11 @@
+"""
+Клиент Voice Movie Matcher: строит хеши фрагмента тем же конвейером, что и сервер,
+и сопоставляет их через /match/hashes.
+
+    from vmm_client import MatchClient
+    MatchClient("http://127.0.0.1:8000").match_file("clip.mp4", movie_id=1, language="ru")
+"""
+from vmm_client.client import MatchClient, MatchError
+from vmm_client.fingerprint import fingerprint_file, fingerprint_signal
+
+__all__ = ["MatchClient", "MatchError", "fingerprint_file", "fingerprint_signal"]
@@ -0,0 +1,29 @@
+import argparse
+import json
+import sys
+
+from vmm_client.client import MatchClient, MatchError
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Сопоставление фрагмента по хешам, построенным локально")
+    parser.add_argument("path", help="аудио- или видеофрагмент")
+    parser.add_argument("--url", default="http://127.0.0.1:8000", help="адрес сервера")
+    parser.add_argument("--movie-id", type=int, required=True)
+    parser.add_argument("--language", required=True)
+    parser.add_argument("--offset-hint", type=float, help="ожидаемое смещение (сек)")
+    parser.add_argument("--window", type=float, help="окно поиска вокруг --offset-hint (сек)")
+    args = parser.parse_args(argv)
+
+    try:
+        result = MatchClient(args.url).match_file(
+            args.path, args.movie_id, args.language, args.offset_hint, args.window
+        )
+    except MatchError as e:
+        print(e, file=sys.stderr)
+        sys.exit(1)
+    print(json.dumps(result, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1 @@
+../../../app/utils/fingerprinting.py
\ No newline at end of file
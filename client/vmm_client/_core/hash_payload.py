@@ -0,0 +1 @@
+../../../app/utils/hash_payload.py
\ No newline at end of file
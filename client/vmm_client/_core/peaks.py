@@ -0,0 +1 @@
+../../../app/utils/peaks.py
\ No newline at end of file
@@ -0,0 +1 @@
+../../../app/utils/pipeline.py
\ No newline at end of file
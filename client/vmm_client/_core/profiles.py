@@ -0,0 +1 @@
+../../../app/utils/profiles.py
\ No newline at end of file
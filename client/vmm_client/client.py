@@ -0,0 +1,78 @@
+import json
+import urllib.error
+import urllib.parse
+import urllib.request
+
+from vmm_client._core.hash_payload import CONTENT_TYPE
+from vmm_client.fingerprint import fingerprint_file
+
+
+class MatchError(Exception):
+    """Сервер отклонил запрос сопоставления."""
+
+    def __init__(self, status: int, detail):
+        super().__init__(f"HTTP {status}: {detail}")
+        self.status = status
+        self.detail = detail
+
+
+class MatchClient:
+    """
+    Клиент /match/hashes: фрагмент хешируется локально, на сервер уходят только хеши.
+
+    Args:
+        base_url (str): Адрес сервера, например "http://127.0.0.1:8000".
+        timeout (float): Таймаут HTTP-запроса (сек).
+    """
+
+    def __init__(self, base_url: str, timeout: float = 30.0):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+
+    def profile(self, movie_id: int, language: str) -> dict:
+        """
+        Профиль отпечатков дорожки (GET /match/profile).
+        """
+        return self._request("GET", "/match/profile", {"movie_id": movie_id, "language": language})
+
+    def match_payload(self, payload: bytes, movie_id: int, language: str,
+                      offset_hint: float | None = None, window: float | None = None) -> dict:
+        """
+        Отправляет готовый пакет хешей (POST /match/hashes).
+
+        offset_hint и window ограничивают поиск участком дорожки вокруг ожидаемого смещения.
+        """
+        params = {"movie_id": movie_id, "language": language}
+        if offset_hint is not None:
+            params["offset_hint"] = offset_hint
+        if window is not None:
+            params["window"] = window
+        return self._request("POST", "/match/hashes", params, payload)
+
+    def match_file(self, path: str, movie_id: int, language: str,
+                   offset_hint: float | None = None, window: float | None = None) -> dict:
+        """
+        Хеширует файл профилем дорожки и сопоставляет его.
+
+        Returns:
+            dict: Ответ сервера (audio_track и match, как у /match/audio).
+
+        Raises:
+            MatchError: Сервер вернул ошибку.
+        """
+        profile_version = self.profile(movie_id, language)["fingerprint_profile"]
+        return self.match_payload(fingerprint_file(path, profile_version), movie_id, language, offset_hint, window)
+
+    def _request(self, method: str, path: str, params: dict, body: bytes | None = None) -> dict:
+        url = f"{self.base_url}{path}?{urllib.parse.urlencode(params)}"
+        headers = {"Content-Type": CONTENT_TYPE} if body is not None else {}
+        request = urllib.request.Request(url, data=body, method=method, headers=headers)
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            try:
+                detail = json.loads(e.read()).get("detail")
+            except ValueError:
+                detail = e.reason
+            raise MatchError(e.code, detail) from None
@@ -0,0 +1,35 @@
+import librosa
+
+from vmm_client._core.hash_payload import encode_hashes
+from vmm_client._core.pipeline import compute_fragment_hashes
+from vmm_client._core.profiles import get_profile
+
+
+def fingerprint_signal(y, sr: int, profile_version: int) -> bytes:
+    """
+    Строит хеши фрагмента профилем дорожки и упаковывает их для /match/hashes.
+
+    Args:
+        y (np.ndarray): Моно-сигнал фрагмента.
+        sr (int): Частота дискретизации (Гц).
+        profile_version (int): Версия профиля дорожки (GET /match/profile).
+
+    Returns:
+        bytes: Бинарный пакет хешей.
+    """
+    hashes = compute_fragment_hashes(y, sr, get_profile(profile_version))
+    return encode_hashes(hashes, profile_version, len(y) / sr)
+
+
+def fingerprint_file(path: str, profile_version: int) -> bytes:
+    """
+    Декодирует аудио- или видеофайл и строит пакет хешей (см. fingerprint_signal).
+
+    Частота, кратная частоте профиля, понижается так же, как на сервере (resample_poly),
+    остальные приводятся к частоте профиля средствами librosa.
+    """
+    sample_rate = get_profile(profile_version).sample_rate
+    y, sr = librosa.load(path, sr=None, mono=True)
+    if sr % sample_rate:
+        y, sr = librosa.resample(y, orig_sr=sr, target_sr=sample_rate), sample_rate
+    return fingerprint_signal(y, sr, profile_version)